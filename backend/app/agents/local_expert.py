@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import asyncio
 import os
 import re
 import math
@@ -499,13 +500,15 @@ class LocalExpertAgent:
     def __init__(self):
         self.name       = "GeoInsight AI Agent"
         self.use_gemini = GEMINI_AVAILABLE
+        self._model     = genai.GenerativeModel('gemini-2.5-flash') if GEMINI_AVAILABLE else None
 
     async def _gemini(self, prompt: str) -> Optional[str]:
         if not self.use_gemini:
             return None
         try:
-            model    = genai.GenerativeModel('gemini-2.5-flash')
-            response = model.generate_content(prompt)
+            # generate_content blocks for the whole round-trip; running it in a
+            # thread keeps the event loop serving other requests meanwhile.
+            response = await asyncio.to_thread(self._model.generate_content, prompt)
             return response.text
         except Exception as e:
             print(f"[Gemini error] {e}")
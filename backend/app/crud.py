@@ -1,13 +1,17 @@
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 from pydantic import BaseModel
 from bson import ObjectId
+from pymongo.collation import Collation
 from datetime import datetime
+import asyncio
 import logging
 
 from .database import get_database, get_sync_database
 
 logger = logging.getLogger(__name__)
 
+CASE_INSENSITIVE = Collation(locale="en", strength=2)
+
 
 def document_to_dict(doc: Dict) -> Dict:
     if doc and "_id" in doc:
@@ -20,21 +24,50 @@ class PropertyCRUD:
     def __init__(self):
         self.collection_name = "properties"
 
-    async def get_all_properties(self, skip: int = 0, limit: int = 100) -> List[Dict[str, Any]]:
+    async def get_all_properties(
+        self, skip: int = 0, limit: int = 100, city: Optional[str] = None,
+        fields: Optional[List[str]] = None,
+        property_type: Optional[str] = None,
+        bedrooms: Optional[int] = None,
+        price_min: Optional[float] = None,
+        price_max: Optional[float] = None,
+        after: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
         try:
             db = await get_database()
-            logger.debug(f"Fetching properties: skip={skip}, limit={limit}")
-
-            count = await db[self.collection_name].count_documents({})
-            if count == 0:
-                logger.warning("No properties found in database")
-                return []
+            logger.debug(f"Fetching properties: skip={skip}, limit={limit}, city={city}, after={after}")
+
+            query: Dict[str, Any] = {}
+            if city:
+                query["city"] = city.strip()
+            if property_type:
+                query["property_type"] = property_type.strip()
+            if bedrooms is not None:
+                query["bedrooms"] = bedrooms
+            if price_min is not None or price_max is not None:
+                query["price"] = {}
+                if price_min is not None:
+                    query["price"]["$gte"] = price_min
+                if price_max is not None:
+                    query["price"]["$lte"] = price_max
+            # Keyset pagination: the next page starts after the last _id seen.
+            if after and ObjectId.is_valid(after):
+                query["_id"] = {"$gt": ObjectId(after)}
+
+            projection = {f: 1 for f in fields} if fields else None
+            # Text filters match case-insensitively (and use the "city_ci" index).
+            collation = CASE_INSENSITIVE if (city or property_type) else None
+            cursor = db[self.collection_name].find(query, projection, collation=collation)
+            cursor = cursor.sort("_id", 1).skip(skip).limit(limit)
 
-            cursor = db[self.collection_name].find().skip(skip).limit(limit)
             properties = []
             async for doc in cursor:
                 properties.append(document_to_dict(doc))
 
+            if not properties:
+                logger.warning("No properties found in database")
+                return []
+
             logger.info(f"Retrieved {len(properties)} properties")
             return properties
 
@@ -42,6 +75,64 @@ class PropertyCRUD:
             logger.error(f"Error getting properties: {e}", exc_info=True)
             return []
 
+    async def get_property_facets(self) -> Dict[str, Any]:
+        try:
+            db = await get_database()
+            coll = db[self.collection_name]
+            cities, types, bedrooms, totals = await asyncio.gather(
+                coll.distinct("city"),
+                coll.distinct("property_type"),
+                coll.distinct("bedrooms"),
+                coll.aggregate([{"$group": {
+                    "_id": None,
+                    "total": {"$sum": 1},
+                    "avg_price": {"$avg": "$price"},
+                    "avg_square_feet": {"$avg": "$square_feet"},
+                    "min_price": {"$min": "$price"},
+                    "max_price": {"$max": "$price"},
+                }}]).to_list(1),
+            )
+            summary = totals[0] if totals else {}
+            summary.pop("_id", None)
+            return {
+                "cities": sorted({str(c).strip() for c in cities if c}),
+                "property_types": sorted({str(t).strip() for t in types if t}),
+                "bedrooms": sorted({int(b) for b in bedrooms if isinstance(b, (int, float)) and b > 0}),
+                "total": summary.get("total", 0),
+                "avg_price": summary.get("avg_price"),
+                "avg_square_feet": summary.get("avg_square_feet"),
+                "min_price": summary.get("min_price"),
+                "max_price": summary.get("max_price"),
+            }
+        except Exception as e:
+            logger.error(f"Error getting property facets: {e}", exc_info=True)
+            return {"cities": [], "property_types": [], "bedrooms": [], "total": 0}
+
+    async def get_all_property_ids(self, limit: int = 100) -> List[str]:
+        try:
+            db = await get_database()
+            cursor = db[self.collection_name].find({}, {"_id": 1}).limit(limit)
+            return [str(doc["_id"]) async for doc in cursor]
+        except Exception as e:
+            logger.error(f"Error getting property ids: {e}", exc_info=True)
+            return []
+
+    async def get_properties_by_ids(self, property_ids: List[str]) -> List[Dict[str, Any]]:
+        try:
+            db = await get_database()
+            object_ids = [ObjectId(i) for i in property_ids if ObjectId.is_valid(i)]
+            cursor = db[self.collection_name].find(
+                {"$or": [{"_id": {"$in": object_ids}}, {"id": {"$in": property_ids}}]}
+            )
+            found = {}
+            async for doc in cursor:
+                doc = document_to_dict(doc)
+                found[doc["id"]] = doc
+            return [found[i] for i in property_ids if i in found]
+        except Exception as e:
+            logger.error(f"Error getting properties {property_ids}: {e}", exc_info=True)
+            return []
+
     async def get_property_by_id(self, property_id: str) -> Optional[Dict[str, Any]]:
         try:
             db = await get_database()
@@ -59,8 +150,7 @@ class PropertyCRUD:
         try:
             db = await get_database()
             property_dict = property_data.dict()
-            property_dict["created_at"] = datetime.now()
-            property_dict["updated_at"] = datetime.now()
+            property_dict["created_at"] = property_dict["updated_at"] = datetime.now()
             result = await db[self.collection_name].insert_one(property_dict)
             created_doc = await db[self.collection_name].find_one({"_id": result.inserted_id})
             logger.info(f"Created property: {result.inserted_id}")
@@ -113,12 +203,21 @@ property_crud = PropertyCRUD()
 
 NEIGHBORHOOD_ANALYSIS_COLLECTION = "neighborhood_analyses"
 
+# List views only need the precomputed counts, not the amenity/building blobs.
+RECENT_ANALYSIS_PROJECTION = {"amenities": 0, "building_footprints": 0}
+
+# Documents written before amenity_categories existed get it derived from the
+# amenities map on the server, so the map itself is still never sent.
+RECENT_ANALYSIS_CATEGORIES = {"$ifNull": [
+    "$amenity_categories",
+    {"$size": {"$objectToArray": {"$ifNull": ["$amenities", {}]}}},
+]}
+
 
 async def create_neighborhood_analysis(analysis_data: Dict[str, Any]) -> str:
     try:
         db = await get_database()
-        analysis_data["created_at"] = datetime.now()
-        analysis_data["updated_at"] = datetime.now()
+        analysis_data["created_at"] = analysis_data["updated_at"] = datetime.now()
         analysis_data["status"] = analysis_data.get("status", "processing")
         result = await db[NEIGHBORHOOD_ANALYSIS_COLLECTION].insert_one(analysis_data)
         print(f"Created neighbourhood analysis: {result.inserted_id}")
@@ -128,6 +227,35 @@ async def create_neighborhood_analysis(analysis_data: Dict[str, Any]) -> str:
         raise
 
 
+async def create_neighborhood_analyses(analyses: List[Dict[str, Any]]) -> List[str]:
+    try:
+        db = await get_database()
+        now = datetime.now()
+        for analysis_data in analyses:
+            analysis_data["created_at"] = analysis_data["updated_at"] = now
+            analysis_data["status"] = analysis_data.get("status", "processing")
+        result = await db[NEIGHBORHOOD_ANALYSIS_COLLECTION].insert_many(analyses)
+        print(f"Created {len(result.inserted_ids)} neighbourhood analyses")
+        return [str(i) for i in result.inserted_ids]
+    except Exception as e:
+        print(f"Error creating neighbourhood analyses: {e}")
+        raise
+
+
+async def find_reusable_analysis(request_key: str, since: datetime) -> Optional[str]:
+    try:
+        db = await get_database()
+        doc = await db[NEIGHBORHOOD_ANALYSIS_COLLECTION].find_one(
+            {"request_key": request_key, "status": "completed", "created_at": {"$gte": since}},
+            {"_id": 1},
+            sort=[("created_at", -1)],
+        )
+        return str(doc["_id"]) if doc else None
+    except Exception as e:
+        print(f"Error looking up reusable analysis: {e}")
+        return None
+
+
 async def get_neighborhood_analysis(analysis_id: str) -> Optional[Dict]:
     try:
         db = await get_database()
@@ -142,10 +270,30 @@ async def get_neighborhood_analysis(analysis_id: str) -> Optional[Dict]:
         return None
 
 
+async def get_analysis_fields(analysis_id: str, fields: Tuple[str, ...]) -> Optional[Dict]:
+    try:
+        db = await get_database()
+        projection = {f: 1 for f in fields}
+        try:
+            obj_id = ObjectId(analysis_id)
+            doc = await db[NEIGHBORHOOD_ANALYSIS_COLLECTION].find_one({"_id": obj_id}, projection)
+        except Exception:
+            doc = await db[NEIGHBORHOOD_ANALYSIS_COLLECTION].find_one({"_id": analysis_id}, projection)
+        return document_to_dict(doc) if doc else None
+    except Exception as e:
+        print(f"Error getting neighbourhood analysis fields: {e}")
+        return None
+
+
 async def get_recent_analyses(limit: int = 10) -> List[Dict]:
     try:
         db = await get_database()
-        cursor = db[NEIGHBORHOOD_ANALYSIS_COLLECTION].find().sort("created_at", -1).limit(limit)
+        cursor = db[NEIGHBORHOOD_ANALYSIS_COLLECTION].aggregate([
+            {"$sort": {"created_at": -1}},
+            {"$limit": limit},
+            {"$addFields": {"amenity_categories": RECENT_ANALYSIS_CATEGORIES}},
+            {"$project": RECENT_ANALYSIS_PROJECTION},
+        ])
         analyses = []
         async for doc in cursor:
             analyses.append(document_to_dict(doc))
@@ -198,8 +346,7 @@ SATELLITE_ANALYSIS_COLLECTION = "satellite_analyses"
 
 async def create_satellite_analysis(analysis_data: Dict) -> str:
     db = await get_database()
-    analysis_data["created_at"] = datetime.now()
-    analysis_data["updated_at"] = datetime.now()
+    analysis_data["created_at"] = analysis_data["updated_at"] = datetime.now()
     result = await db[SATELLITE_ANALYSIS_COLLECTION].insert_one(analysis_data)
     return str(result.inserted_id)
 
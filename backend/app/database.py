@@ -1,7 +1,11 @@
 import os
 import ssl
+from datetime import datetime
+from typing import Dict, Optional
+from bson import ObjectId
 from motor.motor_asyncio import AsyncIOMotorClient
 from pymongo import MongoClient
+from pymongo.collation import Collation
 from dotenv import find_dotenv, load_dotenv
 import asyncio
 import logging
@@ -126,6 +130,64 @@ def get_sync_database():
         raise
 
 
+_shared_sync_db = None
+
+
+def get_shared_sync_database():
+    # One lazily created, pooled PyMongo handle per process, used by Celery
+    # tasks and synchronous lookups (e.g. the geocode cache). Unlike
+    # get_sync_database() it is never closed by the caller.
+    global _shared_sync_db
+    if _shared_sync_db is None:
+        MONGODB_URL   = os.getenv("MONGODB_URL", "mongodb://localhost:27017")
+        DATABASE_NAME = os.getenv("DATABASE_NAME", "geoinsight_ai")
+        client = MongoClient(MONGODB_URL, maxPoolSize=50, **_pymongo_kwargs())
+        _shared_sync_db = client[DATABASE_NAME]
+    return _shared_sync_db
+
+
+def reset_shared_sync_database():
+    # PyMongo clients are not fork-safe: a forked worker must drop any
+    # handle inherited from its parent and open its own.
+    global _shared_sync_db
+    _shared_sync_db = None
+
+
+def update_analysis_status_sync(
+    collection, analysis_id: str, status: str, updates: Optional[Dict] = None
+):
+    try:
+        update_data = {
+            "status": status,
+            "updated_at": datetime.now()
+        }
+        if updates:
+            update_data.update(updates)
+
+        key = ObjectId(analysis_id) if ObjectId.is_valid(analysis_id) else analysis_id
+        result = collection.update_one({"_id": key}, {"$set": update_data})
+
+        if result.modified_count > 0:
+            logger.info("Updated analysis %s to status: %s", analysis_id, status)
+        else:
+            logger.warning("No documents updated for analysis ID: %s", analysis_id)
+
+    except Exception as e:
+        logger.error("Error updating analysis status: %s", e)
+
+
+def analysis_finished_sync(collection, analysis_id: str) -> bool:
+    # Tasks ack late, so a worker lost after finishing can have its message
+    # redelivered; the orchestrating tasks check this before redoing the work.
+    try:
+        key = ObjectId(analysis_id) if ObjectId.is_valid(analysis_id) else analysis_id
+        doc = collection.find_one({"_id": key}, {"status": 1})
+        return bool(doc) and doc.get("status") in ("completed", "failed")
+    except Exception as e:
+        logger.error("Error reading analysis status: %s", e)
+        return False
+
+
 async def initialize_database():
     try:
         db = await get_database()
@@ -144,10 +206,22 @@ async def initialize_database():
 
         await db.properties.create_index("address")
         await db.properties.create_index("city")
+        await db.properties.create_index(
+            "city", name="city_ci", collation=Collation(locale="en", strength=2)
+        )
         await db.properties.create_index([("latitude", 1), ("longitude", 1)])
 
+        await db.properties.create_index("id", sparse=True)
+
+        # Compound indexes serve the cleanup/archive deletes in
+        # maintenance_tasks and still cover plain status lookups by prefix.
         await db.neighborhood_analyses.create_index("created_at")
-        await db.neighborhood_analyses.create_index("status")
+        await db.neighborhood_analyses.create_index([("status", 1), ("created_at", -1)])
+        await db.neighborhood_analyses.create_index([("status", 1), ("completed_at", -1)])
+        await db.neighborhood_analyses.create_index(
+            [("request_key", 1), ("status", 1), ("created_at", -1)], sparse=True
+        )
+        await db.satellite_analyses.create_index([("status", 1), ("created_at", -1)])
 
         logger.info("Database initialized")
 
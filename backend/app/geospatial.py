@@ -2,17 +2,18 @@ import random
 import osmnx as ox
 import networkx as nx
 from geopy.geocoders import Nominatim
-from geopy.distance import geodesic
 from typing import Dict, List, Optional, Tuple
 import folium
 from datetime import datetime
 import time
 import math
+import numpy as np
 import requests
 from PIL import Image
 import io
 import tempfile
 import os
+import hashlib
 
 
 ox.settings.log_console = True
@@ -28,6 +29,18 @@ _OVERPASS_ENDPOINTS = [
     "https://maps.mail.ru/osm/tools/overpass/api/interpreter",
 ]
 
+_EARTH_RADIUS_KM = 6371.0088
+
+
+def _haversine_km(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    lat1 = math.radians(lat)
+    lat2 = np.radians(lats)
+    dlat = lat2 - lat1
+    dlon = np.radians(lons) - math.radians(lon)
+    a = np.sin(dlat / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return 2 * _EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
 def _configure_overpass():
     endpoint = random.choice(_OVERPASS_ENDPOINTS)
     try:
@@ -58,6 +71,54 @@ KNOWN_COORDINATES = {
 }
 
 
+# Mongo-backed caches for geocoding and amenity lookups. A hit replaces a
+# Nominatim/Overpass round-trip with one _id lookup; entries expire via TTL.
+GEOCODE_CACHE_TTL_S = 30 * 86400
+AMENITY_CACHE_TTL_S = 7 * 86400
+_CACHE_RETRY_S = 60
+
+_cache_collections = {}
+_cache_retry_at = 0.0
+
+
+def _cache_collection(name: str, ttl_s: int):
+    global _cache_retry_at
+    coll = _cache_collections.get(name)
+    if coll is not None or time.time() < _cache_retry_at:
+        return coll
+    try:
+        from .database import get_shared_sync_database
+        coll = get_shared_sync_database()[name]
+        coll.create_index("ts", expireAfterSeconds=ttl_s)
+        _cache_collections[name] = coll
+        return coll
+    except Exception as e:
+        print(f"Lookup cache unavailable ({name}): {e}")
+        _cache_retry_at = time.time() + _CACHE_RETRY_S
+        return None
+
+
+def _cache_get(name: str, ttl_s: int, key: str) -> Optional[Dict]:
+    coll = _cache_collection(name, ttl_s)
+    if coll is None:
+        return None
+    try:
+        return coll.find_one({"_id": key})
+    except Exception as e:
+        print(f"Cache read failed ({name}): {e}")
+        return None
+
+
+def _cache_put(name: str, ttl_s: int, key: str, doc: Dict) -> None:
+    coll = _cache_collection(name, ttl_s)
+    if coll is None:
+        return
+    try:
+        coll.replace_one({"_id": key}, {**doc, "ts": datetime.now()}, upsert=True)
+    except Exception as e:
+        print(f"Cache write failed ({name}): {e}")
+
+
 class LocationGeocoder:
     def __init__(self, user_agent: str = "geo_insight_ai"):
         self.geolocator = Nominatim(user_agent=user_agent, timeout=10)
@@ -83,6 +144,12 @@ class LocationGeocoder:
             print(f"Cached coordinates for: {address_stripped}")
             return KNOWN_COORDINATES[address_lower]
 
+        cache_key = hashlib.sha1(address_lower.encode("utf-8")).hexdigest()
+        cached = _cache_get("geocode_cache", GEOCODE_CACHE_TTL_S, cache_key)
+        if cached:
+            print(f"Cached coordinates for: {address_stripped}")
+            return (cached["lat"], cached["lon"])
+
         parts = [p.strip() for p in address_stripped.split(",") if p.strip()]
         candidates = []
         for i in range(len(parts)):
@@ -99,6 +166,8 @@ class LocationGeocoder:
                         print(f"Geocoded '{address_stripped}' via fallback (stripped {idx} component(s) → '{query}'): {coords}")
                     else:
                         print(f"Geocoded '{address_stripped}': {coords}")
+                    _cache_put("geocode_cache", GEOCODE_CACHE_TTL_S, cache_key,
+                               {"lat": coords[0], "lon": coords[1]})
                     return coords
                 else:
                     print(f"Nominatim returned nothing for: '{query}' (attempt {idx+1})")
@@ -136,6 +205,34 @@ class OpenStreetMapClient:
         max_results_per_type: int = None
     ) -> Dict:
 
+        try:
+            geocoder = get_geocoder()
+            coordinates = geocoder.address_to_coordinates(address)
+        except Exception as e:
+            return {
+                "error": f"Failed to get amenities: {str(e)}",
+                "address": address
+            }
+
+        if not coordinates:
+            return {
+                "error": "Could not geocode address",
+                "address": address
+            }
+
+        return self.query_amenities(
+            address, coordinates, radius, amenity_types, max_results_per_type
+        )
+
+    def query_amenities(
+        self,
+        address: str,
+        coordinates: Tuple[float, float],
+        radius: float = 1000,
+        amenity_types: Optional[List[str]] = None,
+        max_results_per_type: int = None
+    ) -> Dict:
+
         if amenity_types is None:
             amenity_types = [
                 'restaurant', 'cafe', 'school', 'hospital',
@@ -160,16 +257,20 @@ class OpenStreetMapClient:
             print(f"Limiting {len(amenity_types)} amenity types to {max_amenity_types} for timeout prevention (radius: {radius}m)")
             amenity_types = amenity_types[:max_amenity_types]
 
-        try:
-            geocoder = get_geocoder()
-            coordinates = geocoder.address_to_coordinates(address)
-
-            if not coordinates:
-                return {
-                    "error": "Could not geocode address",
-                    "address": address
-                }
+        cache_key = "|".join([
+            f"{coordinates[0]:.4f}", f"{coordinates[1]:.4f}", str(radius),
+            ",".join(sorted(amenity_types)), str(max_results_per_type),
+        ])
+        cached = _cache_get("amenity_cache", AMENITY_CACHE_TTL_S, cache_key)
+        if cached:
+            print(f"Cached amenities for: {address}")
+            return {
+                **cached["result"],
+                "address": address,
+                "coordinates": coordinates,
+            }
 
+        try:
             lat, lon = coordinates
             _configure_overpass()
 
@@ -214,34 +315,36 @@ class OpenStreetMapClient:
                         )
 
                     if not amenities.empty:
-                        amenities_list = []
-
-                        for idx, row in amenities.iterrows():
-                            try:
-                                centroid = row.geometry.centroid
-                                amenity_lat = centroid.y
-                                amenity_lon = centroid.x
-                            except Exception:
-                                continue
-
-                            distance = geodesic(
-                                coordinates,
-                                (amenity_lat, amenity_lon)
-                            ).km
-
-                            amenity_info = {
-                                'name': row.get('name', f'Unknown {amenity}'),
+                        # Distances for every feature in one vectorised pass, then
+                        # only the nearest max_results_per_type become dicts.
+                        # Overpass answers the bbox from its own spatial index;
+                        # the corners outside the circle are dropped here.
+                        centroids = amenities.geometry.centroid
+                        lats = centroids.y.to_numpy(dtype=float)
+                        lons = centroids.x.to_numpy(dtype=float)
+                        distances = _haversine_km(lat, lon, lats, lons)
+
+                        valid = np.flatnonzero(distances <= radius / 1000)
+                        nearest = valid[np.argsort(distances[valid], kind='stable')]
+                        nearest = nearest[:max_results_per_type]
+
+                        names = (
+                            amenities['name'].to_numpy()
+                            if 'name' in amenities.columns else None
+                        )
+
+                        amenities_data[amenity] = [
+                            {
+                                'name': names[i] if names is not None else f'Unknown {amenity}',
                                 'type': amenity,
                                 'coordinates': {
-                                    'latitude': float(amenity_lat),
-                                    'longitude': float(amenity_lon)
+                                    'latitude': float(lats[i]),
+                                    'longitude': float(lons[i])
                                 },
-                                'distance_km': round(distance, 2)
+                                'distance_km': round(float(distances[i]), 2)
                             }
-                            amenities_list.append(amenity_info)
-
-                        amenities_list.sort(key=lambda x: x['distance_km'])
-                        amenities_data[amenity] = amenities_list[:max_results_per_type]
+                            for i in nearest
+                        ]
                     else:
                         amenities_data[amenity] = []
 
@@ -262,7 +365,7 @@ class OpenStreetMapClient:
                     errors.append(error_msg)
                     amenities_data[amenity] = []
 
-            return {
+            result = {
                 "address": address,
                 "coordinates": coordinates,
                 "search_radius_m": radius,
@@ -271,6 +374,11 @@ class OpenStreetMapClient:
                 "timestamp": datetime.now().isoformat(),
                 "timeout_count": timeout_count
             }
+            # Partial results (timeouts/errors) are not cached so a retry
+            # gets another chance at the full set.
+            if not errors:
+                _cache_put("amenity_cache", AMENITY_CACHE_TTL_S, cache_key, {"result": result})
+            return result
 
         except Exception as e:
             return {
@@ -469,6 +577,22 @@ class OpenStreetMapClient:
             traceback.print_exc()
             return None
         
+AMENITY_SAMPLE_SIZE = 10
+
+
+def summarize_amenities(
+    amenities: Dict[str, List[Dict]], sample_size: int = AMENITY_SAMPLE_SIZE
+) -> Tuple[Dict[str, int], Dict[str, List[Dict]]]:
+    # query_amenities returns each list nearest-first, so a slice is the top N.
+    counts = {k: len(v) for k, v in amenities.items() if v}
+    samples = {k: v[:sample_size] for k, v in amenities.items() if v}
+    return counts, samples
+
+
+def map_filename(analysis_id: str) -> str:
+    return f"neighborhood_{analysis_id.replace('-', '_')}.html"
+
+
 def calculate_walk_score(coordinates: Tuple[float, float], amenities_data: Dict) -> float:
     try:
         amenities = amenities_data.get("amenities", {})
@@ -561,6 +685,70 @@ def download_osm_tile(tile_x: int, tile_y: int, zoom: int, timeout: int = 5) ->
         return None
 
 
+# Rendered map areas are keyed by zoom and centre tile, so every query that
+# lands on the same tile reuses one PNG. Callers release paths with
+# discard_map_area(), which leaves cached files in place; stale ones are
+# removed by prune_tile_cache() from the maintenance task. docker-compose
+# mounts one tile_cache volume at the default TILE_CACHE_DIR in every
+# container that writes or prunes it. Partial downloads are never cached.
+TILE_CACHE_DIR = os.getenv(
+    "TILE_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".tile_cache"),
+)
+TILE_CACHE_TTL_S = 86400
+
+
+def _save_map_area(image: Image.Image, cache_path: str) -> Optional[str]:
+    try:
+        os.makedirs(TILE_CACHE_DIR, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(suffix='.png', prefix='osm_map_', dir=TILE_CACHE_DIR)
+        os.close(fd)
+        image.save(temp_path, format='PNG')
+        os.replace(temp_path, cache_path)
+        return cache_path
+    except Exception as e:
+        print(f"Failed to save map area: {e}")
+        return None
+
+
+def _save_uncached_map_area(image: Image.Image) -> Optional[str]:
+    # Private temp file; discard_map_area() deletes it after use.
+    try:
+        fd, temp_path = tempfile.mkstemp(suffix='.png', prefix='osm_map_')
+        os.close(fd)
+        image.save(temp_path, format='PNG')
+        return temp_path
+    except Exception as e:
+        print(f"Failed to save map area: {e}")
+        return None
+
+
+def discard_map_area(path: Optional[str]) -> None:
+    if not path or os.path.dirname(os.path.abspath(path)) == os.path.abspath(TILE_CACHE_DIR):
+        return
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+def prune_tile_cache(max_age_s: int = TILE_CACHE_TTL_S) -> int:
+    removed = 0
+    cutoff = time.time() - max_age_s
+    try:
+        entries = list(os.scandir(TILE_CACHE_DIR))
+    except OSError:
+        return 0
+    for entry in entries:
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.unlink(entry.path)
+                removed += 1
+        except OSError:
+            pass
+    return removed
+
+
 def get_osm_map_area(latitude: float, longitude: float, radius_meters: int = 500) -> Optional[str]:
     import time
     import logging
@@ -580,6 +768,15 @@ def get_osm_map_area(latitude: float, longitude: float, radius_meters: int = 500
     center_x, center_y = lat_lon_to_tile(latitude, longitude, zoom)
     logger.info(f"Center tile: ({center_x}, {center_y})")
 
+    grid = 1 if radius_meters <= 600 else 2
+    cache_path = os.path.join(TILE_CACHE_DIR, f"z{zoom}_{center_x}_{center_y}_{grid}.png")
+    try:
+        if time.time() - os.path.getmtime(cache_path) < TILE_CACHE_TTL_S:
+            logger.info(f"Using cached map {cache_path}")
+            return cache_path
+    except OSError:
+        pass
+
     if radius_meters <= 600:
         logger.info("Small radius - downloading 1 tile only")
 
@@ -593,17 +790,7 @@ def get_osm_map_area(latitude: float, longitude: float, radius_meters: int = 500
 
         logger.info(f"Downloaded 1 tile in {elapsed:.1f}s")
 
-        try:
-            fd, temp_path = tempfile.mkstemp(suffix='.png', prefix='osm_map_')
-            os.close(fd)
-
-            tile.save(temp_path, format='PNG')
-            logger.info(f"Saved map to {temp_path}")
-
-            return temp_path
-        except Exception as e:
-            logger.error(f"Failed to save tile: {e}")
-            return None
+        return _save_map_area(tile, cache_path)
 
     else:
         logger.info("Large radius - downloading 2x2 grid (4 tiles)")
@@ -632,17 +819,7 @@ def get_osm_map_area(latitude: float, longitude: float, radius_meters: int = 500
             logger.warning("Only got 1 tile, using it")
             tile = list(tiles.values())[0]
 
-            try:
-                fd, temp_path = tempfile.mkstemp(suffix='.png', prefix='osm_map_')
-                os.close(fd)
-
-                tile.save(temp_path, format='PNG')
-                logger.info(f"Saved map to {temp_path}")
-
-                return temp_path
-            except Exception as e:
-                logger.error(f"Failed to save tile: {e}")
-                return None
+            return _save_uncached_map_area(tile)
 
         logger.info("Stitching tiles...")
 
@@ -654,14 +831,6 @@ def get_osm_map_area(latitude: float, longitude: float, radius_meters: int = 500
             y_offset = (ty - center_y) * tile_size
             stitched.paste(tile, (x_offset, y_offset))
 
-        try:
-            fd, temp_path = tempfile.mkstemp(suffix='.png', prefix='osm_map_')
-            os.close(fd)
-
-            stitched.save(temp_path, format='PNG')
-            logger.info(f"Saved stitched map to {temp_path}")
-
-            return temp_path
-        except Exception as e:
-            logger.error(f"Failed to save stitched image: {e}")
-            return None
\ No newline at end of file
+        if len(tiles) < 4:
+            return _save_uncached_map_area(stitched)
+        return _save_map_area(stitched, cache_path)
\ No newline at end of file
@@ -55,7 +55,7 @@ except ImportError:
 
 WORKFLOW_ENABLED = False
 try:
-    from .workflow_endpoints import router as workflow_router
+    from .workflow_endpoints import router as workflow_router, create_http_client
     WORKFLOW_ENABLED = True
     logger.info("Workflow endpoints available")
 except ImportError:
@@ -79,7 +79,7 @@ except ImportError:
             return decorator
     limiter = DummyLimiter()
 
-from .database import Database
+from .database import Database, initialize_database
 
 async def periodic_cleanup():
     while True:
@@ -115,6 +115,9 @@ async def lifespan(app: FastAPI):
             if attempt < max_retries - 1:
                 await asyncio.sleep(2 ** attempt)
 
+    if db_connected:
+        await initialize_database()
+
     if not db_connected:
         
         logger.critical(
@@ -128,10 +131,15 @@ async def lifespan(app: FastAPI):
     app.state.total_requests = 0
     app.state.db_connected = db_connected
 
+    if WORKFLOW_ENABLED:
+        app.state.http = create_http_client()
+
     cleanup_task = asyncio.create_task(periodic_cleanup())
 
     if VECTOR_DB_AVAILABLE:
         asyncio.create_task(_warmup_clip_model())
+        from .routers.properties import start_embed_worker
+        start_embed_worker()
 
     yield
 
@@ -142,6 +150,25 @@ async def lifespan(app: FastAPI):
         pass
 
     logger.info(f"Shutting down {settings.APP_NAME}")
+    try:
+        from .routers.properties import close_http, stop_embed_worker
+        await stop_embed_worker()
+        await close_http()
+    except Exception as e:
+        logger.error(f"Error shutting down auto-embed: {e}")
+
+    try:
+        from .routers.neighborhood import shutdown_cv_executor
+        shutdown_cv_executor()
+    except Exception as e:
+        logger.error(f"Error shutting down CV executor: {e}")
+
+    if WORKFLOW_ENABLED:
+        try:
+            await app.state.http.aclose()
+        except Exception as e:
+            logger.error(f"Error closing workflow HTTP client: {e}")
+
     try:
         await Database.close()
         logger.info("Database closed")
@@ -163,7 +190,7 @@ app.add_middleware(CORSMiddleware, **cors_config)
 app.add_middleware(RequestLoggingMiddleware)
 app.add_middleware(RequestValidationMiddleware)
 app.add_middleware(RateLimitHeaderMiddleware)
-app.add_middleware(GZipMiddleware, minimum_size=1000)
+app.add_middleware(GZipMiddleware, minimum_size=1024)
 
 results_dir = os.path.join(os.path.dirname(__file__), "..", "results")
 os.makedirs(results_dir, exist_ok=True)
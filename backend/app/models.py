@@ -32,6 +32,7 @@ class PropertyUpdate(BaseModel):
     property_type: Optional[str] = None
     latitude: Optional[float] = None
     longitude: Optional[float] = None
+    image_url: Optional[str] = None
 
 class PropertyResponse(PropertyBase):
     id: str
@@ -40,6 +41,9 @@ class PropertyResponse(PropertyBase):
     
     model_config = ConfigDict(from_attributes=True)
 
+class PropertyBatchRequest(BaseModel):
+    ids: List[str] = Field(..., min_length=1, max_length=50)
+
 class HealthResponse(BaseModel):
     status: str
     timestamp: str
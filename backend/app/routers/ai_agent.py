@@ -1,7 +1,8 @@
 
 from fastapi import APIRouter, HTTPException, Request
-from typing import Dict, Any
+from typing import Dict, Any, Optional, Tuple
 import logging
+import time
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
@@ -29,6 +30,31 @@ except ImportError as e:
     agent = MockLocalExpertAgent()
 
 
+# Exact-match answers, keyed by the whitespace-normalised query. The example
+# prompts on the assistant page are asked over and over, and the answer for a
+# given query only changes when Gemini is involved.
+_ANSWER_CACHE: Dict[str, Tuple[float, dict]] = {}
+_ANSWER_CACHE_MAX = 256
+_ANSWER_TTL_S = 600.0
+
+
+def _cached_answer(key: str) -> Optional[dict]:
+    entry = _ANSWER_CACHE.get(key)
+    if entry and entry[0] > time.monotonic():
+        return entry[1]
+    return None
+
+
+def _cache_answer(key: str, result: dict) -> dict:
+    if not result.get("success", True):
+        return result
+    _ANSWER_CACHE.pop(key, None)
+    if len(_ANSWER_CACHE) >= _ANSWER_CACHE_MAX:
+        _ANSWER_CACHE.pop(next(iter(_ANSWER_CACHE)))
+    _ANSWER_CACHE[key] = (time.monotonic() + _ANSWER_TTL_S, result)
+    return result
+
+
 @router.post("/query")
 async def query_agent(query_req: Dict[str, Any]):
     try:
@@ -38,7 +64,10 @@ async def query_agent(query_req: Dict[str, Any]):
         
         logger.info(f"AI Agent query: {query[:100]}")
         
-        result = await agent.process_query(query)
+        key = " ".join(query.split())
+        result = _cached_answer(key)
+        if result is None:
+            result = _cache_answer(key, await agent.process_query(query))
         
         return {
             "query": query,
@@ -8,7 +8,8 @@ import os
 import traceback
 
 from ..database import get_database
-from ..geospatial import get_osm_map_area, download_osm_tile
+from ..geospatial import discard_map_area, get_osm_map_area, download_osm_tile
+from .tasks import notify_task_finished
 
 logger = logging.getLogger(__name__)
 
@@ -48,10 +49,7 @@ async def get_map_image(
         with open(map_path, "rb") as f:
             img_data = f.read()
 
-        try:
-            os.unlink(map_path)
-        except Exception:
-            pass
+        discard_map_area(map_path)
 
         return StreamingResponse(io.BytesIO(img_data), media_type="image/png")
 
@@ -231,10 +229,7 @@ async def _process_green_space_analysis(
                     {"error": "Green space calculation failed", "progress": 100},
                 )
         finally:
-            try:
-                os.unlink(map_path)
-            except Exception:
-                pass
+            discard_map_area(map_path)
 
     except Exception as e:
         logger.error(f"Green space analysis failed: {e}", exc_info=True)
@@ -248,6 +243,9 @@ async def _process_green_space_analysis(
         except Exception:
             pass
 
+    finally:
+        notify_task_finished(f"analysis_{analysis_id}")
+
 
 @router.get("/green-space/recent")
 async def get_recent_green_space_analyses(
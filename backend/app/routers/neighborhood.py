@@ -1,20 +1,30 @@
 from fastapi import APIRouter, HTTPException, BackgroundTasks, Query
 from typing import List, Optional, Dict
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, RedirectResponse
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta
 import asyncio
+import hashlib
+import multiprocessing
 import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
 
 from ..models import NeighborhoodAnalysisRequest, NeighborhoodAnalysisResponse, NeighborhoodAnalysis
 from ..crud import (
     create_neighborhood_analysis,
+    find_reusable_analysis,
     get_neighborhood_analysis,
+    get_analysis_fields,
     get_recent_analyses,
     update_analysis_status
 )
-from ..geospatial import OpenStreetMapClient, calculate_walk_score
+from ..geospatial import (
+    OpenStreetMapClient, calculate_walk_score, get_geocoder, map_filename, summarize_amenities,
+)
+from .tasks import notify_task_finished
 
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
@@ -22,17 +32,65 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/neighborhood", tags=["neighborhood"])
 
+CELERY_AVAILABLE = False
+_analyze_neighborhood_task = None
+try:
+    from ..tasks.geospatial_tasks import analyze_neighborhood_task as _analyze_neighborhood_task
+    CELERY_AVAILABLE = True
+except ImportError:
+    logger.info("Celery not available – neighbourhood analyses run in-process")
+
 osm_client = OpenStreetMapClient()
 
 PROGRESS_START = 10
 PROGRESS_AMENITIES = 40
-PROGRESS_WALK_SCORE = 55
 PROGRESS_GREEN_SPACE = 75
-PROGRESS_MAP = 85
 PROGRESS_COMPLETE = 100
 
+# OpenCV green-space analysis is CPU-bound, so it runs in worker processes and
+# is admission-controlled to keep it from hogging the default thread pool.
+_CV_WORKERS = os.cpu_count() or 2
+_CV_SEM = asyncio.Semaphore(_CV_WORKERS)
+_CV_EXECUTOR: Optional[ProcessPoolExecutor] = None
+
+
+def _get_cv_executor() -> ProcessPoolExecutor:
+    global _CV_EXECUTOR
+    if _CV_EXECUTOR is None:
+        # Forking the running server would copy the event loop, Motor's
+        # threads and held locks into children; forkserver starts clean ones.
+        _CV_EXECUTOR = ProcessPoolExecutor(
+            max_workers=_CV_WORKERS,
+            mp_context=multiprocessing.get_context("forkserver"),
+        )
+    return _CV_EXECUTOR
+
+
+def shutdown_cv_executor() -> None:
+    global _CV_EXECUTOR
+    if _CV_EXECUTOR is not None:
+        _CV_EXECUTOR.shutdown(wait=False, cancel_futures=True)
+        _CV_EXECUTOR = None
+
+
+async def _run_cv(func, *args):
+    global _CV_EXECUTOR
+    async with _CV_SEM:
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(_get_cv_executor(), func, *args)
+        except BrokenProcessPool:
+            logger.warning("CV process pool broke – recreating it")
+            _CV_EXECUTOR = None
+            raise
+
+
 AMENITY_TYPES = ['restaurant', 'cafe', 'school', 'hospital', 'park', 'supermarket']
 
+# A completed analysis of an identical request is handed back instead of
+# re-running the pipeline for this long; 0 disables reuse.
+ANALYSIS_REUSE_TTL_S = int(os.getenv("ANALYSIS_REUSE_TTL_S", "3600"))
+
 
 async def update_analysis_progress(analysis_id: str, progress: int,
                                    message: str = "", data: dict = None):
@@ -47,27 +105,45 @@ async def update_analysis_progress(analysis_id: str, progress: int,
         logger.error(f"Failed to update progress for {analysis_id}: {e}")
 
 
-async def _analyze_green_space(
-    coordinates,
-    radius_m: int,
-    analysis_id: str
-) -> Dict:
+async def _fetch_green_space_tile(coordinates, radius_m: int) -> Optional[str]:
     from ..geospatial import get_osm_map_area
-    from ..tasks.computer_vision_tasks import analyze_osm_green_spaces
 
     lat, lon = coordinates
-    tile_radius = min(radius_m, 1000)
-    map_path = None
+    try:
+        return await asyncio.to_thread(get_osm_map_area, lat, lon, min(radius_m, 1000))
+    except Exception as exc:
+        logger.warning(f"Green-space tile fetch failed (non-critical): {exc}")
+        return None
+
 
+async def _aexists(path: str) -> bool:
+    return await asyncio.to_thread(os.path.exists, path)
+
+
+async def _astat(path: str) -> Optional[os.stat_result]:
     try:
-        map_path = await asyncio.to_thread(get_osm_map_area, lat, lon, tile_radius)
+        return await asyncio.to_thread(os.stat, path)
+    except OSError:
+        return None
+
+
+async def _discard_tile(map_path: Optional[str]) -> None:
+    from ..geospatial import discard_map_area
+
+    if map_path:
+        await asyncio.to_thread(discard_map_area, map_path)
 
-        if not map_path or not os.path.exists(map_path):
+
+async def _analyze_green_space(map_path: Optional[str], analysis_id: str) -> Dict:
+    from ..tasks.computer_vision_tasks import analyze_osm_green_spaces
+
+    try:
+        if not map_path or not await _aexists(map_path):
             logger.warning("Green-space tile fetch returned nothing – skipping")
             return {}
 
         gs_id = f"nbr_{analysis_id}"
-        result = await asyncio.to_thread(analyze_osm_green_spaces, map_path, gs_id)
+        result = await _run_cv(analyze_osm_green_spaces, map_path, gs_id)
         return result or {}
 
     except Exception as exc:
@@ -75,11 +151,7 @@ async def _analyze_green_space(
         return {}
 
     finally:
-        if map_path and os.path.exists(map_path):
-            try:
-                os.unlink(map_path)
-            except Exception:
-                pass
+        await _discard_tile(map_path)
 
 
 async def process_neighborhood_sync(
@@ -91,56 +163,57 @@ async def process_neighborhood_sync(
     generate_map: bool = True,
 ):
     try:
-        amenities_data = await asyncio.to_thread(
-            osm_client.get_nearby_amenities,
-            address=address,
-            radius=radius_m,
-            amenity_types=amenity_types
+        coordinates = await asyncio.to_thread(
+            get_geocoder().address_to_coordinates, address
         )
-
-        if "error" in amenities_data:
+        if not coordinates:
             await update_analysis_status(analysis_id, "failed", {
-                "error": amenities_data["error"], "progress": 100
+                "error": "Could not geocode address", "progress": 100
             })
             return
 
         await update_analysis_progress(
-            analysis_id, PROGRESS_AMENITIES, "Calculating walk score…"
+            analysis_id, PROGRESS_START,
+            "Fetching amenities and OpenStreetMap tiles…"
         )
 
-        coordinates = amenities_data.get("coordinates")
-        walk_score = None
-        if coordinates:
-            walk_score = await asyncio.to_thread(
-                calculate_walk_score, coordinates, amenities_data
-            )
+        # The Overpass query and the green-space tile download are independent
+        # network round-trips once the address is geocoded.
+        amenities_data, tile_path = await asyncio.gather(
+            asyncio.to_thread(
+                osm_client.query_amenities,
+                address, coordinates, radius_m, amenity_types
+            ),
+            _fetch_green_space_tile(coordinates, radius_m),
+        )
+
+        if "error" in amenities_data:
+            await _discard_tile(tile_path)
+            await update_analysis_status(analysis_id, "failed", {
+                "error": amenities_data["error"], "progress": 100
+            })
+            return
 
         await update_analysis_progress(
-            analysis_id, PROGRESS_WALK_SCORE, "Analysing green spaces…",
-            {"walk_score": walk_score}
+            analysis_id, PROGRESS_AMENITIES,
+            "Calculating walk score and analysing green spaces…"
         )
 
-        green_space_data: Dict = {}
-        if coordinates:
-            try:
-                await update_analysis_progress(
-                    analysis_id, PROGRESS_WALK_SCORE + 5,
-                    "Fetching OpenStreetMap tiles for green-space analysis…"
-                )
-                green_space_data = await _analyze_green_space(
-                    coordinates, radius_m, analysis_id
-                )
-                gs_pct = green_space_data.get("green_space_percentage", 0)
-                logger.info(
-                    f"[{analysis_id}] Green space: {gs_pct:.1f}%"
-                )
-            except Exception as exc:
-                logger.warning(f"Green space failed (non-critical): {exc}")
+        walk_score, green_space_data = await asyncio.gather(
+            asyncio.to_thread(calculate_walk_score, coordinates, amenities_data),
+            _analyze_green_space(tile_path, analysis_id),
+        )
+        if green_space_data:
+            gs_pct = green_space_data.get("green_space_percentage", 0)
+            logger.info(
+                f"[{analysis_id}] Green space: {gs_pct:.1f}%"
+            )
 
         await update_analysis_progress(
             analysis_id, PROGRESS_GREEN_SPACE,
-            "Generating interactive map…" if generate_map else "Finalising…",
+            "Finalising…",
             {
+                "walk_score": walk_score,
                 "green_space_percentage": green_space_data.get("green_space_percentage"),
                 "green_space_breakdown": green_space_data.get("breakdown"),
                 "green_space_visualization": green_space_data.get("visualization_path"),
@@ -149,32 +222,21 @@ async def process_neighborhood_sync(
             }
         )
 
-        map_path = None
-        if generate_map and coordinates:
-            await update_analysis_progress(analysis_id, PROGRESS_MAP,
-                                           "Generating map…")
-            try:
-                map_filename = f"neighborhood_{analysis_id.replace('-', '_')}.html"
-                map_path = os.path.join("maps", map_filename)
-
-                result = await asyncio.to_thread(
-                    osm_client.create_map_visualization,
-                    address=address,
-                    amenities_data=amenities_data,
-                    save_path=map_path
-                )
-                map_path = result if result and os.path.exists(result) else None
-            except Exception as exc:
-                logger.error(f"Map generation failed: {exc}")
+        # The HTML map is rendered on first request by get_analysis_map.
+        map_path = f"maps/{map_filename(analysis_id)}" if generate_map else None
 
         amenities = amenities_data.get("amenities", {})
-        total_amenities = sum(len(v) for v in amenities.values())
+        total_amenities = sum(map(len, amenities.values()))
+        amenity_counts, amenity_samples = summarize_amenities(amenities)
 
         result_data = {
             "walk_score": walk_score,
             "map_path": map_path,
             "amenities": amenities,
+            "amenity_counts": amenity_counts,
+            "amenity_samples": amenity_samples,
             "total_amenities": total_amenities,
+            "amenity_categories": len(amenities),
             "coordinates": coordinates,
             "green_space_percentage": green_space_data.get("green_space_percentage"),
             "green_space_breakdown": green_space_data.get("breakdown"),
@@ -198,6 +260,50 @@ async def process_neighborhood_sync(
             "error": str(exc), "progress": 100
         })
 
+    finally:
+        notify_task_finished(f"analysis_{analysis_id}")
+
+
+def analysis_request_key(analysis_request: NeighborhoodAnalysisRequest) -> str:
+    raw = "|".join([
+        " ".join(analysis_request.address.lower().split()),
+        str(analysis_request.radius_m),
+        ",".join(sorted(analysis_request.amenity_types or AMENITY_TYPES[:8])),
+        str(analysis_request.include_buildings),
+        str(analysis_request.generate_map),
+    ])
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def build_analysis_doc(analysis_request: NeighborhoodAnalysisRequest) -> Dict:
+    return {
+        "request_key": analysis_request_key(analysis_request),
+        "address": analysis_request.address,
+        "search_radius_m": analysis_request.radius_m,
+        "amenity_types": analysis_request.amenity_types,
+        "include_buildings": analysis_request.include_buildings,
+        "generate_map": analysis_request.generate_map,
+        "status": "pending",
+        "progress": 0,
+    }
+
+
+def schedule_in_process(
+    background_tasks: BackgroundTasks,
+    analysis_id: str,
+    analysis_request: NeighborhoodAnalysisRequest,
+) -> str:
+    background_tasks.add_task(
+        process_neighborhood_sync,
+        analysis_id,
+        analysis_request.address,
+        analysis_request.radius_m,
+        analysis_request.amenity_types or AMENITY_TYPES[:8],
+        analysis_request.include_buildings,
+        analysis_request.generate_map,
+    )
+    return f"analysis_{analysis_id}"
+
 
 @router.post("/analyze", status_code=202, response_model=NeighborhoodAnalysisResponse)
 async def analyze_neighborhood(
@@ -205,53 +311,44 @@ async def analyze_neighborhood(
     background_tasks: BackgroundTasks,
 ):
     try:
-        analysis_doc = {
-            "address": analysis_request.address,
-            "search_radius_m": analysis_request.radius_m,
-            "amenity_types": analysis_request.amenity_types,
-            "include_buildings": analysis_request.include_buildings,
-            "generate_map": analysis_request.generate_map,
-            "status": "pending",
-            "progress": 0,
-            "created_at": datetime.now().isoformat(),
-        }
+        doc = build_analysis_doc(analysis_request)
+
+        if ANALYSIS_REUSE_TTL_S > 0:
+            since = datetime.now() - timedelta(seconds=ANALYSIS_REUSE_TTL_S)
+            reused_id = await find_reusable_analysis(doc["request_key"], since)
+            if reused_id:
+                logger.info(f"Reusing completed analysis: {reused_id}")
+                return NeighborhoodAnalysisResponse(
+                    analysis_id=reused_id,
+                    task_id=f"analysis_{reused_id}",
+                    address=analysis_request.address,
+                    status="completed",
+                    message="Reused a recent analysis of the same request",
+                )
 
-        analysis_id = await create_neighborhood_analysis(analysis_doc)
+        analysis_id = await create_neighborhood_analysis(doc)
         logger.info(f"Created analysis: {analysis_id}")
 
-        CELERY_AVAILABLE = False
-        try:
-            from celery.result import AsyncResult
-            from celery_config import celery_app
-            CELERY_AVAILABLE = True
-        except ImportError:
-            pass
-
-        use_celery = CELERY_AVAILABLE
+        use_celery = CELERY_AVAILABLE and _analyze_neighborhood_task is not None
         task_id: str = ""
 
         if use_celery:
             try:
-                from ..tasks.geospatial_tasks import analyze_neighborhood_task
-                task = analyze_neighborhood_task.delay(
-                    analysis_id=analysis_id,
-                    request_data=analysis_request.dict()
+                task = await asyncio.to_thread(
+                    _analyze_neighborhood_task.apply_async,
+                    kwargs={
+                        "analysis_id": analysis_id,
+                        "request_data": analysis_request.dict(),
+                    },
+                    retry=False,
                 )
                 task_id = task.id
-            except Exception:
+            except Exception as exc:
+                logger.warning(f"Celery enqueue failed, running in-process: {exc}")
                 use_celery = False
 
         if not use_celery:
-            task_id = f"analysis_{analysis_id}"
-            background_tasks.add_task(
-                process_neighborhood_sync,
-                analysis_id,
-                analysis_request.address,
-                analysis_request.radius_m,
-                analysis_request.amenity_types or AMENITY_TYPES[:8],
-                analysis_request.include_buildings,
-                analysis_request.generate_map,
-            )
+            task_id = schedule_in_process(background_tasks, analysis_id, analysis_request)
             logger.info(f"Background task scheduled: {task_id}")
 
         return NeighborhoodAnalysisResponse(
@@ -275,17 +372,15 @@ async def get_recent(limit: int = Query(10)):
 
         formatted = []
         for a in analyses:
-            amenities = a.get("amenities", {})
-            total = sum(len(v) for v in amenities.values())
             formatted.append({
                 "analysis_id": str(a.get("id", a.get("_id", ""))),
                 "address": a.get("address", "Unknown"),
                 "status": a.get("status", "unknown"),
                 "walk_score": a.get("walk_score"),
-                "total_amenities": total,
+                "total_amenities": a.get("total_amenities") or 0,
                 "created_at": a.get("created_at"),
                 "map_available": bool(a.get("map_path")),
-                "amenity_categories": len(amenities),
+                "amenity_categories": a.get("amenity_categories") or 0,
                 "green_space_percentage": a.get("green_space_percentage"),
             })
 
@@ -312,9 +407,11 @@ async def get_analysis(analysis_id: str):
         elif not isinstance(coordinates, dict):
             analysis["coordinates"] = None
 
-        amenities = analysis.get("amenities", {})
-        analysis["total_amenities"] = sum(len(v) for v in amenities.values())
-        analysis["amenity_categories"] = len(amenities)
+        amenities = analysis.get("amenities") or {}
+        if analysis.get("total_amenities") is None:
+            analysis["total_amenities"] = sum(map(len, amenities.values()))
+        if analysis.get("amenity_categories") is None:
+            analysis["amenity_categories"] = len(amenities)
 
         return analysis
 
@@ -325,10 +422,73 @@ async def get_analysis(analysis_id: str):
         raise HTTPException(status_code=500, detail="Failed to retrieve analysis")
 
 
+# analysis_id -> [lock, user count]. The entry is dropped by the last user,
+# so a request still waiting on the lock never finds it replaced.
+_MAP_RENDER_LOCKS: Dict[str, list] = {}
+_MAPS_DIR = os.path.join(PROJECT_ROOT, "maps")
+
+
+def _write_map_file(doc: Dict, map_path: str) -> bool:
+    # Render to a uniquely named sibling and rename into place, so a reader
+    # (or another worker process rendering the same map) never sees a
+    # partial file.
+    fd, tmp_path = tempfile.mkstemp(
+        suffix=".html", prefix=".render_", dir=os.path.dirname(map_path)
+    )
+    os.close(fd)
+    try:
+        result = osm_client.create_map_visualization(
+            address=doc.get("address", ""),
+            amenities_data={
+                "coordinates": doc["coordinates"],
+                "amenities": doc.get("amenities") or {},
+                "search_radius_m": doc.get("search_radius_m", 1000),
+            },
+            save_path=tmp_path,
+        )
+        if not result:
+            return False
+        os.replace(tmp_path, map_path)
+        return True
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+
+async def _render_map(analysis_id: str, map_path: str) -> Optional[os.stat_result]:
+    entry = _MAP_RENDER_LOCKS.setdefault(analysis_id, [asyncio.Lock(), 0])
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            stat = await _astat(map_path)
+            if stat is not None:
+                return stat
+
+            doc = await get_analysis_fields(
+                analysis_id, ("address", "amenities", "coordinates", "search_radius_m")
+            )
+            if not doc or not doc.get("coordinates"):
+                return None
+
+            if not await asyncio.to_thread(_write_map_file, doc, map_path):
+                return None
+            logger.info(f"Rendered map for {analysis_id} on first request")
+            return await _astat(map_path)
+    except Exception as exc:
+        logger.error(f"Map generation failed for {analysis_id}: {exc}")
+        return None
+    finally:
+        entry[1] -= 1
+        if entry[1] == 0:
+            _MAP_RENDER_LOCKS.pop(analysis_id, None)
+
+
 @router.get("/{analysis_id}/map")
 async def get_analysis_map(analysis_id: str):
     try:
-        analysis = await get_neighborhood_analysis(analysis_id)
+        analysis = await get_analysis_fields(
+            analysis_id, ("status", "map_path", "map_url")
+        )
         if not analysis:
             raise HTTPException(status_code=404, detail="Analysis not found")
         if analysis.get("status") != "completed":
@@ -337,24 +497,35 @@ async def get_analysis_map(analysis_id: str):
                 detail=f"Analysis not completed. Status: {analysis.get('status')}"
             )
 
+        # Legacy documents stored a direct URL.
+        if analysis.get("map_url"):
+            return RedirectResponse(analysis["map_url"], status_code=302)
+
         map_path = analysis.get("map_path")
         if not map_path:
             raise HTTPException(status_code=404, detail="Map not generated")
 
         if not os.path.isabs(map_path):
-            backend_root = os.path.dirname(
-                os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-            )
-            map_path = os.path.join(backend_root, map_path)
+            map_path = os.path.join(PROJECT_ROOT, map_path)
 
-        if not os.path.exists(map_path):
+        stat = await _astat(map_path)
+        if stat is None:
+            stat = await _render_map(analysis_id, map_path)
+        if stat is None:
             raise HTTPException(
                 status_code=404,
                 detail=f"Map file not found: {os.path.basename(map_path)}"
             )
 
+        # Maps in the static mount are served from there, once rendered.
+        if os.path.dirname(os.path.abspath(map_path)) == _MAPS_DIR:
+            return RedirectResponse(
+                f"/static/maps/{os.path.basename(map_path)}", status_code=302
+            )
+
         return FileResponse(
             map_path,
+            stat_result=stat,
             media_type="text/html",
             headers={
                 "Content-Type": "text/html; charset=utf-8",
@@ -375,7 +546,7 @@ async def generate_location_image(analysis_id: str):
     try:
         from ..image_generator import image_generator
 
-        analysis = await get_neighborhood_analysis(analysis_id)
+        analysis = await get_analysis_fields(analysis_id, ("coordinates",))
         if not analysis:
             raise HTTPException(status_code=404, detail="Analysis not found")
 
@@ -392,11 +563,13 @@ async def generate_location_image(analysis_id: str):
         image_path = image_generator.generate_osm_static_map(
             latitude=lat, longitude=lon, zoom=15, width=800, height=600, add_marker=True
         )
-        if not image_path or not os.path.exists(image_path):
+        stat = await _astat(image_path) if image_path else None
+        if stat is None:
             raise HTTPException(status_code=500, detail="Failed to generate image")
 
         return FileResponse(
             image_path,
+            stat_result=stat,
             media_type="image/png",
             headers={
                 "Content-Disposition": f'inline; filename="location_{analysis_id}.png"'
@@ -1,16 +1,119 @@
 from fastapi import APIRouter, BackgroundTasks, HTTPException, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
 from typing import List, Optional
+import asyncio
 import logging
 import httpx
+from pydantic import TypeAdapter, ValidationError
 
 from ..crud import property_crud
-from ..models import PropertyCreate, PropertyUpdate, PropertyResponse
+from ..models import PropertyBatchRequest, PropertyCreate, PropertyUpdate, PropertyResponse
 from ..database import Database
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/properties", tags=["properties"])
 
+_properties_adapter = TypeAdapter(List[PropertyResponse])
+
+
+def _json_rows(rows: List[PropertyResponse]) -> Response:
+    return Response(_properties_adapter.dump_json(rows), media_type="application/json")
+
+
+_HTTP: Optional[httpx.AsyncClient] = None
+
+
+async def get_http() -> httpx.AsyncClient:
+    global _HTTP
+    if _HTTP is None or _HTTP.is_closed:
+        _HTTP = httpx.AsyncClient(
+            timeout=15.0,
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=32, max_connections=64),
+        )
+    return _HTTP
+
+
+async def close_http() -> None:
+    global _HTTP
+    if _HTTP is not None:
+        await _HTTP.aclose()
+        _HTTP = None
+
+
+_MAX_IMAGE_BYTES = 10 * 1024 * 1024
+_DOWNLOAD_CHUNK = 65536
+
+_EMBED_BATCH_SIZE = 16
+_EMBED_BATCH_WAIT_S = 0.05
+
+_embed_queue: Optional[asyncio.Queue] = None
+_embed_worker: Optional[asyncio.Task] = None
+
+
+def start_embed_worker() -> None:
+    global _embed_queue, _embed_worker
+    if _embed_worker is None or _embed_worker.done():
+        _embed_queue = asyncio.Queue()
+        _embed_worker = asyncio.create_task(_embed_batch_worker())
+
+
+async def stop_embed_worker() -> None:
+    global _embed_queue, _embed_worker
+    if _embed_worker is not None:
+        _embed_worker.cancel()
+        try:
+            await _embed_worker
+        except asyncio.CancelledError:
+            pass
+    _embed_queue = None
+    _embed_worker = None
+
+
+async def _embed_batch_worker():
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await _embed_queue.get()]
+        deadline = loop.time() + _EMBED_BATCH_WAIT_S
+        while len(batch) < _EMBED_BATCH_SIZE:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(_embed_queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+
+        try:
+            await _flush_embed_batch(batch)
+        except Exception as e:
+            logger.warning(f"Auto-embed batch of {len(batch)} failed: {e}")
+
+
+async def _flush_embed_batch(batch: List[dict]):
+    from ..supabase_client import vector_db, CLIPEmbeddingService, run_db
+
+    svc = await CLIPEmbeddingService.get_instance()
+    embeddings = await svc.embed_bytes_batch([item.pop("raw") for item in batch])
+
+    rows = []
+    for item, embedding in zip(batch, embeddings):
+        if embedding is None:
+            logger.warning(f"Embedding returned None for {item['property_id']}")
+            continue
+        rows.append({**item, "embedding": embedding})
+
+    if not rows:
+        return
+
+    ok = await run_db(vector_db.upsert_property_batch, rows)
+    if ok:
+        logger.info(f"Auto-embedded {len(rows)} properties in one batch")
+    else:
+        logger.warning(f"Supabase batch upsert failed for {len(rows)} properties")
+
 
 async def _auto_embed_property(
     property_id: str,
@@ -20,45 +123,54 @@ async def _auto_embed_property(
     city: str = "",
     price: Optional[float] = None,
     bedrooms: Optional[int] = None,
+    skip_if_current: bool = False,
 ):
     try:
-        from ..supabase_client import vector_db, CLIPEmbeddingService
+        from ..supabase_client import vector_db, run_db
 
         if not vector_db.enabled:
             return 
 
-      
-        async with httpx.AsyncClient(timeout=15.0) as client:
-            resp = await client.get(image_url)
+        # Only updates can already have a stored embedding; new ids never do.
+        if skip_if_current:
+            stored_url = await run_db(vector_db.get_property_image_url, property_id)
+            if stored_url == image_url:
+                logger.info(f"Embedding for {property_id} already up to date, skipping")
+                return
+
+        client = await get_http()
+        buf = bytearray()
+        async with client.stream("GET", image_url) as resp:
             if resp.status_code != 200:
                 logger.warning(f"Image download failed for {property_id}: HTTP {resp.status_code}")
                 return
-            raw = resp.content
-
-        svc = await CLIPEmbeddingService.get_instance()
-        embedding = await svc.embed_bytes(raw)
+            if int(resp.headers.get("content-length") or 0) > _MAX_IMAGE_BYTES:
+                logger.warning(f"Image too large for {property_id}, skipping auto-embed")
+                return
+            async for chunk in resp.aiter_bytes(_DOWNLOAD_CHUNK):
+                buf.extend(chunk)
+                if len(buf) > _MAX_IMAGE_BYTES:
+                    logger.warning(f"Image too large for {property_id}, skipping auto-embed")
+                    return
 
-        if embedding is None:
-            logger.warning(f"Embedding returned None for {property_id}")
-            return
-
-        ok = vector_db.upsert_property(
-            property_id=property_id,
-            address=address,
-            embedding=embedding,
-            image_url=image_url,
-            metadata={
+        item = {
+            "property_id": property_id,
+            "address":     address,
+            "image_url":   image_url,
+            "raw":         bytes(buf),
+            "metadata": {
                 "locality": locality or address.split(",")[0].strip(),
                 "city":     city,
                 "price":    price,
                 "bedrooms": bedrooms,
             },
-        )
+        }
 
-        if ok:
-            logger.info(f"Auto-embedded property {property_id}")
+        # Without the lifespan worker running, embed inline as a batch of one.
+        if _embed_queue is None:
+            await _flush_embed_batch([item])
         else:
-            logger.warning(f"Supabase upsert failed for {property_id}")
+            await _embed_queue.put(item)
 
     except Exception as e:
         logger.warning(f"Auto-embed failed for {property_id}: {e}")
@@ -70,34 +182,71 @@ async def get_properties(
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
     city: Optional[str] = None,
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return, e.g. price,property_type"),
+    property_type: Optional[str] = None,
+    bedrooms: Optional[int] = Query(None, ge=0),
+    price_min: Optional[float] = Query(None, ge=0),
+    price_max: Optional[float] = Query(None, ge=0),
+    after: Optional[str] = Query(None, description="Return properties after this id (keyset pagination)"),
 ):
     
+    selected = None
+    if fields:
+        selected = [f.strip() for f in fields.split(",") if f.strip()]
+        unknown = set(selected) - set(PropertyResponse.model_fields)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+
     try:
         logger.info(f"/api/properties called - skip:{skip}, limit:{limit}, city:{city}")
 
-        properties = await property_crud.get_all_properties(skip=skip, limit=limit)
+        properties = await property_crud.get_all_properties(
+            skip=skip, limit=limit, city=city, fields=selected,
+            property_type=property_type, bedrooms=bedrooms,
+            price_min=price_min, price_max=price_max, after=after,
+        )
         logger.info(f"   CRUD returned {len(properties)} properties")
 
-        if city:
-            properties = [p for p in properties if p.get("city", "").lower() == city.lower()]
-            logger.info(f"   After city filter: {len(properties)} properties")
+        # Partial rows can't satisfy PropertyResponse, so send them as-is.
+        if selected:
+            return JSONResponse(jsonable_encoder(properties))
+
+        # Rows are validated once here and serialised by the adapter; returning
+        # a Response keeps FastAPI from validating them again for response_model.
+        try:
+            return _json_rows(_properties_adapter.validate_python(properties))
+        except ValidationError as exc:
+            # Error locations start with the list index, so drop just those rows.
+            bad_rows = {err["loc"][0] for err in exc.errors() if err["loc"]}
 
         valid_props = []
-        for p in properties:
-            try:
-                validated = PropertyResponse.model_validate(p)
-                valid_props.append(validated)
-            except Exception as ve:
-                logger.warning(f"Property validation failed (id={p.get('id')}): {ve}")
+        for idx, p in enumerate(properties):
+            if idx in bad_rows:
+                logger.warning(f"Property validation failed (id={p.get('id')})")
+                continue
+            valid_props.append(PropertyResponse.model_validate(p))
 
         logger.info(f"Validation: {len(valid_props)}/{len(properties)} passed")
-        return valid_props
+        return _json_rows(valid_props)
 
     except Exception as e:
         logger.error(f"Failed to get properties: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to retrieve properties")
 
 
+@router.get("/facets")
+async def get_property_facets():
+    # Filter options and summary figures, so clients can filter server-side
+    # without first downloading the catalogue.
+    return await property_crud.get_property_facets()
+
+
+@router.post("/batch", response_model=List[PropertyResponse])
+async def get_properties_batch(batch: PropertyBatchRequest):
+    # One round trip for a handful of known ids, returned in request order.
+    return await property_crud.get_properties_by_ids(batch.ids)
+
+
 @router.post("", response_model=PropertyResponse, status_code=201)
 async def create_property(
     property: PropertyCreate,
@@ -145,12 +294,29 @@ async def get_property(property_id: str):
 
 
 @router.put("/{property_id}", response_model=PropertyResponse)
-async def update_property(property_id: str, property_update: PropertyUpdate):
+async def update_property(
+    property_id: str,
+    property_update: PropertyUpdate,
+    background_tasks: BackgroundTasks,
+):
   
     try:
         updated = await property_crud.update_property(property_id, property_update)
         if not updated:
             raise HTTPException(status_code=404, detail="Property not found")
+
+        if property_update.image_url:
+            background_tasks.add_task(
+                _auto_embed_property,
+                str(updated.get("id", property_id)),
+                updated.get("address", ""),
+                property_update.image_url,
+                locality=updated.get("locality", ""),
+                city=updated.get("city", ""),
+                price=updated.get("price"),
+                bedrooms=updated.get("bedrooms"),
+                skip_if_current=True,
+            )
         return updated
     except HTTPException:
         raise
@@ -1,25 +1,62 @@
-from fastapi import APIRouter, HTTPException
-from typing import Dict, Any, Optional
+from fastapi import APIRouter, HTTPException, Query
+from typing import Dict, Any, Optional, Tuple
+import asyncio
 import logging
 from datetime import datetime
+from functools import partial
 import math
+import time
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/tasks", tags=["tasks"])
 
 
-def sanitize_floats(obj: Any) -> Any:
-   
+try:
+    import orjson
+    _ORJSON_AVAILABLE = True
+    _ORJSON_OPTS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+except ImportError:
+    _ORJSON_AVAILABLE = False
+
+
+def _nan_to_none(value: Any) -> Any:
+    if isinstance(value, float) and (math.isnan(value) or math.isinf(value)):
+        return None
+    raise TypeError
+
+
+def _finite_or_none(value: Any) -> Any:
+    if isinstance(value, float) and (math.isnan(value) or math.isinf(value)):
+        return None
+    return value
+
+
+def _sanitize_floats_py(obj: Any) -> Any:
     if isinstance(obj, float):
         return None if (math.isnan(obj) or math.isinf(obj)) else obj
     elif isinstance(obj, dict):
-        return {k: sanitize_floats(v) for k, v in obj.items()}
+        return {k: _sanitize_floats_py(v) for k, v in obj.items()}
     elif isinstance(obj, (list, tuple)):
-        return [sanitize_floats(i) for i in obj]
+        return [_sanitize_floats_py(i) for i in obj]
     return obj
 
 
+def sanitize_floats(obj: Any) -> Any:
+    # orjson already writes NaN/Inf as null, so a dumps/loads round-trip
+    # sanitises the whole tree in one C pass instead of a frame per node.
+    if obj is None or isinstance(obj, (str, int, float)):
+        return _finite_or_none(obj)
+    if _ORJSON_AVAILABLE:
+        try:
+            return orjson.loads(
+                orjson.dumps(obj, default=_nan_to_none, option=_ORJSON_OPTS)
+            )
+        except orjson.JSONEncodeError:
+            pass
+    return _sanitize_floats_py(obj)
+
+
 def _extract_message(info: Any, state: str) -> str:
    
     if info is None:
@@ -41,6 +78,7 @@ CELERY_AVAILABLE = False
 try:
     from celery.result import AsyncResult
     from celery_config import celery_app
+    _async_result = partial(AsyncResult, app=celery_app)
     CELERY_AVAILABLE = True
     logger.info(" Celery available for task tracking")
 except ImportError:
@@ -59,6 +97,17 @@ except ImportError:
         return None
 
 
+def _nbr_result(analysis: dict) -> dict:
+    # Once counts and nearest samples are stored, the full POI lists stay in
+    # Mongo for the map and are not sent with every completed poll.
+    if "amenity_counts" in analysis:
+        analysis = {
+            k: v for k, v in analysis.items()
+            if k not in ("amenities", "building_footprints")
+        }
+    return sanitize_floats(analysis)
+
+
 def _nbr_response(task_id: str, analysis_id: str, analysis: dict) -> dict:
     status   = analysis.get("status", "unknown")
     progress = analysis.get("progress", 0)
@@ -68,10 +117,10 @@ def _nbr_response(task_id: str, analysis_id: str, analysis: dict) -> dict:
         "status":         status,
         "progress":       progress,
         "message":        analysis.get("message", f"Analysis {status}"),
-        "result":         sanitize_floats(analysis) if status == "completed" else None,
+        "result":         _nbr_result(analysis) if status == "completed" else None,
         "error":          analysis.get("error"),
         "address":        analysis.get("address"),
-        "walk_score":     sanitize_floats(analysis.get("walk_score")),
+        "walk_score":     _finite_or_none(analysis.get("walk_score")),
         "total_amenities": analysis.get("total_amenities", 0),
     }
 
@@ -89,15 +138,132 @@ def _sat_response(task_id: str, analysis_id: str, analysis: dict) -> dict:
         "result":      sanitize_floats(analysis) if status == "completed" else None,
         "error":       analysis.get("error"),
         "address":     analysis.get("address"),
-        "green_space_percentage": sanitize_floats(
+        "green_space_percentage": _finite_or_none(
             analysis.get("green_space_percentage")
         ),
     }
 
 
+_ANALYSIS_LOOKUPS = (
+    ("Neighbourhood", get_neighborhood_analysis, _nbr_response),
+    ("Satellite",     get_satellite_analysis,    _sat_response),
+)
+
+
+async def _lookup_analysis(task_id: str, analysis_id: str) -> Optional[dict]:
+    # Both collections are queried concurrently; neighbourhood still wins ties.
+    found = await asyncio.gather(
+        *(fetch(analysis_id) for _, fetch, _ in _ANALYSIS_LOOKUPS),
+        return_exceptions=True,
+    )
+    for (kind, _, build), analysis in zip(_ANALYSIS_LOOKUPS, found):
+        if isinstance(analysis, Exception):
+            logger.error(f"{kind} lookup failed for {analysis_id}: {analysis}")
+        elif analysis:
+            return build(task_id, analysis_id, analysis)
+    return None
+
+
+_STATUS_MAP = {
+    "PENDING":  "pending",
+    "STARTED":  "processing",
+    "PROGRESS": "processing",
+    "SUCCESS":  "completed",
+    "FAILURE":  "failed",
+    "RETRY":    "processing",
+    "REVOKED":  "failed",
+}
+
+_NOT_FOUND_TMPL = {
+    "error":   "Task not found",
+    "message": "Task may have expired or never existed",
+    "troubleshooting": {
+        "celery_available": CELERY_AVAILABLE,
+        "suggestions": [
+            "Check if the task was created successfully",
+            "Task results expire after 1 hour",
+            "Check backend logs for errors",
+        ],
+    },
+}
+
+
+_STATUS_CACHE: Dict[str, Tuple[float, dict]] = {}
+_STATUS_CACHE_MAX = 10_000
+_ACTIVE_TTL_S = 1.0
+_TERMINAL_TTL_S = 60.0
+_TERMINAL_STATUSES = frozenset({"completed", "failed"})
+
+
+def _cached_status(task_id: str) -> Optional[dict]:
+    entry = _STATUS_CACHE.get(task_id)
+    if entry and entry[0] > time.monotonic():
+        return entry[1]
+    return None
+
+
+def _cache_status(task_id: str, response: dict) -> dict:
+    ttl = _TERMINAL_TTL_S if response.get("status") in _TERMINAL_STATUSES else _ACTIVE_TTL_S
+    _STATUS_CACHE.pop(task_id, None)
+    if len(_STATUS_CACHE) >= _STATUS_CACHE_MAX:
+        _STATUS_CACHE.pop(next(iter(_STATUS_CACHE)))
+    _STATUS_CACHE[task_id] = (time.monotonic() + ttl, response)
+    return response
+
+
+_LONG_POLL_MAX_S = 20.0
+_LONG_POLL_STEP_S = 0.25
+
+# task_id -> [event, waiter count]. In-process analyses call
+# notify_task_finished() so held polls return at once; Celery tasks are
+# still picked up by the periodic re-check.
+_WAITERS: Dict[str, list] = {}
+
+
+def notify_task_finished(task_id: str) -> None:
+    _STATUS_CACHE.pop(task_id, None)
+    entry = _WAITERS.get(task_id)
+    if entry:
+        entry[0].set()
+
+
 @router.get("/{task_id}")
-async def get_task_status(task_id: str):
-   
+async def get_task_status(
+    task_id: str,
+    wait: float = Query(0, ge=0, le=_LONG_POLL_MAX_S, description="Seconds to hold the request until the task finishes"),
+):
+    # In-flight states are served from a 1 s cache and terminal states from a
+    # 60 s one so repeat fetches skip Mongo/Redis. With wait > 0 the request
+    # is held open and returns as soon as the task reaches a terminal state.
+    deadline = time.monotonic() + wait
+    step = _LONG_POLL_STEP_S
+    entry = None
+    try:
+        while True:
+            response = _cached_status(task_id)
+            if response is None:
+                response = _cache_status(task_id, await _resolve_task_status(task_id))
+
+            remaining = deadline - time.monotonic()
+            if response.get("status") in _TERMINAL_STATUSES or remaining <= 0:
+                return response
+
+            if entry is None:
+                entry = _WAITERS.setdefault(task_id, [asyncio.Event(), 0])
+                entry[1] += 1
+            try:
+                await asyncio.wait_for(entry[0].wait(), timeout=min(step, remaining))
+            except asyncio.TimeoutError:
+                pass
+            step = min(step * 2, _ACTIVE_TTL_S)
+    finally:
+        if entry is not None:
+            entry[1] -= 1
+            if entry[1] <= 0:
+                _WAITERS.pop(task_id, None)
+
+
+async def _resolve_task_status(task_id: str) -> dict:
     logger.info(f"Checking status for task: {task_id}")
 
 
@@ -105,39 +271,19 @@ async def get_task_status(task_id: str):
         analysis_id = task_id[len("analysis_"):]
         logger.info(f"Background task — checking analysis_id: {analysis_id}")
 
-        try:
-            analysis = await get_neighborhood_analysis(analysis_id)
-            if analysis:
-                return _nbr_response(task_id, analysis_id, analysis)
-        except Exception as e:
-            logger.error(f"Neighbourhood lookup failed for {analysis_id}: {e}")
-
-        try:
-            analysis = await get_satellite_analysis(analysis_id)
-            if analysis:
-                logger.info(f"Found satellite analysis for {analysis_id}")
-                return _sat_response(task_id, analysis_id, analysis)
-        except Exception as e:
-            logger.error(f"Satellite lookup failed for {analysis_id}: {e}")
+        response = await _lookup_analysis(task_id, analysis_id)
+        if response:
+            return response
 
 
     if CELERY_AVAILABLE:
         try:
-            celery_task = AsyncResult(task_id, app=celery_app)
+            celery_task = _async_result(task_id)
             state       = celery_task.state
 
             logger.info(f"Celery task state: {state}")
 
-            status_map = {
-                "PENDING":  "pending",
-                "STARTED":  "processing",
-                "PROGRESS": "processing",
-                "SUCCESS":  "completed",
-                "FAILURE":  "failed",
-                "RETRY":    "processing",
-                "REVOKED":  "failed",
-            }
-            task_status = status_map.get(state, state.lower())
+            task_status = _STATUS_MAP.get(state) or state.lower()
 
             progress = 0
             if state == "PROGRESS" and celery_task.info:
@@ -167,37 +313,14 @@ async def get_task_status(task_id: str):
         except Exception as e:
             logger.error(f"Celery lookup failed for {task_id}: {e}")
 
-    try:
-        analysis = await get_neighborhood_analysis(task_id)
-        if analysis:
-            logger.info("Found neighbourhood analysis using task_id as analysis_id")
-            return _nbr_response(task_id, task_id, analysis)
-    except Exception as e:
-        logger.error(f"Bare neighbourhood lookup failed for {task_id}: {e}")
-
-    try:
-        analysis = await get_satellite_analysis(task_id)
-        if analysis:
-            logger.info("Found satellite analysis using task_id as analysis_id")
-            return _sat_response(task_id, task_id, analysis)
-    except Exception as e:
-        logger.error(f"Bare satellite lookup failed for {task_id}: {e}")
+    response = await _lookup_analysis(task_id, task_id)
+    if response:
+        logger.info("Found analysis using task_id as analysis_id")
+        return response
 
 
     logger.warning(f"Task {task_id} not found in any system")
     raise HTTPException(
         status_code=404,
-        detail={
-            "error":   "Task not found",
-            "task_id": task_id,
-            "message": "Task may have expired or never existed",
-            "troubleshooting": {
-                "celery_available": CELERY_AVAILABLE,
-                "suggestions": [
-                    "Check if the task was created successfully",
-                    "Task results expire after 1 hour",
-                    "Check backend logs for errors",
-                ],
-            },
-        },
+        detail={**_NOT_FOUND_TMPL, "task_id": task_id},
     )
\ No newline at end of file
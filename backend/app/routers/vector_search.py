@@ -1,16 +1,21 @@
 from __future__ import annotations
 
-import asyncio
+import hashlib
 import logging
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
-from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Request, UploadFile
 from pydantic import BaseModel, Field
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/vector", tags=["vector-search"])
 
+_MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+_UPLOAD_CHUNK = 64 * 1024
+# Multipart boundaries and part headers on top of the file itself.
+_MULTIPART_SLACK = 64 * 1024
+
 
 def _require_vector_db():
     from ..supabase_client import vector_db
@@ -26,6 +31,32 @@ def _require_vector_db():
     return vector_db
 
 
+async def _run_db(func, *args, **kwargs):
+    from ..supabase_client import run_db
+    return await run_db(func, *args, **kwargs)
+
+
+async def _read_image_upload(request: Request, file: UploadFile) -> Tuple[bytes, str]:
+    too_large = HTTPException(
+        413, detail=f"Image too large. Max allowed: {_MAX_UPLOAD_BYTES // 1_048_576} MB"
+    )
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > _MAX_UPLOAD_BYTES + _MULTIPART_SLACK:
+        raise too_large
+    if file.size is not None and file.size > _MAX_UPLOAD_BYTES:
+        raise too_large
+
+    # SHA-256 is updated per chunk so the digest needs no second buffer pass.
+    buf = bytearray()
+    digest = hashlib.sha256()
+    while chunk := await file.read(_UPLOAD_CHUNK):
+        buf.extend(chunk)
+        if len(buf) > _MAX_UPLOAD_BYTES:
+            raise too_large
+        digest.update(chunk)
+    return bytes(buf), digest.hexdigest()
+
+
 async def _require_embed_service():
     try:
         from ..supabase_client import get_embedding_service
@@ -96,6 +127,7 @@ class StatsResponse(BaseModel):
     ),
 )
 async def search_similar_properties(
+    request: Request,
     file: UploadFile = File(..., description="Query image (JPEG/PNG/WEBP, max 10 MB)"),
     limit: int = Query(5, ge=1, le=20, description="Max results"),
     threshold: float = Query(0.70, ge=0.0, le=1.0, description="Min similarity"),
@@ -109,7 +141,7 @@ async def search_similar_properties(
             detail=f"Expected an image file, got content-type '{ct}'",
         )
 
-    raw = await file.read()
+    raw, raw_hash = await _read_image_upload(request, file)
 
     try:
         embedding = await svc.embed_bytes(raw)
@@ -119,15 +151,14 @@ async def search_similar_properties(
     if embedding is None:
         raise HTTPException(500, detail="Embedding model returned None — check backend logs")
 
-    loop = asyncio.get_event_loop()
-    raw_results: List[Dict] = await loop.run_in_executor(
-        None, db.similarity_search, embedding, limit, threshold
+    raw_results: List[Dict] = await _run_db(
+        db.similarity_search, embedding, limit, threshold
     )
 
     results = [SimilarProperty(**r) for r in raw_results]
 
     return SearchResponse(
-        query_image_hash=svc.content_hash(raw)[:16],
+        query_image_hash=raw_hash[:16],
         results=results,
         total_results=len(results),
         threshold_used=threshold,
@@ -145,6 +176,7 @@ async def search_similar_properties(
     ),
 )
 async def store_property(
+    request: Request,
     file: UploadFile = File(..., description="Property image"),
     property_id: str = Query(..., description="Unique property identifier"),
     address: str = Query(..., description="Human-readable address"),
@@ -156,7 +188,7 @@ async def store_property(
     if not ct.startswith("image/"):
         raise HTTPException(400, detail=f"Expected an image file, got '{ct}'")
 
-    raw = await file.read()
+    raw, _ = await _read_image_upload(request, file)
 
     try:
         embedding = await svc.embed_bytes(raw)
@@ -166,16 +198,13 @@ async def store_property(
     if embedding is None:
         raise HTTPException(500, detail="Embedding generation returned None")
 
-    loop = asyncio.get_event_loop()
-    ok: bool = await loop.run_in_executor(
-        None,
-        lambda: db.upsert_property(
-            property_id=property_id,
-            address=address,
-            embedding=embedding,
-            image_url=image_url or "",
-            metadata={},
-        ),
+    ok: bool = await _run_db(
+        db.upsert_property,
+        property_id=property_id,
+        address=address,
+        embedding=embedding,
+        image_url=image_url or "",
+        metadata={},
     )
 
     if not ok:
@@ -198,8 +227,7 @@ async def get_property(
     property_id: str,
     db=Depends(_require_vector_db),
 ):
-    loop = asyncio.get_event_loop()
-    row = await loop.run_in_executor(None, db.get_by_property_id, property_id)
+    row = await _run_db(db.get_by_property_id, property_id)
     if not row:
         raise HTTPException(404, detail=f"Property '{property_id}' not found in vector DB")
     return PropertyRecord(**row)
@@ -213,12 +241,11 @@ async def delete_property(
     property_id: str,
     db=Depends(_require_vector_db),
 ):
-    loop = asyncio.get_event_loop()
-    row = await loop.run_in_executor(None, db.get_by_property_id, property_id)
+    row = await _run_db(db.get_by_property_id, property_id)
     if not row:
         raise HTTPException(404, detail=f"Property '{property_id}' not found in vector DB")
 
-    await loop.run_in_executor(None, db.delete_property, property_id)
+    await _run_db(db.delete_property, property_id)
     return {
         "deleted": True,
         "property_id": property_id,
@@ -232,8 +259,7 @@ async def delete_property(
     summary="Vector database statistics",
 )
 async def vector_stats(db=Depends(_require_vector_db)):
-    loop = asyncio.get_event_loop()
-    stats = await loop.run_in_executor(None, db.get_stats)
+    stats = await _run_db(db.get_stats)
     return StatsResponse(
         **{k: v for k, v in stats.items() if k in StatsResponse.model_fields},
         timestamp=datetime.now().isoformat(),
@@ -244,7 +270,8 @@ async def vector_stats(db=Depends(_require_vector_db)):
     "/batch-store",
     summary="Batch-embed all properties",
     description=(
-        "Queues all properties (up to `limit`) for CLIP embedding via Celery. "
+        "Queues all properties (up to `limit`) for CLIP embedding via Celery, "
+        "split into parallel chunks. "
         "Falls back to a direct response list when Celery is unavailable."
     ),
 )
@@ -253,27 +280,34 @@ async def batch_store(
     db=Depends(_require_vector_db),
 ):
     from ..crud import property_crud
-    props = await property_crud.get_all_properties(limit=limit)
-    if not props:
+    ids = await property_crud.get_all_property_ids(limit=limit)
+    if not ids:
         return {"queued": 0, "message": "No properties found in database"}
 
     try:
-        from ..tasks.vector_tasks import batch_embed_task
-        task = batch_embed_task.delay([p["id"] for p in props])
+        from celery import group
+        from ..tasks.vector_tasks import EMBED_CHUNK, batch_embed_task
+
+        chunks = [ids[i:i + EMBED_CHUNK] for i in range(0, len(ids), EMBED_CHUNK)]
+        result = group(batch_embed_task.s(chunk) for chunk in chunks).apply_async()
         return {
-            "queued": len(props),
-            "task_id": task.id,
+            "queued": len(ids),
+            "group_id": result.id,
+            "task_ids": [r.id for r in result.results],
             "status": "processing",
-            "message": "Batch embedding started — poll /api/tasks/{task_id}",
+            "message": (
+                f"Batch embedding started in {len(chunks)} chunks — "
+                "poll /api/tasks/{task_id} for each entry in task_ids"
+            ),
         }
     except Exception:
         pass
 
     return {
-        "queued": len(props),
+        "queued": len(ids),
         "task_id": None,
         "message": (
             "Celery not available. "
             "Use POST /api/vector/store for individual properties."
         ),
-    }
\ No newline at end of file
+    }
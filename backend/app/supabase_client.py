@@ -3,11 +3,16 @@ from __future__ import annotations
 import asyncio
 import hashlib
 import io
+import json
 import logging
 import os
+import threading
+import time
 from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from typing import Any, Dict, List, Optional
 
+import numpy as np
 from dotenv import find_dotenv, load_dotenv
 from PIL import Image, UnidentifiedImageError
 
@@ -23,11 +28,57 @@ except ImportError:
 
 EMBEDDING_DIM = 512
 _MAX_BYTES = 10 * 1024 * 1024
+_EMBED_BATCH_MAX = 32
+_PRESIZE_SHORT_SIDE = 448
 _VALID_FMTS = {"JPEG", "PNG", "WEBP", "BMP"}
 _CLIP_MODEL = "openai/clip-vit-base-patch32"
 
+# ONNX Runtime is optional; when installed the CLIP image tower is exported
+# once and served from an InferenceSession instead of eager PyTorch.
+try:
+    import onnxruntime as ort
+    _ORT_AVAILABLE = True
+except ImportError:
+    _ORT_AVAILABLE = False
+
+_CLIP_USE_ONNX = os.getenv("CLIP_USE_ONNX", "true").lower() == "true"
+_CLIP_ONNX_PATH = os.getenv(
+    "CLIP_ONNX_PATH",
+    os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        ".clip_cache", "clip_vit_b32_image.onnx",
+    ),
+)
+
+# Opt-in int8 storage for the fallback scan cache: a quarter of the float32
+# footprint at the cost of ~0.4% per-component error on unit vectors.
+_SCAN_INT8 = os.getenv("VECTOR_SCAN_INT8", "false").lower() == "true"
+_SCAN_Q_SCALE = 127.0
+_SCAN_DTYPE = np.int8 if _SCAN_INT8 else np.float32
+_SCAN_BLOCK_ROWS = 4096
+_COUNT_TTL_S = 60.0
+# Writes from other processes (the Celery batch-embed task) are not seen by
+# this process's scan cache, so it is rebuilt once it is this old.
+_SCAN_CACHE_TTL_S = float(os.getenv("VECTOR_SCAN_CACHE_TTL", 300))
+
+# Opt-in two-stage search: Hamming k-NN over 1-bit quantised embeddings for
+# candidates, then exact cosine re-rank of _TWO_STAGE_FACTOR * limit of them.
+_TWO_STAGE = os.getenv("VECTOR_SEARCH_TWO_STAGE", "false").lower() == "true"
+_TWO_STAGE_FACTOR = 4
+
 _executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="clip_worker")
 
+# Supabase HTTP calls get their own pool so they neither queue behind CLIP
+# work nor compete with Starlette/asyncio for the default executor.
+_db_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("SUPABASE_IO_WORKERS", 8)), thread_name_prefix="sb_io"
+)
+
+
+async def run_db(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_db_executor, partial(func, *args, **kwargs))
+
 
 class CLIPEmbeddingService:
 
@@ -36,6 +87,8 @@ class CLIPEmbeddingService:
 
     _model = None
     _processor = None
+    _session = None
+    _traced = None
     _ready = False
 
     def __init__(self):
@@ -65,8 +118,18 @@ class CLIPEmbeddingService:
             CLIPEmbeddingService._processor = CLIPProcessor.from_pretrained(_CLIP_MODEL)
             CLIPEmbeddingService._model = CLIPModel.from_pretrained(_CLIP_MODEL)
             CLIPEmbeddingService._model.eval()
+            if _ORT_AVAILABLE and _CLIP_USE_ONNX:
+                CLIPEmbeddingService._session = CLIPEmbeddingService._load_onnx_session()
+            if CLIPEmbeddingService._session is None:
+                CLIPEmbeddingService._traced = CLIPEmbeddingService._trace_image_tower()
             CLIPEmbeddingService._ready = True
-            logger.info("CLIP model ready (dim=%d)", EMBEDDING_DIM)
+            if CLIPEmbeddingService._session is not None:
+                backend = "onnxruntime"
+            elif CLIPEmbeddingService._traced is not None:
+                backend = "torchscript"
+            else:
+                backend = "torch"
+            logger.info("CLIP model ready (dim=%d, backend=%s)", EMBEDDING_DIM, backend)
         except ImportError as exc:
             logger.critical(
                 "CLIP dependencies missing. Run: pip install transformers torch  (%s)", exc
@@ -76,6 +139,97 @@ class CLIPEmbeddingService:
             logger.critical("CLIP model load failed: %s", exc)
             raise
 
+    @staticmethod
+    def _image_tower():
+        # Vision forward + projection + L2 normalisation as one module, so
+        # the exported/traced graph includes the normalisation step.
+        import torch
+
+        class _ImageTower(torch.nn.Module):
+            def __init__(self, model):
+                super().__init__()
+                self.model = model
+
+            def forward(self, pixel_values):
+                features = self.model.get_image_features(pixel_values=pixel_values)
+                return features / features.norm(dim=-1, keepdim=True)
+
+        return _ImageTower(CLIPEmbeddingService._model).eval()
+
+    @staticmethod
+    def _dummy_pixels(batch: int = 1):
+        import torch
+
+        size = CLIPEmbeddingService._model.config.vision_config.image_size
+        return torch.zeros(batch, 3, size, size)
+
+    @staticmethod
+    def _trace_image_tower():
+        import torch
+
+        try:
+            with torch.no_grad():
+                traced = torch.jit.trace(
+                    CLIPEmbeddingService._image_tower(),
+                    CLIPEmbeddingService._dummy_pixels(),
+                    check_trace=False,
+                )
+                traced = torch.jit.optimize_for_inference(torch.jit.freeze(traced.eval()))
+                # Make sure the trace did not bake in the example batch size.
+                if traced(CLIPEmbeddingService._dummy_pixels(2)).shape[0] != 2:
+                    raise RuntimeError("traced graph is not batch-polymorphic")
+            return traced
+        except Exception as exc:
+            logger.warning("TorchScript trace of CLIP failed, using eager mode: %s", exc)
+            return None
+
+    @staticmethod
+    def _load_onnx_session():
+        import torch
+
+        try:
+            if not os.path.exists(_CLIP_ONNX_PATH):
+                os.makedirs(os.path.dirname(_CLIP_ONNX_PATH), exist_ok=True)
+                with torch.no_grad():
+                    torch.onnx.export(
+                        CLIPEmbeddingService._image_tower(),
+                        CLIPEmbeddingService._dummy_pixels(),
+                        _CLIP_ONNX_PATH,
+                        input_names=["pixel_values"], output_names=["embeddings"],
+                        dynamic_axes={"pixel_values": {0: "batch"}, "embeddings": {0: "batch"}},
+                        opset_version=17,
+                    )
+                logger.info("Exported CLIP image tower to %s", _CLIP_ONNX_PATH)
+
+            opts = ort.SessionOptions()
+            opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            providers = [
+                p for p in ("CUDAExecutionProvider", "CPUExecutionProvider")
+                if p in ort.get_available_providers()
+            ]
+            return ort.InferenceSession(_CLIP_ONNX_PATH, opts, providers=providers)
+        except Exception as exc:
+            logger.warning("ONNX export/load failed, using PyTorch for CLIP: %s", exc)
+            return None
+
+    @staticmethod
+    def _image_features(images: List[Image.Image]) -> np.ndarray:
+        if CLIPEmbeddingService._session is not None:
+            inputs = CLIPEmbeddingService._processor(images=images, return_tensors="np")
+            pixel_values = inputs["pixel_values"].astype(np.float32, copy=False)
+            return CLIPEmbeddingService._session.run(None, {"pixel_values": pixel_values})[0]
+
+        import torch
+
+        inputs = CLIPEmbeddingService._processor(images=images, return_tensors="pt")
+        with torch.no_grad():
+            if CLIPEmbeddingService._traced is not None:
+                normed = CLIPEmbeddingService._traced(inputs["pixel_values"])
+            else:
+                features = CLIPEmbeddingService._model.get_image_features(**inputs)
+                normed = features / features.norm(dim=-1, keepdim=True)
+        return normed.cpu().numpy()
+
     @property
     def is_ready(self) -> bool:
         return self._ready
@@ -86,12 +240,28 @@ class CLIPEmbeddingService:
         loop = asyncio.get_event_loop()
         return await loop.run_in_executor(_executor, self._run_clip_sync, img)
 
+    async def embed_bytes_batch(self, images: List[bytes]) -> List[Optional[List[float]]]:
+        decoded: List[Optional[Image.Image]] = []
+        for raw in images:
+            try:
+                self._validate(raw)
+                decoded.append(self._decode(raw))
+            except ValueError as exc:
+                logger.warning("Skipping image in batch: %s", exc)
+                decoded.append(None)
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(_executor, self._run_clip_batch_sync, decoded)
+
     async def embed_file(self, path: str) -> Optional[List[float]]:
         from pathlib import Path
         return await self.embed_bytes(Path(path).read_bytes())
 
     async def embed_batch(self, images: List[bytes]) -> List[Optional[List[float]]]:
-        return list(await asyncio.gather(*(self.embed_bytes(b) for b in images)))
+        # One forward pass per chunk; the cap bounds activation memory.
+        out: List[Optional[List[float]]] = []
+        for start in range(0, len(images), _EMBED_BATCH_MAX):
+            out.extend(await self.embed_bytes_batch(images[start:start + _EMBED_BATCH_MAX]))
+        return out
 
     @staticmethod
     def content_hash(data: bytes) -> str:
@@ -116,7 +286,21 @@ class CLIPEmbeddingService:
                 raise ValueError(
                     f"Unsupported format '{fmt}'. Allowed: {', '.join(_VALID_FMTS)}"
                 )
-            return img.convert("RGB")
+            # CLIP only sees a 224px centre crop, so shrink large photos early
+            # (JPEG via DCT-domain scaling) while keeping the aspect ratio.
+            if fmt == "JPEG":
+                img.draft("RGB", (_PRESIZE_SHORT_SIDE, _PRESIZE_SHORT_SIDE))
+            img = img.convert("RGB")
+            w, h = img.size
+            short = min(w, h)
+            if short > _PRESIZE_SHORT_SIDE:
+                scale = _PRESIZE_SHORT_SIDE / short
+                img = img.resize(
+                    (max(1, round(w * scale)), max(1, round(h * scale))),
+                    Image.BILINEAR,
+                    reducing_gap=2.0,
+                )
+            return img
         except UnidentifiedImageError as exc:
             raise ValueError("Cannot decode image — file may be corrupt") from exc
 
@@ -125,37 +309,65 @@ class CLIPEmbeddingService:
         if not CLIPEmbeddingService._ready:
             raise RuntimeError("CLIP model not loaded")
         try:
-            import torch
-
-            inputs = CLIPEmbeddingService._processor(images=img, return_tensors="pt")
-            with torch.no_grad():
-                features = CLIPEmbeddingService._model.get_image_features(**inputs)
-                normed = features / features.norm(dim=-1, keepdim=True)
-            return normed.squeeze().cpu().numpy().tolist()
+            return CLIPEmbeddingService._image_features([img])[0].tolist()
         except Exception as exc:
             logger.error("CLIP inference error: %s", exc)
             return None
 
 
+    @staticmethod
+    def _run_clip_batch_sync(
+        imgs: List[Optional[Image.Image]],
+    ) -> List[Optional[List[float]]]:
+        if not CLIPEmbeddingService._ready:
+            raise RuntimeError("CLIP model not loaded")
+        out: List[Optional[List[float]]] = [None] * len(imgs)
+        valid = [i for i, img in enumerate(imgs) if img is not None]
+        if not valid:
+            return out
+        try:
+            features = CLIPEmbeddingService._image_features([imgs[i] for i in valid])
+            for i, vec in zip(valid, features.tolist()):
+                out[i] = vec
+        except Exception as exc:
+            logger.error("CLIP batch inference error: %s", exc)
+        return out
+
+
+# Set once the model is loaded so per-request callers skip the coroutine
+# round-trip through get_instance().
+_SVC: Optional[CLIPEmbeddingService] = None
+
+
 async def get_embedding_service() -> CLIPEmbeddingService:
-    return await CLIPEmbeddingService.get_instance()
+    global _SVC
+    if _SVC is None:
+        _SVC = await CLIPEmbeddingService.get_instance()
+    return _SVC
 
 _SETUP_HINT = """
 Run the SQL in  backend/supabase_setup.sql  in your Supabase SQL Editor.
 It creates:
-  - property_embeddings table with vector(512) column
-  - IVFFlat index for fast cosine similarity search
-  - match_property_embeddings() RPC function
+  - property_embeddings table with halfvec(512) column
+  - HNSW index for fast cosine similarity search
+  - match_property_embeddings() and match_property_embeddings_direct() RPCs
 """
 
 class SupabaseVectorDB:
 
     TABLE = "property_embeddings"
-    DIM = 512
+    DIM = 512  # stored as halfvec(512); clients send/receive float lists
 
     def __init__(self):
         self.enabled = False
         self.client: Optional[Client] = None
+        self._cache_lock = threading.Lock()
+        self._cache_M: Optional[np.ndarray] = None
+        self._cache_meta: List[Dict[str, Any]] = []
+        self._cache_index: Dict[str, int] = {}
+        self._cache_loaded_at = 0.0
+        self._count_cached_at = 0.0
+        self._count = 0
 
         url = os.getenv("SUPABASE_URL", "").strip()
         key = os.getenv("SUPABASE_KEY", "").strip()
@@ -207,11 +419,62 @@ class SupabaseVectorDB:
         try:
             self.client.table(self.TABLE).upsert(row, on_conflict="property_id").execute()
             logger.info("Upserted embedding — property_id='%s'", property_id)
+            self._cache_put([row])
             return True
         except Exception as exc:
             logger.error("upsert_property failed for '%s': %s", property_id, exc)
             return False
 
+    def upsert_property_batch(self, rows: List[Dict[str, Any]]) -> bool:
+        if not self._guard():
+            return False
+
+        valid = []
+        for row in rows:
+            embedding = row.get("embedding") or []
+            if len(embedding) != self.DIM:
+                logger.error(
+                    "Embedding dimension mismatch for '%s': expected %d, got %d",
+                    row.get("property_id"), self.DIM, len(embedding),
+                )
+                continue
+            valid.append({
+                "property_id": row["property_id"],
+                "address": row.get("address", ""),
+                "embedding": embedding,
+                "image_url": row.get("image_url") or "",
+                "metadata": row.get("metadata") or {},
+            })
+
+        if not valid:
+            return False
+        try:
+            self.client.table(self.TABLE).upsert(valid, on_conflict="property_id").execute()
+            logger.info("Upserted %d embeddings in one batch", len(valid))
+            self._cache_put(valid)
+            return True
+        except Exception as exc:
+            logger.error("upsert_property_batch failed (%d rows): %s", len(valid), exc)
+            return False
+
+    @staticmethod
+    def configure_hnsw_params(vector_count: int) -> Dict[str, int]:
+        # Larger tables need a wider graph and beam to hold recall; small
+        # ones answer faster with a narrow search.
+        if vector_count < 100_000:
+            m, ef_construction, ef_search = 16, 64, 40
+        elif vector_count < 1_000_000:
+            m, ef_construction, ef_search = 24, 100, 100
+        else:
+            m, ef_construction, ef_search = 32, 128, 200
+        return {"m": m, "ef_construction": ef_construction, "ef_search": ef_search}
+
+    def _vector_count(self) -> int:
+        if time.monotonic() - self._count_cached_at > _COUNT_TTL_S:
+            self._count = self.get_stats().get("total_embeddings", self._count)
+            self._count_cached_at = time.monotonic()
+        return self._count
+
     def similarity_search(
         self,
         query_embedding: List[float],
@@ -221,6 +484,29 @@ class SupabaseVectorDB:
         if not self._guard():
             return []
 
+        ef_search = self.configure_hnsw_params(self._vector_count())["ef_search"]
+        ef_search = max(ef_search, limit)
+
+        if _TWO_STAGE:
+            try:
+                resp = self.client.rpc(
+                    "match_property_embeddings_bq",
+                    {
+                        "query_embedding": query_embedding,
+                        "match_threshold": threshold,
+                        "match_count": limit,
+                        "candidate_factor": _TWO_STAGE_FACTOR,
+                        "ef_search": max(ef_search, limit * _TWO_STAGE_FACTOR),
+                    },
+                ).execute()
+                return resp.data or []
+            except Exception as exc:
+                logger.warning(
+                    "RPC 'match_property_embeddings_bq' unavailable (%s). "
+                    "Falling back to single-stage search.",
+                    exc,
+                )
+
         try:
             resp = self.client.rpc(
                 "match_property_embeddings",
@@ -228,6 +514,7 @@ class SupabaseVectorDB:
                     "query_embedding": query_embedding,
                     "match_threshold": threshold,
                     "match_count": limit,
+                    "ef_search": ef_search,
                 },
             ).execute()
             logger.info(
@@ -238,6 +525,23 @@ class SupabaseVectorDB:
         except Exception as exc:
             logger.warning(
                 "RPC 'match_property_embeddings' unavailable (%s). "
+                "Trying 'match_property_embeddings_direct'.",
+                exc,
+            )
+
+        try:
+            resp = self.client.rpc(
+                "match_property_embeddings_direct",
+                {
+                    "query_embedding": query_embedding,
+                    "match_count": limit,
+                    "ef_search": ef_search,
+                },
+            ).execute()
+            return [r for r in resp.data or [] if r.get("similarity", 0) >= threshold]
+        except Exception as exc:
+            logger.warning(
+                "RPC 'match_property_embeddings_direct' unavailable (%s). "
                 "Run supabase_setup.sql to create it. "
                 "Falling back to Python linear scan (NOT production-ready).",
                 exc,
@@ -261,12 +565,29 @@ class SupabaseVectorDB:
             logger.error("get_by_property_id('%s') failed: %s", property_id, exc)
             return None
 
+    def get_property_image_url(self, property_id: str) -> Optional[str]:
+        if not self._guard():
+            return None
+        try:
+            resp = (
+                self.client.table(self.TABLE)
+                .select("image_url")
+                .eq("property_id", property_id)
+                .limit(1)
+                .execute()
+            )
+            return resp.data[0].get("image_url") if resp.data else None
+        except Exception as exc:
+            logger.error("get_property_image_url('%s') failed: %s", property_id, exc)
+            return None
+
     def delete_property(self, property_id: str) -> bool:
         if not self._guard():
             return False
         try:
             self.client.table(self.TABLE).delete().eq("property_id", property_id).execute()
             logger.info("Deleted embedding — property_id='%s'", property_id)
+            self._cache_remove(property_id)
             return True
         except Exception as exc:
             logger.error("delete_property('%s') failed: %s", property_id, exc)
@@ -292,14 +613,35 @@ class SupabaseVectorDB:
             return False
         return True
 
-    def _python_scan(
-        self,
-        query_vec: List[float],
-        limit: int,
-        threshold: float,
-    ) -> List[Dict[str, Any]]:
-        import numpy as np
+    # Fallback scan cache: row-normalised float32 matrix plus aligned metadata, built on the first
+    # fallback scan and kept in step with upserts/deletes made through this
+    # client. Writes from other processes show up after _SCAN_CACHE_TTL_S,
+    # or at once after refresh_cache(). Updates replace
+    # the matrix and list rather than mutating them, since a scan keeps
+    # using its snapshot after releasing the lock.
+
+    def refresh_cache(self) -> None:
+        with self._cache_lock:
+            self._cache_M = None
+            self._cache_meta = []
+            self._cache_index = {}
+
+    @staticmethod
+    def _unit_row(embedding: Any) -> Optional[np.ndarray]:
+        if isinstance(embedding, str):
+            embedding = json.loads(embedding)
+        if not embedding or len(embedding) != SupabaseVectorDB.DIM:
+            return None
+        v = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(v)
+        if norm < 1e-8:
+            return None
+        v /= norm
+        if _SCAN_INT8:
+            return np.round(v * _SCAN_Q_SCALE).astype(np.int8)
+        return v
 
+    def _load_cache_locked(self) -> bool:
         try:
             resp = (
                 self.client.table(self.TABLE)
@@ -309,34 +651,121 @@ class SupabaseVectorDB:
             rows = resp.data or []
         except Exception as exc:
             logger.error("Python scan fetch failed: %s", exc)
-            return []
+            return False
+
+        meta, vecs = [], []
+        for row in rows:
+            v = self._unit_row(row.pop("embedding", None))
+            if v is None:
+                continue
+            meta.append(row)
+            vecs.append(v)
+
+        self._cache_M = (
+            np.vstack(vecs) if vecs else np.empty((0, self.DIM), dtype=_SCAN_DTYPE)
+        )
+        self._cache_meta = meta
+        self._cache_index = {m["property_id"]: i for i, m in enumerate(meta)}
+        self._cache_loaded_at = time.monotonic()
+        logger.info("Fallback scan cache built with %d embeddings", len(meta))
+        return True
+
+    def _cache_put(self, rows: List[Dict[str, Any]]) -> None:
+        with self._cache_lock:
+            if self._cache_M is None:
+                return
+            M, meta = self._cache_M, list(self._cache_meta)
+            index = dict(self._cache_index)
+            replaced, appended = {}, []
+            for row in rows:
+                v = self._unit_row(row.get("embedding"))
+                if v is None:
+                    continue
+                entry = {
+                    "property_id": row["property_id"],
+                    "address": row.get("address", ""),
+                    "image_url": row.get("image_url") or "",
+                    "metadata": row.get("metadata") or {},
+                }
+                idx = index.get(entry["property_id"])
+                if idx is not None:
+                    replaced[idx] = v
+                    meta[idx] = entry
+                else:
+                    index[entry["property_id"]] = len(meta)
+                    meta.append(entry)
+                    appended.append(v)
+            if replaced:
+                M = M.copy()
+                for idx, v in replaced.items():
+                    M[idx] = v
+            if appended:
+                M = np.vstack([M, *appended])
+            self._cache_M, self._cache_meta, self._cache_index = M, meta, index
+
+    def _cache_remove(self, property_id: str) -> None:
+        with self._cache_lock:
+            if self._cache_M is None:
+                return
+            idx = self._cache_index.get(property_id)
+            if idx is None:
+                return
+            meta = self._cache_meta[:idx] + self._cache_meta[idx + 1:]
+            self._cache_M = np.delete(self._cache_M, idx, axis=0)
+            self._cache_meta = meta
+            self._cache_index = {m["property_id"]: i for i, m in enumerate(meta)}
 
+    def _python_scan(
+        self,
+        query_vec: List[float],
+        limit: int,
+        threshold: float,
+    ) -> List[Dict[str, Any]]:
         q = np.array(query_vec, dtype=np.float32)
         q_norm = np.linalg.norm(q)
         if q_norm < 1e-8:
             return []
 
-        scored = []
-        for row in rows:
-            emb = row.get("embedding")
-            if not emb:
-                continue
-            v = np.array(emb, dtype=np.float32)
-            v_norm = np.linalg.norm(v)
-            if v_norm < 1e-8:
-                continue
-            sim = float(np.dot(q, v) / (q_norm * v_norm))
-            if sim >= threshold:
-                scored.append({
-                    "property_id": row["property_id"],
-                    "address": row["address"],
-                    "image_url": row.get("image_url", ""),
-                    "metadata": row.get("metadata", {}),
-                    "similarity": round(sim, 4),
-                })
-
-        scored.sort(key=lambda x: x["similarity"], reverse=True)
-        return scored[:limit]
+        with self._cache_lock:
+            stale = time.monotonic() - self._cache_loaded_at > _SCAN_CACHE_TTL_S
+            if self._cache_M is None or stale:
+                # A failed rebuild keeps serving the previous snapshot.
+                if not self._load_cache_locked() and self._cache_M is None:
+                    return []
+            M, meta = self._cache_M, self._cache_meta
+
+        # One (N, DIM) matrix and a single matvec instead of per-row numpy calls.
+        q_hat = q / q_norm
+        if _SCAN_INT8:
+            # NumPy has no int8 BLAS path, so upcast in bounded blocks and
+            # let sgemv do the work.
+            sims = np.empty(len(M), dtype=np.float32)
+            for b in range(0, len(M), _SCAN_BLOCK_ROWS):
+                block = M[b:b + _SCAN_BLOCK_ROWS].astype(np.float32)
+                sims[b:b + _SCAN_BLOCK_ROWS] = block @ q_hat
+            sims /= _SCAN_Q_SCALE
+        else:
+            sims = M @ q_hat
+
+        k = min(limit, len(sims))
+        if k <= 0:
+            return []
+        top = np.argpartition(-sims, k - 1)[:k]
+        top = top[np.argsort(-sims[top], kind="stable")]
 
+        scored = []
+        for i in top:
+            sim = float(sims[i])
+            if sim < threshold:
+                break
+            row = meta[i]
+            scored.append({
+                "property_id": row["property_id"],
+                "address": row["address"],
+                "image_url": row.get("image_url", ""),
+                "metadata": row.get("metadata", {}),
+                "similarity": round(sim, 4),
+            })
+        return scored
 
 vector_db = SupabaseVectorDB()
\ No newline at end of file
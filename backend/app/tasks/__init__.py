@@ -1,17 +1,20 @@
-from .agent_tasks import process_agent_query_task
-from .geospatial_tasks import analyze_neighborhood_task
-from .maintenance_tasks import (
-    cleanup_old_tasks, 
-    update_analysis_results, 
-    archive_old_results
-)
-from .satellite_tasks import analyze_satellite_task
+import importlib
 
-__all__ = [
-    'process_agent_query_task',
-    'analyze_neighborhood_task',
-    'cleanup_old_tasks',
-    'update_analysis_results',
-    'archive_old_results',
-    'analyze_satellite_task'
-]
\ No newline at end of file
+# Task modules are imported on first access so a worker only loads the ones
+# listed in its CELERY_IMPORTS (and their heavy dependencies).
+_EXPORTS = {
+    'process_agent_query_task': 'agent_tasks',
+    'analyze_neighborhood_task': 'geospatial_tasks',
+    'cleanup_old_tasks': 'maintenance_tasks',
+    'update_analysis_results': 'maintenance_tasks',
+    'archive_old_results': 'maintenance_tasks',
+    'analyze_satellite_task': 'satellite_tasks',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(f".{_EXPORTS[name]}", __name__), name)
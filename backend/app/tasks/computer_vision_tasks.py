@@ -6,32 +6,50 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# Safety bound only: the OSM stitches from get_osm_map_area are 256 or 512 px
+# and never hit it, but a larger image handed in directly is analysed at this
+# size. INTER_NEAREST keeps the map's flat fill colours intact for the colour
+# ranges; area averaging would invent blended edge colours that classify
+# differently.
+ANALYSIS_MAX_SIDE = 512
 
-def analyze_osm_green_spaces(image_path: str, analysis_id: str) -> Optional[Dict]:
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "results")
+os.makedirs(RESULTS_DIR, exist_ok=True)
+
+
+def analyze_osm_green_spaces(
+    image_path: str, analysis_id: str, with_visualization: bool = True
+) -> Optional[Dict]:
     try:
         image = cv2.imread(image_path)
         if image is None:
             logger.error(f"Failed to read image: {image_path}")
             return None
 
-        image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        scale = ANALYSIS_MAX_SIDE / max(image.shape[:2])
+        if scale < 1:
+            image = cv2.resize(
+                image, None, fx=scale, fy=scale, interpolation=cv2.INTER_NEAREST
+            )
 
-        green_masks = detect_osm_green_areas_fixed(image_rgb)
+        green_masks = detect_osm_green_areas_fixed(image)
         combined_mask = combine_green_masks(green_masks)
 
         total_pixels = image.shape[0] * image.shape[1]
-        green_pixels = np.sum(combined_mask > 0)
+        green_pixels = cv2.countNonZero(combined_mask)
         green_percentage = (green_pixels / total_pixels) * 100
 
         breakdown = {}
         for green_type, mask in green_masks.items():
-            type_pixels = np.sum(mask > 0)
+            type_pixels = cv2.countNonZero(mask)
             type_pct = (type_pixels / total_pixels) * 100
             breakdown[green_type] = round(type_pct, 2)
 
-        visualization_path = create_osm_green_visualization(
-            image_rgb, combined_mask, green_masks, green_percentage, analysis_id
-        )
+        visualization_path = None
+        if with_visualization:
+            visualization_path = create_osm_green_visualization(
+                image, combined_mask, green_masks, green_percentage, analysis_id
+            )
 
         return {
             "green_space_percentage": round(green_percentage, 2),
@@ -51,73 +69,85 @@ def hex_to_rgb(hex_color: str) -> Tuple[int, int, int]:
     return tuple(int(hex_color[i:i + 2], 16) for i in (0, 2, 4))
 
 
+GREEN_RANGES = {
+    "parks_grass": {
+        "rgb_ranges": [
+            ((180, 230, 180), (230, 255, 230)),
+            ((190, 240, 190), (210, 255, 210)),
+            ((195, 225, 155), (215, 245, 175)),
+        ],
+        "hsv_ranges": [
+            ((30, 15, 150), (90, 100, 255)),
+            ((35, 20, 180), (75, 80, 255)),
+        ],
+    },
+    "forests_woods": {
+        "rgb_ranges": [
+            ((120, 180, 100), (180, 220, 180)),
+            ((130, 190, 150), (180, 215, 170)),
+            ((100, 170, 90), (160, 210, 140)),
+        ],
+        "hsv_ranges": [
+            ((30, 25, 120), (90, 150, 230)),
+            ((35, 30, 100), (80, 130, 220)),
+        ],
+    },
+    "recreation": {
+        "rgb_ranges": [
+            ((165, 200, 150), (185, 220, 170)),
+            ((150, 190, 140), (180, 215, 165)),
+        ],
+        "hsv_ranges": [
+            ((32, 20, 150), (75, 90, 230)),
+        ],
+    },
+    "natural_areas": {
+        "rgb_ranges": [
+            ((210, 235, 200), (230, 250, 225)),
+            ((200, 230, 190), (225, 245, 220)),
+        ],
+        "hsv_ranges": [
+            ((30, 10, 180), (85, 60, 255)),
+        ],
+    },
+}
+
+
+# Range bounds as uint8 arrays, built once at import: (bgr_bounds, hsv_bounds)
+# per class, each a list of (lower, upper). The RGB ranges are flipped to BGR
+# so tiles from cv2.imread need no channel swap.
+_GREEN_BOUNDS = [
+    (
+        [
+            (np.array(lower[::-1], dtype=np.uint8), np.array(upper[::-1], dtype=np.uint8))
+            for lower, upper in ranges.get("rgb_ranges", [])
+        ],
+        [
+            (np.array(lower, dtype=np.uint8), np.array(upper, dtype=np.uint8))
+            for lower, upper in ranges.get("hsv_ranges", [])
+        ],
+    )
+    for ranges in GREEN_RANGES.values()
+]
+
+_MORPH_KERNEL = np.ones((5, 5), np.uint8)
+
+
 def detect_osm_green_areas_fixed(image: np.ndarray) -> Dict[str, np.ndarray]:
+    # `image` is BGR as loaded by cv2.imread.
     green_masks = {}
 
-    hsv = cv2.cvtColor(image, cv2.COLOR_RGB2HSV)
-    rgb = image.copy()
-
-    green_ranges = {
-        "parks_grass": {
-            "rgb_ranges": [
-                ((180, 230, 180), (230, 255, 230)),
-                ((190, 240, 190), (210, 255, 210)),
-                ((195, 225, 155), (215, 245, 175)),
-            ],
-            "hsv_ranges": [
-                ((30, 15, 150), (90, 100, 255)),
-                ((35, 20, 180), (75, 80, 255)),
-            ],
-        },
-        "forests_woods": {
-            "rgb_ranges": [
-                ((120, 180, 100), (180, 220, 180)),
-                ((130, 190, 150), (180, 215, 170)),
-                ((100, 170, 90), (160, 210, 140)),
-            ],
-            "hsv_ranges": [
-                ((30, 25, 120), (90, 150, 230)),
-                ((35, 30, 100), (80, 130, 220)),
-            ],
-        },
-        "recreation": {
-            "rgb_ranges": [
-                ((165, 200, 150), (185, 220, 170)),
-                ((150, 190, 140), (180, 215, 165)),
-            ],
-            "hsv_ranges": [
-                ((32, 20, 150), (75, 90, 230)),
-            ],
-        },
-        "natural_areas": {
-            "rgb_ranges": [
-                ((210, 235, 200), (230, 250, 225)),
-                ((200, 230, 190), (225, 245, 220)),
-            ],
-            "hsv_ranges": [
-                ((30, 10, 180), (85, 60, 255)),
-            ],
-        },
-    }
-
-    for green_type, ranges in green_ranges.items():
-        type_mask = np.zeros((image.shape[0], image.shape[1]), dtype=np.uint8)
-
-        for lower, upper in ranges.get("rgb_ranges", []):
-            lower_rgb = np.array(lower, dtype=np.uint8)
-            upper_rgb = np.array(upper, dtype=np.uint8)
-            mask = cv2.inRange(rgb, lower_rgb, upper_rgb)
-            type_mask = cv2.bitwise_or(type_mask, mask)
-
-        for lower, upper in ranges.get("hsv_ranges", []):
-            lower_hsv = np.array(lower, dtype=np.uint8)
-            upper_hsv = np.array(upper, dtype=np.uint8)
-            mask = cv2.inRange(hsv, lower_hsv, upper_hsv)
-            type_mask = cv2.bitwise_or(type_mask, mask)
-
-        kernel = np.ones((5, 5), np.uint8)
-        type_mask = cv2.morphologyEx(type_mask, cv2.MORPH_CLOSE, kernel)
-        type_mask = cv2.morphologyEx(type_mask, cv2.MORPH_OPEN, kernel)
+    hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+
+    for green_type, (bgr_bounds, hsv_bounds) in zip(GREEN_RANGES, _GREEN_BOUNDS):
+        type_mask = np.zeros(image.shape[:2], dtype=np.uint8)
+        for lower, upper in bgr_bounds:
+            cv2.bitwise_or(type_mask, cv2.inRange(image, lower, upper), dst=type_mask)
+        for lower, upper in hsv_bounds:
+            cv2.bitwise_or(type_mask, cv2.inRange(hsv, lower, upper), dst=type_mask)
+
+        cv2.morphologyEx(type_mask, cv2.MORPH_CLOSE, _MORPH_KERNEL, dst=type_mask)
+        cv2.morphologyEx(type_mask, cv2.MORPH_OPEN, _MORPH_KERNEL, dst=type_mask)
 
         green_masks[green_type] = type_mask
 
@@ -125,13 +155,14 @@ def detect_osm_green_areas_fixed(image: np.ndarray) -> Dict[str, np.ndarray]:
 
 
 def combine_green_masks(green_masks: Dict[str, np.ndarray]) -> np.ndarray:
-    combined = None
-    for mask in green_masks.values():
-        if combined is None:
-            combined = mask.copy()
-        else:
-            combined = cv2.bitwise_or(combined, mask)
-    return combined if combined is not None else np.zeros((100, 100), dtype=np.uint8)
+    masks = iter(green_masks.values())
+    combined = next(masks, None)
+    if combined is None:
+        return np.zeros((100, 100), dtype=np.uint8)
+    combined = combined.copy()
+    for mask in masks:
+        cv2.bitwise_or(combined, mask, dst=combined)
+    return combined
 
 
 def create_osm_green_visualization(
@@ -142,18 +173,15 @@ def create_osm_green_visualization(
     analysis_id: str,
 ) -> str:
     try:
-        output_dir = os.path.join(os.path.dirname(__file__), "..", "..", "results")
-        os.makedirs(output_dir, exist_ok=True)
-
-        overlay = image.copy()
-        colored_overlay = np.zeros_like(image)
-
+        # BGR; forest green is symmetric in R/B so it reads the same either way.
         pear_green = [34, 139, 34]
 
-        colored_overlay[combined_mask > 0] = pear_green
+        colored_overlay = np.zeros_like(image)
+        colored_overlay[:] = pear_green
+        colored_overlay = cv2.bitwise_and(colored_overlay, colored_overlay, mask=combined_mask)
 
         alpha = 0.5
-        blended = cv2.addWeighted(overlay, 1 - alpha, colored_overlay, alpha, 0)
+        blended = cv2.addWeighted(image, 1 - alpha, colored_overlay, alpha, 0)
 
         contours, _ = cv2.findContours(
             combined_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
@@ -168,7 +196,7 @@ def create_osm_green_visualization(
         cv2.putText(blended, main_text, (20, 40), font, 1, (255, 255, 255), 2)
 
         output_filename = f"osm_green_space_{analysis_id}.png"
-        output_path = os.path.join(output_dir, output_filename)
+        output_path = os.path.join(RESULTS_DIR, output_filename)
 
         height, width = blended.shape[:2]
         resized = cv2.resize(
@@ -177,8 +205,9 @@ def create_osm_green_visualization(
             interpolation=cv2.INTER_AREA,
         )
 
-        resized_bgr = cv2.cvtColor(resized, cv2.COLOR_RGB2BGR)
-        cv2.imwrite(output_path, resized_bgr)
+        # Level 1 is several times faster to encode than libpng's default 6
+        # for a modestly larger file.
+        cv2.imwrite(output_path, resized, [cv2.IMWRITE_PNG_COMPRESSION, 1])
 
         return f"results/{output_filename}"
 
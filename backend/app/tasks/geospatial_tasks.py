@@ -1,48 +1,18 @@
 import os
 import traceback
-from celery import shared_task
-from app.geospatial import OpenStreetMapClient, calculate_walk_score
-from app.database import get_sync_database
-from typing import Dict
+from celery import chord, shared_task
+from app.geospatial import (
+    OpenStreetMapClient, calculate_walk_score, get_geocoder, map_filename, summarize_amenities,
+)
+from app.database import (
+    analysis_finished_sync, get_shared_sync_database, update_analysis_status_sync,
+)
+from typing import Dict, List
 from datetime import datetime
-from bson import ObjectId
-
-PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-MAPS_DIR = os.path.join(PROJECT_ROOT, "maps")
-
-
-def update_analysis_status_sync(db, analysis_id: str, status: str, updates: Dict = None):
-    try:
-        update_data = {
-            "status": status,
-            "updated_at": datetime.now()
-        }
-        if updates:
-            update_data.update(updates)
-
-        try:
-            obj_id = ObjectId(analysis_id)
-            result = db.neighborhood_analyses.update_one(
-                {"_id": obj_id},
-                {"$set": update_data}
-            )
-        except Exception:
-            result = db.neighborhood_analyses.update_one(
-                {"_id": analysis_id},
-                {"$set": update_data}
-            )
-
-        if result.modified_count > 0:
-            print(f" Updated analysis {analysis_id} to status: {status}")
-        else:
-            print(f" No documents updated for analysis ID: {analysis_id}")
-
-    except Exception as e:
-        print(f" Error updating analysis status: {e}")
 
 
 def _run_green_space_sync(coordinates, radius_m: int, analysis_id: str) -> Dict:
-    from app.geospatial import get_osm_map_area
+    from app.geospatial import discard_map_area, get_osm_map_area
     from app.tasks.computer_vision_tasks import analyze_osm_green_spaces
 
     lat, lon = coordinates
@@ -61,130 +31,136 @@ def _run_green_space_sync(coordinates, radius_m: int, analysis_id: str) -> Dict:
         print(f" Green-space analysis failed (non-critical): {exc}")
         return {}
     finally:
-        if map_path and os.path.exists(map_path):
-            try:
-                os.unlink(map_path)
-            except Exception:
-                pass
+        discard_map_area(map_path)
 
 
+# analyze_neighborhood geocodes, then replaces itself with a chord: the
+# amenity, green-space and building stages run in parallel (on whichever
+# workers serve their queues) and finalize_neighborhood assembles the result
+# under the original task id. Each stage retries on its own, so a transient
+# Overpass failure no longer reruns the green-space CV.
 @shared_task(bind=True, name="analyze_neighborhood")
 def analyze_neighborhood_task(self, analysis_id: str, request_data: Dict) -> Dict:
 
-    mongo_client = None  
     db = None
-    map_path = None
-
     try:
-        
-        mongo_client, db = get_sync_database()
+        db = get_shared_sync_database()
+        if analysis_finished_sync(db.neighborhood_analyses, analysis_id):
+            print(f"Analysis {analysis_id} already finished, skipping redelivery")
+            return {'analysis_id': analysis_id, 'status': 'skipped'}
 
         self.update_state(state='PROGRESS', meta={
             'status': 'Geocoding address...',
             'progress': 5
         })
-        update_analysis_status_sync(db, analysis_id, 'processing', {'progress': 5})
-
-        osm_client = OpenStreetMapClient()
+        update_analysis_status_sync(db.neighborhood_analyses, analysis_id, 'processing', {'progress': 5})
 
         address = request_data.get('address')
         radius_m = request_data.get('radius_m', 1000)
         amenity_types = request_data.get('amenity_types')
         include_buildings = request_data.get('include_buildings', True)
-        generate_map = request_data.get('generate_map', True)
+
+        coordinates = get_geocoder().address_to_coordinates(address)
+        if not coordinates:
+            raise Exception("Could not geocode address")
 
         self.update_state(state='PROGRESS', meta={
-            'status': 'Fetching amenities from OpenStreetMap...',
+            'status': 'Fetching amenities, buildings and green space...',
             'progress': 20
         })
-        update_analysis_status_sync(db, analysis_id, 'processing', {'progress': 20})
 
-        amenities_data = osm_client.get_nearby_amenities(
+        stages = [
+            neighborhood_amenities_task.s(address, coordinates, radius_m, amenity_types),
+            neighborhood_green_space_task.s(coordinates, radius_m, analysis_id),
+        ]
+        if include_buildings:
+            stages.append(neighborhood_buildings_task.s(address, radius_m))
+        # If a stage dies for good (time limit, lost worker, retries used up)
+        # finalize never runs, so the errback marks the analysis failed.
+        pipeline = chord(
+            stages,
+            finalize_neighborhood_task.s(analysis_id, request_data, coordinates)
+            .on_error(neighborhood_failed_task.s(analysis_id)),
+        )
+
+    except Exception as e:
+        return _fail_analysis(db, analysis_id, e)
+
+    raise self.replace(pipeline)
+
+
+@shared_task(bind=True, name="neighborhood_amenities", max_retries=3)
+def neighborhood_amenities_task(self, address: str, coordinates, radius_m: int, amenity_types) -> Dict:
+    try:
+        data = OpenStreetMapClient().query_amenities(
+            address, tuple(coordinates), radius_m, amenity_types
+        )
+    except Exception as e:
+        data = {"error": f"Failed to get amenities: {e}", "address": address}
+
+    if "error" in data and self.request.retries < self.max_retries:
+        print(f" Amenity fetch failed ({data['error']}), retrying")
+        raise self.retry(countdown=2 ** self.request.retries)
+    return data
+
+
+@shared_task(bind=True, name="neighborhood_buildings", max_retries=1)
+def neighborhood_buildings_task(self, address: str, radius_m: int) -> List:
+    try:
+        data = OpenStreetMapClient().get_building_footprints(
             address=address,
-            radius=radius_m,
-            amenity_types=amenity_types
+            radius=min(radius_m, 500)
         )
+    except Exception as e:
+        data = {"error": str(e)}
+
+    if "error" in data:
+        if self.request.retries < self.max_retries:
+            raise self.retry(countdown=2)
+        print(f" Building footprints failed: {data['error']}")
+        return []
+    return data.get("buildings", [])
+
+
+@shared_task(name="neighborhood_green_space")
+def neighborhood_green_space_task(coordinates, radius_m: int, analysis_id: str) -> Dict:
+    return _run_green_space_sync(coordinates, radius_m, analysis_id)
+
+
+@shared_task(bind=True, name="finalize_neighborhood")
+def finalize_neighborhood_task(
+    self, stage_results: List, analysis_id: str, request_data: Dict, coordinates
+) -> Dict:
+
+    db = None
+    try:
+        db = get_shared_sync_database()
+
+        amenities_data, green_space_data = stage_results[0], stage_results[1] or {}
+        building_footprints = stage_results[2] if len(stage_results) > 2 else []
 
         if "error" in amenities_data:
             raise Exception(amenities_data["error"])
 
+        address = request_data.get('address')
+        generate_map = request_data.get('generate_map', True)
+
+        gs_pct = green_space_data.get("green_space_percentage", "n/a")
+        print(f" Green space: {gs_pct}%")
+
         self.update_state(state='PROGRESS', meta={
             'status': 'Calculating walk score...',
-            'progress': 50
+            'progress': 90
         })
-        update_analysis_status_sync(db, analysis_id, 'processing', {'progress': 50})
-
-        coordinates = amenities_data.get("coordinates")
-        walk_score = None
-        if coordinates:
-            walk_score = calculate_walk_score(coordinates, amenities_data)
-
-        green_space_data: Dict = {}
-        if coordinates:
-            self.update_state(state='PROGRESS', meta={
-                'status': 'Analysing green spaces…',
-                'progress': 55
-            })
-            update_analysis_status_sync(db, analysis_id, 'processing', {'progress': 55})
-            green_space_data = _run_green_space_sync(coordinates, radius_m, analysis_id)
-            gs_pct = green_space_data.get("green_space_percentage", "n/a")
-            print(f" Green space: {gs_pct}%")
-
-        building_footprints = []
-        if include_buildings:
-            self.update_state(state='PROGRESS', meta={
-                'status': 'Analyzing building footprints...',
-                'progress': 65
-            })
-            update_analysis_status_sync(db, analysis_id, 'processing', {'progress': 65})
-
-            try:
-                buildings_data = osm_client.get_building_footprints(
-                    address=address,
-                    radius=min(radius_m, 500)
-                )
-                if "error" not in buildings_data:
-                    building_footprints = buildings_data.get("buildings", [])
-            except Exception as e:
-                print(f" Building footprints failed: {e}")
-
-        if generate_map and coordinates:
-            self.update_state(state='PROGRESS', meta={
-                'status': 'Generating interactive map...',
-                'progress': 80
-            })
-            update_analysis_status_sync(db, analysis_id, 'processing', {'progress': 80})
-
-            try:
-                os.makedirs(MAPS_DIR, exist_ok=True)
-
-                map_filename = f"neighborhood_{analysis_id.replace('-', '_')}.html"
-                map_absolute_path = os.path.join(MAPS_DIR, map_filename)
-
-                print(f"Generating map at: {map_absolute_path}")
-
-                result_path = osm_client.create_map_visualization(
-                    address=address,
-                    amenities_data=amenities_data,
-                    save_path=map_absolute_path
-                )
-
-                if result_path and os.path.exists(result_path):
-                    map_path = f"maps/{map_filename}"
-                    print(f"  Map created successfully: {map_path}")
-                    print(f"   Absolute path: {result_path}")
-                    print(f"   Size: {os.path.getsize(result_path):,} bytes")
-                else:
-                    print(f" Map generation returned no valid path")
-                    map_path = None
-
-            except Exception as map_error:
-                print(f"Map generation failed: {map_error}")
-                traceback.print_exc()
-                map_path = None
+
+        walk_score = calculate_walk_score(coordinates, amenities_data)
+
+        # The HTML map is rendered on first request by GET /{id}/map.
+        map_path = f"maps/{map_filename(analysis_id)}" if generate_map else None
 
         amenities = amenities_data.get("amenities", {})
-        total_amenities = sum(len(items) for items in amenities.values())
+        total_amenities = sum(map(len, amenities.values()))
+        amenity_counts, amenity_samples = summarize_amenities(amenities)
 
         results = {
             'analysis_id': analysis_id,
@@ -195,7 +171,8 @@ def analyze_neighborhood_task(self, analysis_id: str, request_data: Dict) -> Dic
             'building_count': len(building_footprints),
             'map_path': map_path,
             'coordinates': coordinates,
-            'amenities': amenities,
+            'amenity_counts': amenity_counts,
+            'amenity_samples': amenity_samples,
             'green_space_percentage':    green_space_data.get('green_space_percentage'),
             'green_space_breakdown':     green_space_data.get('breakdown'),
             'green_space_visualization': green_space_data.get('visualization_path'),
@@ -209,8 +186,11 @@ def analyze_neighborhood_task(self, analysis_id: str, request_data: Dict) -> Dic
             'walk_score': walk_score,
             'map_path': map_path,
             'amenities': amenities,
+            'amenity_counts': amenity_counts,
+            'amenity_samples': amenity_samples,
             'building_footprints': building_footprints,
             'total_amenities': total_amenities,
+            'amenity_categories': len(amenities),
             'coordinates': coordinates,
             'green_space_percentage':    green_space_data.get('green_space_percentage'),
             'green_space_breakdown':     green_space_data.get('breakdown'),
@@ -221,40 +201,40 @@ def analyze_neighborhood_task(self, analysis_id: str, request_data: Dict) -> Dic
             'progress': 100
         }
 
-        update_analysis_status_sync(db, analysis_id, 'completed', update_data)
+        update_analysis_status_sync(db.neighborhood_analyses, analysis_id, 'completed', update_data)
 
         print(f"Analysis {analysis_id} completed successfully")
         print(f"Address: {address}")
         print(f"Amenities: {total_amenities}")
         print(f"Walk Score: {walk_score}")
-        print(f"Map: {' Created' if map_path else ' Not created'}")
 
         return results
 
     except Exception as e:
-        error_msg = str(e)
-        error_trace = traceback.format_exc()
+        return _fail_analysis(db, analysis_id, e)
 
-        print(f" Analysis failed: {error_msg}")
-        print(f"Traceback:\n{error_trace}")
 
-        if db is not None:
-            update_analysis_status_sync(db, analysis_id, 'failed', {
-                'error': error_msg,
-                'progress': 100
-            })
+@shared_task(name="neighborhood_failed")
+def neighborhood_failed_task(request, exc, traceback, analysis_id: str) -> Dict:
+    return _fail_analysis(get_shared_sync_database(), analysis_id, exc)
 
-        return {
-            'analysis_id': analysis_id,
-            'status': 'failed',
+
+def _fail_analysis(db, analysis_id: str, e: Exception) -> Dict:
+    error_msg = str(e)
+    error_trace = traceback.format_exc()
+
+    print(f" Analysis failed: {error_msg}")
+    print(f"Traceback:\n{error_trace}")
+
+    if db is not None:
+        update_analysis_status_sync(db.neighborhood_analyses, analysis_id, 'failed', {
             'error': error_msg,
-            'timestamp': datetime.now().isoformat()
-        }
+            'progress': 100
+        })
 
-    finally:
-       
-        if mongo_client is not None:
-            try:
-                mongo_client.close()
-            except Exception:
-                pass
\ No newline at end of file
+    return {
+        'analysis_id': analysis_id,
+        'status': 'failed',
+        'error': error_msg,
+        'timestamp': datetime.now().isoformat()
+    }
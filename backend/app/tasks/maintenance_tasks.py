@@ -7,14 +7,13 @@ import logging
 logger = logging.getLogger(__name__)
 
 
-@shared_task(bind=True, name="cleanup_old_tasks")
+@shared_task(bind=True, name="cleanup_old_tasks", ignore_result=True)
 def cleanup_old_tasks(self) -> Dict:
-    mongo_client = None
     try:
         self.update_state(state='PROGRESS', meta={'status': 'Cleaning up old analyses...'})
 
-        from app.database import get_sync_database
-        mongo_client, db = get_sync_database()
+        from app.database import get_shared_sync_database
+        db = get_shared_sync_database()
 
         cutoff = datetime.now() - timedelta(hours=24)
 
@@ -33,10 +32,15 @@ def cleanup_old_tasks(self) -> Dict:
         total = nbr_deleted + sat_deleted
         logger.info(f"Cleanup: removed {total} stale records")
 
+        from app.geospatial import prune_tile_cache
+        tiles_pruned = prune_tile_cache()
+        logger.info(f"Cleanup: pruned {tiles_pruned} cached map tiles")
+
         return {
             'task_id': self.request.id,
             'status': 'COMPLETED',
             'tasks_cleaned': total,
+            'tiles_pruned': tiles_pruned,
             'timestamp': datetime.now().isoformat()
         }
 
@@ -50,15 +54,8 @@ def cleanup_old_tasks(self) -> Dict:
             'timestamp': datetime.now().isoformat()
         }
 
-    finally:
-        if mongo_client is not None:
-            try:
-                mongo_client.close()
-            except Exception:
-                pass
-
 
-@shared_task(bind=True, name="update_analysis_results")
+@shared_task(bind=True, name="update_analysis_results", ignore_result=True)
 def update_analysis_results(self, analysis_id: str) -> Dict:
     logger.warning(
         "update_analysis_results called for %s — this task is deprecated. "
@@ -72,12 +69,11 @@ def update_analysis_results(self, analysis_id: str) -> Dict:
     }
 
 
-@shared_task(bind=True, name="archive_old_results")
+@shared_task(bind=True, name="archive_old_results", ignore_result=True)
 def archive_old_results(self, days_old: int = 30) -> Dict:
-    mongo_client = None
     try:
-        from app.database import get_sync_database
-        mongo_client, db = get_sync_database()
+        from app.database import get_shared_sync_database
+        db = get_shared_sync_database()
 
         cutoff = datetime.now() - timedelta(days=days_old)
 
@@ -106,9 +102,3 @@ def archive_old_results(self, days_old: int = 30) -> Dict:
             'timestamp': datetime.now().isoformat()
         }
 
-    finally:
-        if mongo_client is not None:
-            try:
-                mongo_client.close()
-            except Exception:
-                pass
\ No newline at end of file
@@ -1,6 +1,5 @@
 from celery import shared_task
 from datetime import datetime
-from bson import ObjectId
 import traceback
 import os
 import logging
@@ -14,21 +13,26 @@ PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(_
 def analyze_satellite_task(self, analysis_id: str, request_data: dict) -> dict:
 
     temp_path = None
-    mongo_client = None
+    db = None
 
     try:
-        from app.database import get_sync_database
+        from app.database import (
+            analysis_finished_sync, get_shared_sync_database, update_analysis_status_sync,
+        )
         from app.tasks.computer_vision_tasks import analyze_osm_green_spaces
         from app.geospatial import get_geocoder, get_osm_map_area
 
-        mongo_client, db = get_sync_database()
+        db = get_shared_sync_database()
+        if analysis_finished_sync(db.satellite_analyses, analysis_id):
+            logger.info(f"Satellite analysis {analysis_id} already finished, skipping redelivery")
+            return {'analysis_id': analysis_id, 'status': 'skipped'}
 
         self.update_state(state='PROGRESS', meta={
             'status': 'Geocoding address...',
             'progress': 10
         })
 
-        update_analysis_status_sync(db, analysis_id, 'processing', {'progress': 10})
+        update_analysis_status_sync(db.satellite_analyses, analysis_id, 'processing', {'progress': 10})
 
         address = request_data.get('address')
         radius_m = request_data.get('radius_m', 500)
@@ -46,7 +50,7 @@ def analyze_satellite_task(self, analysis_id: str, request_data: dict) -> dict:
             'progress': 30
         })
 
-        update_analysis_status_sync(db, analysis_id, 'processing', {
+        update_analysis_status_sync(db.satellite_analyses, analysis_id, 'processing', {
             'progress': 30,
             'coordinates': {'latitude': lat, 'longitude': lon}
         })
@@ -66,7 +70,7 @@ def analyze_satellite_task(self, analysis_id: str, request_data: dict) -> dict:
             'progress': 60
         })
 
-        update_analysis_status_sync(db, analysis_id, 'processing', {'progress': 60})
+        update_analysis_status_sync(db.satellite_analyses, analysis_id, 'processing', {'progress': 60})
 
         result = analyze_osm_green_spaces(temp_path, analysis_id)
 
@@ -92,7 +96,7 @@ def analyze_satellite_task(self, analysis_id: str, request_data: dict) -> dict:
                 'completed_at': datetime.now().isoformat()
             }
 
-            update_analysis_status_sync(db, analysis_id, 'completed', result_data)
+            update_analysis_status_sync(db.satellite_analyses, analysis_id, 'completed', result_data)
 
             logger.info(f" Satellite analysis {analysis_id} completed")
             logger.info(f"   Green Space: {green_space_pct:.1f}%")
@@ -108,16 +112,11 @@ def analyze_satellite_task(self, analysis_id: str, request_data: dict) -> dict:
         logger.error(f" Satellite analysis failed: {error_msg}")
         logger.error(f"Traceback:\n{error_trace}")
 
-        try:
-            from app.database import get_sync_database
-            _client, _db = get_sync_database()  
-            update_analysis_status_sync(_db, analysis_id, 'failed', {
+        if db is not None:
+            update_analysis_status_sync(db.satellite_analyses, analysis_id, 'failed', {
                 'error': error_msg,
                 'progress': 100
             })
-            _client.close()
-        except Exception:
-            pass
 
         return {
             'analysis_id': analysis_id,
@@ -127,45 +126,6 @@ def analyze_satellite_task(self, analysis_id: str, request_data: dict) -> dict:
         }
 
     finally:
-        if temp_path and os.path.exists(temp_path):
-            try:
-                os.unlink(temp_path)
-                logger.info(f" Cleaned up temp file: {temp_path}")
-            except Exception as cleanup_error:
-                logger.warning(f"Failed to cleanup temp file: {cleanup_error}")
-
-        if mongo_client is not None:
-            try:
-                mongo_client.close()
-            except Exception:
-                pass
-
-
-def update_analysis_status_sync(db, analysis_id: str, status: str, updates: dict = None):
-    try:
-        update_data = {
-            'status': status,
-            'updated_at': datetime.now()
-        }
-        if updates:
-            update_data.update(updates)
-
-        try:
-            obj_id = ObjectId(analysis_id)
-            result = db.satellite_analyses.update_one(
-                {"_id": obj_id},
-                {"$set": update_data}
-            )
-        except Exception:
-            result = db.satellite_analyses.update_one(
-                {"_id": analysis_id},
-                {"$set": update_data}
-            )
-
-        if result.modified_count > 0:
-            logger.info(f" Updated analysis {analysis_id} to status: {status}")
-        else:
-            logger.warning(f" No documents updated for analysis ID: {analysis_id}")
-
-    except Exception as e:
-        logger.error(f" Error updating analysis status: {e}")
\ No newline at end of file
+        if temp_path:
+            from app.geospatial import discard_map_area
+            discard_map_area(temp_path)
@@ -2,113 +2,199 @@ from __future__ import annotations
 
 import asyncio
 import logging
+import threading
 from datetime import datetime
-from typing import List
+from typing import Dict, List, Optional
 
 from celery import shared_task
 
 logger = logging.getLogger(__name__)
 
+EMBED_CHUNK = 32
+FETCH_BATCH = 200
+DOWNLOAD_CONCURRENCY = 16
+MAX_IMAGE_BYTES = 10 * 1024 * 1024
+DOWNLOAD_CHUNK = 65536
 
-@shared_task(bind=True, name="batch_embed_properties")
-def batch_embed_task(self, property_ids: List[str]) -> dict:
-    total = len(property_ids)
-    processed = 0
-    skipped = 0
-    errors = 0
+_PROPERTY_FIELDS = {
+    "id": 1, "image_url": 1, "image": 1, "address": 1, "city": 1,
+    "locality": 1, "region": 1, "price": 1, "bedrooms": 1,
+}
 
-    logger.info("Batch embed started — %d properties", total)
 
-    from app.database import get_sync_database
-    from app.supabase_client import vector_db
+_loops = threading.local()
 
-    db = get_sync_database()
 
-    for idx, prop_id in enumerate(property_ids, start=1):
-        try:
-            self.update_state(
-                state="PROGRESS",
-                meta={
-                    "progress": int(idx / total * 100),
-                    "processed": processed,
-                    "current": prop_id,
-                },
-            )
+def _worker_loop() -> asyncio.AbstractEventLoop:
+    # One event loop per worker thread, reused across tasks: the embedding
+    # service and its executor stay warm and no loop is built per task.
+    loop = getattr(_loops, "loop", None)
+    if loop is None or loop.is_closed():
+        loop = asyncio.new_event_loop()
+        _loops.loop = loop
+    return loop
 
-            from bson import ObjectId
-            try:
-                doc = db.properties.find_one({"_id": ObjectId(prop_id)})
-            except Exception:
-                doc = db.properties.find_one({"id": prop_id})
 
-            if not doc:
-                logger.warning("Property '%s' not found — skipping", prop_id)
-                skipped += 1
-                continue
+def _fetch_properties(db, property_ids: List[str]) -> Dict[str, dict]:
+    from bson import ObjectId
+    from bson.errors import InvalidId
 
-            image_url = doc.get("image_url") or doc.get("image") or ""
-            if not image_url:
-                logger.warning(
-                    "Property '%s' has no image_url — skipping. Add an image_url field to the property document.",
-                    prop_id,
-                )
-                skipped += 1
-                continue
-
-            import requests as req
-            resp = req.get(image_url, timeout=10)
-            resp.raise_for_status()
-            raw_bytes = resp.content
+    obj_ids, str_ids = [], []
+    for prop_id in property_ids:
+        try:
+            obj_ids.append(ObjectId(prop_id))
+        except (InvalidId, TypeError):
+            str_ids.append(prop_id)
+
+    docs: Dict[str, dict] = {}
+    if obj_ids:
+        cursor = db.properties.find(
+            {"_id": {"$in": obj_ids}}, _PROPERTY_FIELDS, batch_size=FETCH_BATCH
+        )
+        for doc in cursor:
+            docs[str(doc["_id"])] = doc
+    if str_ids:
+        cursor = db.properties.find(
+            {"id": {"$in": str_ids}}, _PROPERTY_FIELDS, batch_size=FETCH_BATCH
+        )
+        for doc in cursor:
+            docs[str(doc["id"])] = doc
+    return docs
+
+
+def _build_item(prop_id: str, doc: dict, image_url: str, raw: bytes) -> dict:
+    address = (
+        doc.get("address")
+        or doc.get("locality", "") + ", " + doc.get("city", "")
+    ).strip(", ")
+    return {
+        "property_id": str(prop_id),
+        "address": address,
+        "image_url": image_url,
+        "raw": raw,
+        "metadata": {
+            "price": doc.get("price"),
+            "bedrooms": doc.get("bedrooms"),
+            "city": doc.get("city"),
+            "locality": doc.get("locality") or doc.get("region", ""),
+        },
+    }
 
-            async def _embed():
-                from app.supabase_client import get_embedding_service
-                svc = await get_embedding_service()
-                return await svc.embed_bytes(raw_bytes)
 
-            embedding = asyncio.run(_embed())
+@shared_task(bind=True, name="batch_embed_properties")
+def batch_embed_task(self, property_ids: List[str]) -> dict:
+    total = len(property_ids)
+    counts = {"processed": 0, "skipped": 0, "errors": 0}
 
-            if embedding is None:
-                logger.error("Embedding returned None for '%s'", prop_id)
-                errors += 1
-                continue
+    logger.info("Batch embed started — %d properties", total)
 
-            address = (
-                doc.get("address")
-                or doc.get("locality", "") + ", " + doc.get("city", "")
-            ).strip(", ")
-
-            ok = vector_db.upsert_property(
-                property_id=str(prop_id),
-                address=address,
-                embedding=embedding,
-                image_url=image_url,
-                metadata={
-                    "price": doc.get("price"),
-                    "bedrooms": doc.get("bedrooms"),
-                    "city": doc.get("city"),
-                    "locality": doc.get("locality") or doc.get("region", ""),
-                },
-            )
+    from app.database import get_shared_sync_database
 
-            if ok:
-                processed += 1
-            else:
-                errors += 1
+    docs = _fetch_properties(get_shared_sync_database(), property_ids)
 
-        except Exception as exc:
-            logger.error("Error processing property '%s': %s", prop_id, exc)
-            errors += 1
-            continue
+    _worker_loop().run_until_complete(_embed_all(self, property_ids, docs, counts))
 
     result = {
         "task_id": self.request.id,
         "status": "completed",
         "total": total,
-        "processed": processed,
-        "skipped": skipped,
-        "errors": errors,
+        **counts,
         "timestamp": datetime.now().isoformat(),
     }
 
     logger.info("Batch embed finished: %s", result)
-    return result
\ No newline at end of file
+    return result
+
+
+async def _embed_all(task, property_ids: List[str], docs: Dict[str, dict], counts: dict) -> None:
+    import httpx
+    from app.supabase_client import get_embedding_service, run_db, vector_db
+
+    total = len(property_ids)
+    svc = await get_embedding_service()
+    sem = asyncio.Semaphore(DOWNLOAD_CONCURRENCY)
+
+    async def _download(http: httpx.AsyncClient, prop_id: str) -> Optional[dict]:
+        doc = docs.get(prop_id)
+        if not doc:
+            logger.warning("Property '%s' not found — skipping", prop_id)
+            counts["skipped"] += 1
+            return None
+
+        image_url = doc.get("image_url") or doc.get("image") or ""
+        if not image_url:
+            logger.warning(
+                "Property '%s' has no image_url — skipping. Add an image_url field to the property document.",
+                prop_id,
+            )
+            counts["skipped"] += 1
+            return None
+
+        try:
+            async with sem, http.stream("GET", image_url) as resp:
+                resp.raise_for_status()
+                if int(resp.headers.get("content-length") or 0) > MAX_IMAGE_BYTES:
+                    raise ValueError("image exceeds size limit")
+                buf = bytearray()
+                async for chunk in resp.aiter_bytes(DOWNLOAD_CHUNK):
+                    buf.extend(chunk)
+                    if len(buf) > MAX_IMAGE_BYTES:
+                        raise ValueError("image exceeds size limit")
+        except Exception as exc:
+            logger.error("Error processing property '%s': %s", prop_id, exc)
+            counts["errors"] += 1
+            return None
+        return _build_item(prop_id, doc, image_url, bytes(buf))
+
+    def _prefetch(http: httpx.AsyncClient, start: int) -> Optional[asyncio.Future]:
+        chunk = property_ids[start:start + EMBED_CHUNK]
+        if not chunk:
+            return None
+        return asyncio.gather(*[_download(http, p) for p in chunk])
+
+    # The next chunk downloads while the current one is embedded and upserted.
+    async with httpx.AsyncClient(
+        timeout=10,
+        follow_redirects=True,
+        http2=True,
+        limits=httpx.Limits(
+            max_keepalive_connections=2 * DOWNLOAD_CONCURRENCY,
+            max_connections=2 * DOWNLOAD_CONCURRENCY,
+        ),
+    ) as http:
+        next_items = _prefetch(http, 0)
+        for start in range(0, total, EMBED_CHUNK):
+            task.update_state(
+                state="PROGRESS",
+                meta={
+                    "progress": int(start / total * 100),
+                    "processed": counts["processed"],
+                    "current": property_ids[start],
+                },
+            )
+
+            items = await next_items
+            next_items = _prefetch(http, start + EMBED_CHUNK)
+            pending = [item for item in items if item is not None]
+            if not pending:
+                continue
+
+            try:
+                embeddings = await svc.embed_batch([item.pop("raw") for item in pending])
+            except Exception as exc:
+                logger.error("Batch embedding failed for %d properties: %s", len(pending), exc)
+                counts["errors"] += len(pending)
+                continue
+
+            rows = []
+            for item, embedding in zip(pending, embeddings):
+                if embedding is None:
+                    logger.error("Embedding returned None for '%s'", item["property_id"])
+                    counts["errors"] += 1
+                    continue
+                rows.append({**item, "embedding": embedding})
+
+            if rows and await run_db(vector_db.upsert_property_batch, rows):
+                counts["processed"] += len(rows)
+            else:
+                counts["errors"] += len(rows)
@@ -1,11 +1,21 @@
-from fastapi import APIRouter, HTTPException, Request
-from typing import Dict, Any, Optional
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Request
+from pydantic import BaseModel, Field, ValidationError
+from typing import Dict, Any, List, Optional
 import httpx
 from datetime import datetime
 import asyncio
 import os
 import logging
 
+from .crud import create_neighborhood_analyses
+from .models import NeighborhoodAnalysisRequest
+from .routers.neighborhood import (
+    CELERY_AVAILABLE as NEIGHBORHOOD_CELERY,
+    _analyze_neighborhood_task,
+    build_analysis_doc,
+    schedule_in_process,
+)
+
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
@@ -14,40 +24,49 @@ SELF_BASE_URL = os.getenv("SELF_BASE_URL", "http://localhost:8000")
 
 DEFAULT_AMENITY_TYPES = ["restaurant", "cafe", "school", "hospital", "park", "supermarket"]
 
+# Fixed part of the analysis request sent for every workflow trigger.
+_TRIGGER_OPTIONS = {"include_buildings": False, "generate_map": True}
 
-@router.post("/trigger")
-async def trigger_analysis(payload: Dict[str, Any]):
 
-    address = payload.get("address")
-    if not address:
-        raise HTTPException(status_code=400, detail="address is required")
+class WorkflowTrigger(BaseModel):
+    address: str = Field(..., min_length=1)
+    radius_m: int = Field(default=1000, ge=100, le=5000)
+    amenity_types: Optional[List[str]] = None
 
-    radius_m = payload.get("radius_m", 1000)
-    if not isinstance(radius_m, int) or not (100 <= radius_m <= 5000):
-        radius_m = 1000
 
-    amenity_types = payload.get("amenity_types") or DEFAULT_AMENITY_TYPES
+def create_http_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        timeout=15.0,
+        limits=httpx.Limits(max_keepalive_connections=32, max_connections=64),
+    )
+
+
+@router.post("/trigger")
+async def trigger_analysis(trigger: WorkflowTrigger, request: Request):
+
+    address = trigger.address
+    radius_m = trigger.radius_m
+    amenity_types = trigger.amenity_types or DEFAULT_AMENITY_TYPES
 
     logger.info(f"[Workflow] Triggering analysis for: {address}, amenities: {amenity_types}")
 
-    async with httpx.AsyncClient(timeout=15.0) as client:
-        try:
-            resp = await client.post(
-                f"{SELF_BASE_URL}/api/neighborhood/analyze",
-                json={
-                    "address":           address,
-                    "radius_m":          radius_m,
-                    "amenity_types":     amenity_types,   
-                    "include_buildings": False,
-                    "generate_map":      True,
-                },
-            )
-            resp.raise_for_status()
-        except httpx.RequestError as exc:
-            raise HTTPException(status_code=503, detail=f"Backend unreachable: {exc}")
-        except httpx.HTTPStatusError as exc:
-            raise HTTPException(status_code=exc.response.status_code,
-                                detail=exc.response.text)
+    client = request.app.state.http
+    try:
+        resp = await client.post(
+            f"{SELF_BASE_URL}/api/neighborhood/analyze",
+            json={
+                "address":       address,
+                "radius_m":      radius_m,
+                "amenity_types": amenity_types,
+                **_TRIGGER_OPTIONS,
+            },
+        )
+        resp.raise_for_status()
+    except httpx.RequestError as exc:
+        raise HTTPException(status_code=503, detail=f"Backend unreachable: {exc}")
+    except httpx.HTTPStatusError as exc:
+        raise HTTPException(status_code=exc.response.status_code,
+                            detail=exc.response.text)
 
     data = resp.json()
     logger.info(f"[Workflow] Started: analysis_id={data.get('analysis_id')}, "
@@ -64,24 +83,24 @@ async def trigger_analysis(payload: Dict[str, Any]):
 
 
 @router.get("/status/{task_id}")
-async def get_workflow_status(task_id: str):
-
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        try:
-            resp = await client.get(f"{SELF_BASE_URL}/api/tasks/{task_id}")
-            resp.raise_for_status()
-        except httpx.RequestError as exc:
-            raise HTTPException(status_code=503, detail=f"Task service unreachable: {exc}")
-        except httpx.HTTPStatusError as exc:
-            if exc.response.status_code == 404:
-                raise HTTPException(status_code=404, detail="Task not found")
-            raise HTTPException(status_code=exc.response.status_code,
-                                detail=exc.response.text)
+async def get_workflow_status(task_id: str, request: Request):
+
+    client = request.app.state.http
+    try:
+        resp = await client.get(f"{SELF_BASE_URL}/api/tasks/{task_id}", timeout=10.0)
+        resp.raise_for_status()
+    except httpx.RequestError as exc:
+        raise HTTPException(status_code=503, detail=f"Task service unreachable: {exc}")
+    except httpx.HTTPStatusError as exc:
+        if exc.response.status_code == 404:
+            raise HTTPException(status_code=404, detail="Task not found")
+        raise HTTPException(status_code=exc.response.status_code,
+                            detail=exc.response.text)
     return resp.json()
 
 
 @router.post("/webhook/analysis")
-async def n8n_webhook(payload: Dict[str, Any]):
+async def n8n_webhook(payload: Dict[str, Any], request: Request):
     
     address = payload.get("address")
     if not address:
@@ -92,70 +111,141 @@ async def n8n_webhook(payload: Dict[str, Any]):
         "http://localhost:5678/webhook/geoinsight-analysis"
     )
 
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        try:
-            resp = await client.post(n8n_webhook_url, json=payload)
-            resp.raise_for_status()
-            logger.info(f"[Workflow] n8n accepted request for: {address}")
-            return resp.json()
+    client = request.app.state.http
+    try:
+        resp = await client.post(n8n_webhook_url, json=payload, timeout=10.0)
+        resp.raise_for_status()
+        logger.info(f"[Workflow] n8n accepted request for: {address}")
+        return resp.json()
 
-        except httpx.RequestError as exc:
-            logger.warning(f"n8n unreachable ({exc}), triggering analysis directly")
+    except httpx.RequestError as exc:
+        logger.warning(f"n8n unreachable ({exc}), triggering analysis directly")
 
-        except httpx.HTTPStatusError as exc:
-            logger.warning(
-                f"n8n returned HTTP {exc.response.status_code} "
-                f"({exc.response.text[:120]}), triggering analysis directly"
-            )
-    return await trigger_analysis(payload)
+    except httpx.HTTPStatusError as exc:
+        logger.warning(
+            f"n8n returned HTTP {exc.response.status_code} "
+            f"({exc.response.text[:120]}), triggering analysis directly"
+        )
+    try:
+        trigger = WorkflowTrigger.model_validate(payload)
+    except ValidationError as exc:
+        raise HTTPException(status_code=422, detail=exc.errors())
+    return await trigger_analysis(trigger, request)
 
 
 @router.post("/batch")
-async def batch_workflow(payload: Dict[str, Any]):
+async def batch_workflow(
+    payload: Dict[str, Any], request: Request, background_tasks: BackgroundTasks
+):
 
     addresses = payload.get("addresses", [])
-    if not addresses:
+    if not addresses or not isinstance(addresses, list):
         raise HTTPException(status_code=400, detail="addresses list is required")
     if len(addresses) > 10:
         raise HTTPException(status_code=400, detail="Max 10 addresses per batch")
 
     radius_m     = payload.get("radius_m", 1000)
+    if not isinstance(radius_m, int) or not (100 <= radius_m <= 5000):
+        radius_m = 1000
     amenity_types = payload.get("amenity_types") or DEFAULT_AMENITY_TYPES  
-
-    async def _trigger_one(addr: str) -> Dict:
+    if not isinstance(amenity_types, list) or not all(isinstance(t, str) for t in amenity_types):
+        raise HTTPException(status_code=400, detail="amenity_types must be a list of strings")
+
+    # Bad entries are reported per address instead of failing the batch.
+    analysis_requests: List[NeighborhoodAnalysisRequest] = []
+    failed: List[Dict[str, Any]] = []
+    for addr in addresses:
+        if not isinstance(addr, str) or not addr.strip():
+            failed.append({"address": addr, "status": "failed",
+                           "error": "address must be a non-empty string"})
+            continue
         try:
-            return await trigger_analysis({
-                "address":      addr,
-                "radius_m":     radius_m,
-                "amenity_types": amenity_types,
-            })
+            analysis_requests.append(NeighborhoodAnalysisRequest(
+                address=addr.strip(),
+                radius_m=radius_m,
+                amenity_types=amenity_types,
+                **_TRIGGER_OPTIONS,
+            ))
+        except ValidationError as exc:
+            failed.append({"address": addr, "status": "failed", "error": str(exc)})
+
+    if not analysis_requests:
+        return {
+            "batch_id":  f"batch_{int(datetime.now().timestamp())}",
+            "group_id":  None,
+            "total":     len(addresses),
+            "triggered": [],
+            "failed":    failed,
+            "timestamp": datetime.now().isoformat(),
+        }
+
+    try:
+        analysis_ids = await create_neighborhood_analyses(
+            [build_analysis_doc(r) for r in analysis_requests]
+        )
+    except Exception as exc:
+        raise HTTPException(status_code=500, detail=f"Failed to create analyses: {exc}")
+
+    group_id = None
+    task_ids: List[str] = []
+    if NEIGHBORHOOD_CELERY and _analyze_neighborhood_task is not None:
+        from celery import group
+
+        job = group(
+            _analyze_neighborhood_task.s(analysis_id, r.dict())
+            for analysis_id, r in zip(analysis_ids, analysis_requests)
+        )
+        try:
+            res = await asyncio.to_thread(job.apply_async)
+            group_id = res.id
+            task_ids = [child.id for child in res.results]
         except Exception as exc:
-            return {"address": addr, "status": "failed", "error": str(exc)}
-
-    results = await asyncio.gather(*[_trigger_one(a) for a in addresses])
+            logger.warning(f"[Workflow] Celery group enqueue failed, running in-process: {exc}")
+
+    if not task_ids:
+        task_ids = [
+            schedule_in_process(background_tasks, analysis_id, r)
+            for analysis_id, r in zip(analysis_ids, analysis_requests)
+        ]
+
+    logger.info(f"[Workflow] Batch queued {len(task_ids)} analyses (group={group_id})")
+
+    triggered_at = datetime.now().isoformat()
+    triggered = [
+        {
+            "analysis_id":  analysis_id,
+            "task_id":      task_id,
+            "address":      r.address,
+            "status":       "queued",
+            "triggered_at": triggered_at,
+            "poll_url":     f"{SELF_BASE_URL}/api/workflow/status/{task_id}",
+        }
+        for analysis_id, task_id, r in zip(analysis_ids, task_ids, analysis_requests)
+    ]
 
     return {
         "batch_id":  f"batch_{int(datetime.now().timestamp())}",
+        "group_id":  group_id,
         "total":     len(addresses),
-        "triggered": [r for r in results if r.get("status") != "failed"],
-        "failed":    [r for r in results if r.get("status") == "failed"],
-        "timestamp": datetime.now().isoformat(),
+        "triggered": triggered,
+        "failed":    failed,
+        "timestamp": triggered_at,
     }
 
 
 @router.get("/health")
-async def workflow_health():
+async def workflow_health(request: Request):
 
     n8n_url  = os.getenv("N8N_WEBHOOK_URL", "http://localhost:5678/webhook/geoinsight-analysis")
     n8n_base = n8n_url.split("/webhook")[0]
 
     n8n_status = "unknown"
-    async with httpx.AsyncClient(timeout=5.0) as client:
-        try:
-            r = await client.get(f"{n8n_base}/healthz")
-            n8n_status = "reachable" if r.status_code == 200 else f"HTTP {r.status_code}"
-        except Exception as exc:
-            n8n_status = f"unreachable ({exc})"
+    client = request.app.state.http
+    try:
+        r = await client.get(f"{n8n_base}/healthz", timeout=5.0)
+        n8n_status = "reachable" if r.status_code == 200 else f"HTTP {r.status_code}"
+    except Exception as exc:
+        n8n_status = f"unreachable ({exc})"
 
     return {
         "status":    "ok",
@@ -1,7 +1,9 @@
 import os
 import sys
+from dataclasses import dataclass
 from celery import Celery
-from kombu import Queue
+from celery.signals import worker_process_init
+from kombu import Exchange, Queue
 from dotenv import find_dotenv, load_dotenv
 
 load_dotenv(find_dotenv())
@@ -10,61 +12,130 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
 
+
+def _env_num(name: str, default, cast=int):
+    raw = os.getenv(name)
+    if raw is None:
+        return default
+    try:
+        return cast(raw)
+    except ValueError:
+        raise ValueError(f"{name}={raw!r} is not a valid {cast.__name__}") from None
+
+
+# Every tunable is read and cast once, here, so a bad value fails at import
+# with the variable's name instead of deep inside conf.update().
+@dataclass(frozen=True)
+class _Conf:
+    serializer: str = os.getenv("CELERY_SERIALIZER", "msgpack")
+    task_time_limit: int = _env_num("CELERY_TASK_TIME_LIMIT", 30 * 60)
+    task_soft_time_limit: int = _env_num("CELERY_TASK_SOFT_TIME_LIMIT", 25 * 60)
+    result_expires: int = _env_num("CELERY_RESULT_EXPIRES", 3600)
+    max_tasks_per_child: int = _env_num("CELERY_MAX_TASKS_PER_CHILD", 100)
+    pool: str = os.getenv("CELERY_POOL", "solo")
+    concurrency: int = _env_num("CELERY_CONCURRENCY", 1)
+    prefetch_multiplier: int = _env_num("CELERY_PREFETCH_MULTIPLIER", 1)
+    default_queue: str = os.getenv("CELERY_DEFAULT_QUEUE", "default")
+    broker_pool_limit: int = _env_num("CELERY_BROKER_POOL_LIMIT", 20)
+    visibility_timeout: int = _env_num("CELERY_VISIBILITY_TIMEOUT", 3600)
+    maintenance_schedule_s: float = _env_num("MAINTENANCE_SCHEDULE_SECONDS", 3600.0, float)
+
+
+_CONF = _Conf()
+
+# Each worker can limit the task modules it loads (see docker-compose.yml), so
+# e.g. the maintenance worker never imports torch or OpenCV.
+CELERY_IMPORTS = [
+    m.strip() for m in os.getenv(
+        "CELERY_IMPORTS",
+        "app.tasks.computer_vision_tasks,app.tasks.geospatial_tasks,app.tasks.agent_tasks,"
+        "app.tasks.maintenance_tasks,app.tasks.satellite_tasks,app.tasks.vector_tasks",
+    ).split(",") if m.strip()
+]
+
 celery_app = Celery(
     "geo_insight_tasks",
     broker=REDIS_URL,
     backend=REDIS_URL,
-    include=[
-        "app.tasks.computer_vision_tasks",
-        "app.tasks.geospatial_tasks",
-        "app.tasks.agent_tasks",
-        "app.tasks.maintenance_tasks",
-        "app.tasks.satellite_tasks",
-        "app.tasks.vector_tasks",
-    ],
+    include=CELERY_IMPORTS,
 )
 
 celery_app.conf.update(
-    task_serializer="json",
-    accept_content=["json"],
-    result_serializer="json",
+    # msgpack is smaller and faster than JSON for the nested result dicts.
+    # JSON stays accepted so messages and results written before the switch
+    # still load. Task payloads must keep datetimes as ISO strings.
+    task_serializer=_CONF.serializer,
+    result_serializer=_CONF.serializer,
+    accept_content=["json", "msgpack"],
+    result_accept_content=["json", "msgpack"],
     timezone="UTC",
     enable_utc=True,
 
-    task_track_started=True,
-    task_time_limit=int(os.getenv("CELERY_TASK_TIME_LIMIT", 30 * 60)),
-    task_soft_time_limit=int(os.getenv("CELERY_TASK_SOFT_TIME_LIMIT", 25 * 60)),
-
+    # Pollers only ever see STARTED for a moment before the task's own
+    # PROGRESS update, so recording it just adds a backend write per task
+    # (including every chord stage).
+    task_track_started=False,
+    task_time_limit=_CONF.task_time_limit,
+    task_soft_time_limit=_CONF.task_soft_time_limit,
+
+    # Prefetched messages stay unacked until the task finishes, so anything a
+    # crashed worker had reserved is redelivered to another one. A task can
+    # therefore run twice: stages only compute and overwrite, and the
+    # analyze_* entry tasks return early if their analysis already finished.
+    task_acks_late=True,
     task_acks_on_failure_or_timeout=True,
     task_reject_on_worker_lost=False,
 
-    result_expires=int(os.getenv("CELERY_RESULT_EXPIRES", 3600)),
+    result_expires=_CONF.result_expires,
 
-    worker_prefetch_multiplier=int(os.getenv("CELERY_PREFETCH_MULTIPLIER", 1)),
-    worker_max_tasks_per_child=int(os.getenv("CELERY_MAX_TASKS_PER_CHILD", 100)),
-    worker_pool=os.getenv("CELERY_POOL", "solo"),
-    worker_concurrency=int(os.getenv("CELERY_CONCURRENCY", 1)),
+    worker_max_tasks_per_child=_CONF.max_tasks_per_child,
+    worker_pool=_CONF.pool,
+    worker_concurrency=_CONF.concurrency,
+    # Default for a single all-queue worker; docker-compose overrides it per
+    # worker with --prefetch-multiplier.
+    worker_prefetch_multiplier=_CONF.prefetch_multiplier,
     worker_send_task_events=True,
 
-    task_default_queue=os.getenv("CELERY_DEFAULT_QUEUE", "default"),
+    task_default_queue=_CONF.default_queue,
     task_queues=(
         Queue("default",      routing_key="task.default"),
         Queue("high_priority",routing_key="task.high"),
         Queue("cpu_bound",    routing_key="task.cpu"),
         Queue("io_bound",     routing_key="task.io"),
-        Queue("maintenance",  routing_key="task.maintenance"),
+        # Housekeeping is re-scheduled by beat, so losing a message on a
+        # broker restart costs nothing; no need to persist it.
+        Queue("maintenance",  Exchange("maintenance", type="direct", delivery_mode=1),
+              routing_key="task.maintenance", durable=False),
     ),
 
+    # Long analyses, CPU-heavy work and housekeeping each get their own queue
+    # so a slow job never sits in front of a cheap one; docker-compose runs a
+    # worker per queue group. Prefetch is set per worker on the command line:
+    # 1 for cpu_bound so a long job never holds another in reserve, 2 for the
+    # short io_bound/default tasks so the next one is already local.
     task_routes={
-        "app.tasks.satellite_tasks.analyze_satellite":         {"queue": "cpu_bound", "routing_key": "task.cpu"},
-        "app.tasks.geospatial_tasks.analyze_neighborhood":     {"queue": "io_bound",  "routing_key": "task.io"},
-        "app.tasks.agent_tasks.process_agent_query":           {"queue": "default",   "routing_key": "task.default"},
-        "app.tasks.maintenance_tasks.cleanup_old_tasks":       {"queue": "maintenance","routing_key": "task.maintenance"},
-        "app.tasks.vector_tasks.batch_embed_properties":       {"queue": "cpu_bound", "routing_key": "task.cpu"},
+        "analyze_satellite":         {"queue": "cpu_bound", "routing_key": "task.cpu"},
+        "analyze_neighborhood":      {"queue": "io_bound",  "routing_key": "task.io"},
+        "neighborhood_amenities":    {"queue": "io_bound",  "routing_key": "task.io"},
+        "neighborhood_buildings":    {"queue": "io_bound",  "routing_key": "task.io"},
+        "neighborhood_green_space":  {"queue": "cpu_bound", "routing_key": "task.cpu"},
+        "finalize_neighborhood":     {"queue": "io_bound",  "routing_key": "task.io"},
+        "neighborhood_failed":       {"queue": "io_bound",  "routing_key": "task.io"},
+        "process_agent_query":       {"queue": "default",   "routing_key": "task.default"},
+        "cleanup_old_tasks":         {"queue": "maintenance","routing_key": "task.maintenance", "delivery_mode": "transient"},
+        "archive_old_results":       {"queue": "maintenance","routing_key": "task.maintenance", "delivery_mode": "transient"},
+        "update_analysis_results":   {"queue": "maintenance","routing_key": "task.maintenance", "delivery_mode": "transient"},
+        "batch_embed_properties":    {"queue": "cpu_bound", "routing_key": "task.cpu"},
     },
 
+    # Publishers borrow broker connections from this pool; batch endpoints
+    # already send their work as a single group.
+    broker_pool_limit=_CONF.broker_pool_limit,
+    broker_connection_retry_on_startup=True,
+    broker_heartbeat=30,
+
     broker_transport_options={
-        "visibility_timeout": int(os.getenv("CELERY_VISIBILITY_TIMEOUT", 3600)),
+        "visibility_timeout": _CONF.visibility_timeout,
     },
 
 
@@ -74,13 +145,20 @@ celery_app.conf.update(
 
     beat_schedule={
         "cleanup-old-tasks": {
-            "task":    "app.tasks.maintenance_tasks.cleanup_old_tasks",
-            "schedule": float(os.getenv("MAINTENANCE_SCHEDULE_SECONDS", 3600.0)),
+            "task":    "cleanup_old_tasks",
+            "schedule": _CONF.maintenance_schedule_s,
             "options": {"queue": "maintenance"},
         },
     },
 )
 
 
+@worker_process_init.connect
+def _init_worker_mongo(**_):
+    from app.database import get_shared_sync_database, reset_shared_sync_database
+    reset_shared_sync_database()
+    get_shared_sync_database()
+
+
 def get_celery_queues():
     return [q.name for q in celery_app.conf.task_queues]
\ No newline at end of file
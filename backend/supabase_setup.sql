@@ -0,0 +1,150 @@
+-- Vector search schema for the "Find Similar Properties" feature.
+-- Run in the Supabase SQL Editor. Safe to re-run.
+
+create extension if not exists vector;
+
+create table if not exists property_embeddings (
+  id uuid primary key default gen_random_uuid(),
+  property_id text unique not null,
+  address text,
+  embedding halfvec(512),
+  image_url text,
+  metadata jsonb default '{}',
+  created_at timestamp with time zone default now(),
+  updated_at timestamp with time zone default now()
+);
+
+-- HNSW gives log-time cosine search and, unlike IVFFlat, can be built on an
+-- empty table, so there is no need to wait for data before creating it.
+-- m / ef_construction below suit up to ~1M rows; above that rebuild with
+-- m = 32, ef_construction = 128. Building on a large table is faster with:
+--   set max_parallel_maintenance_workers = 7;
+--   set maintenance_work_mem = '2GB';
+drop index if exists property_embeddings_embedding_idx;
+drop index if exists property_embeddings_embedding_hnsw;
+
+-- CLIP vectors lose nothing useful at half precision, and halfvec halves
+-- table, index and graph-traversal memory. Clients still send float lists;
+-- pgvector casts on write. Existing vector(512) tables are converted here;
+-- the check skips the ALTER on re-runs, where the generated bit_embedding
+-- column below would otherwise make Postgres reject it.
+do $$
+begin
+  if (select format_type(a.atttypid, a.atttypmod)
+        from pg_attribute a
+       where a.attrelid = 'property_embeddings'::regclass
+         and a.attname = 'embedding'
+         and not a.attisdropped) <> 'halfvec(512)' then
+    alter table property_embeddings
+      alter column embedding type halfvec(512) using embedding::halfvec(512);
+  end if;
+end
+$$;
+
+create index if not exists property_embeddings_embedding_hnsw
+  on property_embeddings
+  using hnsw (embedding halfvec_cosine_ops)
+  with (m = 24, ef_construction = 128);
+
+-- 1-bit shadow of the embedding (64 bytes per row) for the optional
+-- two-stage search below. Kept in sync by Postgres, so upserts need no change.
+alter table property_embeddings
+  add column if not exists bit_embedding bit(512)
+  generated always as (binary_quantize(embedding)::bit(512)) stored;
+
+create index if not exists property_embeddings_bit_hnsw
+  on property_embeddings
+  using hnsw (bit_embedding bit_hamming_ops);
+
+-- ef_search is chosen by the client from the table size (see
+-- SupabaseVectorDB.configure_hnsw_params) and applies to this transaction only.
+drop function if exists match_property_embeddings(vector, float, int);
+
+create or replace function match_property_embeddings(
+  query_embedding vector(512),
+  match_threshold float,
+  match_count int,
+  ef_search int default 40
+)
+returns table (
+  property_id text,
+  address text,
+  image_url text,
+  metadata jsonb,
+  similarity float
+)
+language plpgsql as $$
+begin
+  perform set_config('hnsw.ef_search', ef_search::text, true);
+  return query
+    select e.property_id, e.address, e.image_url, e.metadata,
+           1 - (e.embedding <=> query_embedding::halfvec(512)) as similarity
+    from property_embeddings e
+    where 1 - (e.embedding <=> query_embedding::halfvec(512)) > match_threshold
+    order by e.embedding <=> query_embedding::halfvec(512)
+    limit match_count;
+end;
+$$;
+
+-- Pure k-NN without the threshold predicate. Orders by the raw distance
+-- operator so the HNSW index is used, and sets ef_search for this
+-- transaction only. The client applies the similarity threshold.
+create or replace function match_property_embeddings_direct(
+  query_embedding vector(512),
+  match_count int,
+  ef_search int default 100
+)
+returns table (
+  property_id text,
+  address text,
+  image_url text,
+  metadata jsonb,
+  similarity float
+)
+language plpgsql as $$
+begin
+  perform set_config('hnsw.ef_search', ef_search::text, true);
+  return query
+    select e.property_id, e.address, e.image_url, e.metadata,
+           1 - (e.embedding <=> query_embedding::halfvec(512)) as similarity
+    from property_embeddings e
+    order by e.embedding <=> query_embedding::halfvec(512)
+    limit match_count;
+end;
+$$;
+
+-- Two-stage search (enabled with VECTOR_SEARCH_TWO_STAGE=true): Hamming
+-- k-NN on bit_embedding picks candidate_factor * match_count rows, which are
+-- then re-ranked by exact cosine distance. Only the final rows leave the
+-- database, so the re-rank costs no extra transfer.
+create or replace function match_property_embeddings_bq(
+  query_embedding vector(512),
+  match_threshold float,
+  match_count int,
+  candidate_factor int default 4,
+  ef_search int default 100
+)
+returns table (
+  property_id text,
+  address text,
+  image_url text,
+  metadata jsonb,
+  similarity float
+)
+language plpgsql as $$
+begin
+  perform set_config('hnsw.ef_search', ef_search::text, true);
+  return query
+    select c.property_id, c.address, c.image_url, c.metadata, c.similarity
+    from (
+      select e.property_id, e.address, e.image_url, e.metadata,
+             1 - (e.embedding <=> query_embedding::halfvec(512)) as similarity
+      from property_embeddings e
+      order by e.bit_embedding <~> binary_quantize(query_embedding)::bit(512)
+      limit match_count * candidate_factor
+    ) c
+    where c.similarity > match_threshold
+    order by c.similarity desc
+    limit match_count;
+end;
+$$;
@@ -1,8 +1,44 @@
 import streamlit as st
 import requests
-from typing import Optional, Dict, Any, List
-from config import api_config
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import Optional, Dict, Any, List, Tuple, Union, BinaryIO, Callable
+from config import api_config, TASK_MAX_WAIT, TASK_POLL_INITIAL, TASK_POLL_MAX, TASK_POLL_FACTOR
+import random
+import threading
 import time
+from concurrent.futures import Future
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+try:
+    from requests_toolbelt.multipart.encoder import MultipartEncoder
+    TOOLBELT_AVAILABLE = True
+except ImportError:
+    TOOLBELT_AVAILABLE = False
+
+# requests only decodes br when a brotli package is installed.
+try:
+    import brotli  # noqa: F401
+    ACCEPT_ENCODING = "gzip, br"
+except ImportError:
+    ACCEPT_ENCODING = "gzip"
+
+# Seconds a GET response is served from memory, by endpoint prefix. Endpoints
+# not listed are always revalidated (with If-None-Match when an ETag is known).
+cache_config: Dict[str, float] = {
+    "/health": 5,
+    "/api/stats": 30,
+    "/api/properties": 60,
+}
+
+MAX_CACHE_ENTRIES = 256
+MAX_ERROR_DETAIL = 512
+RETRY_STATUSES = [429, 502, 503, 504]
 
 class APIClient:
     
@@ -10,6 +46,46 @@ class APIClient:
         self.base_url = base_url or api_config.base_url
         self.timeout = api_config.timeout
         self.max_retries = api_config.max_retries
+        self.session = self._create_session()
+        self._cache: Dict[Tuple, Tuple[float, Any, Optional[str]]] = {}
+        self._inflight: Dict[Tuple, Future] = {}
+        self._lock = threading.Lock()
+    
+    def _create_session(self) -> requests.Session:
+        # One pooled session per client so Streamlit reruns reuse open
+        # connections instead of paying a new handshake on every call.
+        # Idempotent requests are retried by the adapter with exponential
+        # backoff; POSTs are only retried by post() when given an idempotency key.
+        retry = Retry(
+            total=self.max_retries,
+            backoff_factor=0.2,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset(["GET", "HEAD", "PUT", "DELETE"]),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=10, pool_maxsize=20, max_retries=retry)
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.headers.update({"Connection": "keep-alive", "Accept-Encoding": ACCEPT_ENCODING})
+        return session
+    
+    @staticmethod
+    def _decode(response: requests.Response) -> Any:
+        if not response.content:
+            return None
+        if ORJSON_AVAILABLE:
+            try:
+                return orjson.loads(response.content)
+            except orjson.JSONDecodeError:
+                pass
+        # Falls back to requests so a bad body still raises a RequestException.
+        return response.json()
+    
+    @staticmethod
+    def _backoff(attempt: int):
+        time.sleep(0.2 * (2 ** attempt) + random.uniform(0, 0.1))
     
     def _handle_error(self, error: Exception, endpoint: str):
         if isinstance(error, requests.exceptions.ConnectionError):
@@ -20,60 +96,160 @@ class APIClient:
             st.error(f"Request Timeout ({self.timeout}s)")
             st.warning("Backend is taking longer than expected")
         elif isinstance(error, requests.exceptions.HTTPError):
+            response = error.response
+            # Proxy error pages and tracebacks can be large; only their start
+            # is decoded and shown.
+            text = response.content[:MAX_ERROR_DETAIL].decode("utf-8", "replace")
             try:
-                detail = error.response.json().get('detail', error.response.text)
-                st.error(f"HTTP {error.response.status_code}")
-                st.error(f"Details: {detail}")
-            except:
-                st.error(f"HTTP Error: {error.response.text}")
+                detail = self._decode(response).get('detail', text)
+                st.error(f"HTTP {response.status_code}")
+                st.error(f"Details: {str(detail)[:MAX_ERROR_DETAIL]}")
+            except (ValueError, AttributeError):
+                st.error(f"HTTP Error: {text}")
         else:
             st.error(f"Unexpected Error: {str(error)}")
     
+    def _cache_ttl(self, endpoint: str) -> float:
+        for prefix, ttl in cache_config.items():
+            if endpoint.startswith(prefix):
+                return ttl
+        return 0
+    
+    def clear_cache(self):
+        self._cache.clear()
+    
     def get(self, endpoint: str, params: Dict = None, show_errors: bool = True) -> Optional[Dict]:
 
         url = f"{self.base_url}{endpoint}"
+        key = ("GET", url, tuple(sorted((k, str(v)) for k, v in (params or {}).items())))
+        ttl = self._cache_ttl(endpoint)
+        cached = self._cache.get(key)
+        now = time.monotonic()
+        
+        if cached and cached[0] > now:
+            return cached[1]
         
-        for attempt in range(self.max_retries):
+        # Identical GETs already in flight (e.g. from the dashboard's worker
+        # threads) wait for that response instead of sending their own.
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+        
+        if not leader:
             try:
-                response = requests.get(url, params=params, timeout=self.timeout)
-                response.raise_for_status()
-                return response.json()
-            
+                return future.result()
             except requests.exceptions.RequestException as e:
-                if attempt < self.max_retries - 1:
-                    time.sleep(1 * (attempt + 1))
-                    continue
-                
                 if show_errors:
                     self._handle_error(e, endpoint)
                 return None
-    
-    def post(self, endpoint: str, data: Dict = None, files: Dict = None, show_errors: bool = True) -> Optional[Dict]:
-    
-        url = f"{self.base_url}{endpoint}"
         
         try:
-            if files:
-                response = requests.post(url, files=files, timeout=self.timeout)
-            else:
-                response = requests.post(url, json=data, timeout=self.timeout)
-            
-            response.raise_for_status()
-            return response.json()
-        
-        except requests.exceptions.RequestException as e:
+            body = self._fetch(url, params, key, ttl, cached, now)
+        except BaseException as e:
+            future.set_exception(e)
+            if not isinstance(e, requests.exceptions.RequestException):
+                raise
             if show_errors:
                 self._handle_error(e, endpoint)
             return None
+        else:
+            future.set_result(body)
+            return body
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+    
+    def _fetch(self, url: str, params: Optional[Dict], key: Tuple, ttl: float,
+               cached: Optional[Tuple], now: float) -> Any:
+        headers = {"If-None-Match": cached[2]} if cached and cached[2] else None
+        
+        response = self.session.get(url, params=params, headers=headers, timeout=self.timeout)
+        if response.status_code == 304 and cached:
+            self._cache[key] = (now + ttl, cached[1], cached[2])
+            return cached[1]
+        
+        response.raise_for_status()
+        body = self._decode(response)
+        etag = response.headers.get("ETag")
+        if ttl > 0 or etag:
+            if len(self._cache) >= MAX_CACHE_ENTRIES:
+                self._cache.pop(next(iter(self._cache)))
+            self._cache[key] = (now + ttl, body, etag)
+        return body
+    
+    def get_bytes(self, url: str, timeout: float = 10) -> bytes:
+        # Raw download for images/HTML. Streamed in chunks and revalidated
+        # with If-None-Match, so an unchanged file costs a 304, not a body.
+        # Raises requests exceptions; callers decide how to report them.
+        key = ("BYTES", url)
+        cached = self._cache.get(key)
+        headers = {"If-None-Match": cached[2]} if cached and cached[2] else None
+        
+        with self.session.get(url, headers=headers, stream=True, timeout=timeout) as response:
+            if response.status_code == 304 and cached:
+                return cached[1]
+            response.raise_for_status()
+            body = bytearray()
+            for chunk in response.iter_content(chunk_size=65536):
+                body.extend(chunk)
+            etag = response.headers.get("ETag")
+        
+        body = bytes(body)
+        if etag:
+            if len(self._cache) >= MAX_CACHE_ENTRIES:
+                self._cache.pop(next(iter(self._cache)))
+            self._cache[key] = (0, body, etag)
+        return body
+    
+    def post(self, endpoint: str, data: Dict = None, files: Dict = None, show_errors: bool = True,
+             idempotency_key: str = None, invalidate: bool = True) -> Optional[Dict]:
+    
+        url = f"{self.base_url}{endpoint}"
+        headers = {"Idempotency-Key": idempotency_key} if idempotency_key else None
+        attempts = self.max_retries + 1 if idempotency_key else 1
+        
+        # Read-only POSTs (queries) leave cached GET responses alone.
+        if invalidate:
+            self.clear_cache()
+        
+        for attempt in range(attempts):
+            try:
+                if files:
+                    response = self.session.post(url, files=files, headers=headers, timeout=self.timeout)
+                else:
+                    response = self.session.post(url, json=data, headers=headers, timeout=self.timeout)
+                
+                if response.status_code in RETRY_STATUSES and attempt < attempts - 1:
+                    self._backoff(attempt)
+                    continue
+                response.raise_for_status()
+                return self._decode(response)
+            
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if attempt < attempts - 1:
+                    self._backoff(attempt)
+                    continue
+                if show_errors:
+                    self._handle_error(e, endpoint)
+                return None
+            
+            except requests.exceptions.RequestException as e:
+                if show_errors:
+                    self._handle_error(e, endpoint)
+                return None
     
     def put(self, endpoint: str, data: Dict, show_errors: bool = True) -> Optional[Dict]:
    
         url = f"{self.base_url}{endpoint}"
         
+        self.clear_cache()
+        
         try:
-            response = requests.put(url, json=data, timeout=self.timeout)
+            response = self.session.put(url, json=data, timeout=self.timeout)
             response.raise_for_status()
-            return response.json()
+            return self._decode(response)
         
         except requests.exceptions.RequestException as e:
             if show_errors:
@@ -84,10 +260,12 @@ class APIClient:
      
         url = f"{self.base_url}{endpoint}"
         
+        self.clear_cache()
+        
         try:
-            response = requests.delete(url, timeout=self.timeout)
+            response = self.session.delete(url, timeout=self.timeout)
             response.raise_for_status()
-            return response.json()
+            return self._decode(response)
         
         except requests.exceptions.RequestException as e:
             if show_errors:
@@ -101,41 +279,118 @@ class APIClient:
         return self.get("/api/stats")
     
     def get_properties(self, skip: int = 0, limit: int = 100, 
-                       city: str = None) -> Optional[List[Dict]]:
+                       city: str = None, fields: List[str] = None,
+                       property_type: str = None, bedrooms: int = None,
+                       price_min: float = None, price_max: float = None,
+                       after: str = None) -> Optional[List[Dict]]:
    
         params = {"skip": skip, "limit": limit}
-        if city:
-            params["city"] = city
+        optional = {
+            "city": city, "property_type": property_type, "bedrooms": bedrooms,
+            "price_min": price_min, "price_max": price_max, "after": after,
+        }
+        params.update({k: v for k, v in optional.items() if v is not None and v != ""})
+        if fields:
+            params["fields"] = ",".join(fields)
         return self.get("/api/properties", params=params)
     
+    def get_property_facets(self) -> Optional[Dict]:
+        return self.get("/api/properties/facets")
+    
+    def get_properties_by_ids(self, ids: List[str]) -> Optional[List[Dict]]:
+        # Read-only, so the response cache is left alone (unlike post()).
+        try:
+            response = self.session.post(
+                f"{self.base_url}/api/properties/batch", json={"ids": ids}, timeout=self.timeout
+            )
+            response.raise_for_status()
+            return self._decode(response)
+        except requests.exceptions.RequestException as e:
+            self._handle_error(e, "/api/properties/batch")
+            return None
+    
     def create_property(self, property_data: Dict) -> Optional[Dict]:
         return self.post("/api/properties", data=property_data)
     
     def start_neighborhood_analysis(self, analysis_data: Dict) -> Optional[Dict]:
         return self.post("/api/neighborhood/analyze", data=analysis_data)
     
-    def get_task_status(self, task_id: str) -> Optional[Dict]:
-        return self.get(f"/api/tasks/{task_id}", show_errors=False)
+    def get_task_status(self, task_id: str, wait: float = 0) -> Optional[Dict]:
+        params = {"wait": wait} if wait else None
+        return self.get(f"/api/tasks/{task_id}", params=params, show_errors=False)
+    
+    def wait_for_task(self, task_id: str, max_wait: float = TASK_MAX_WAIT,
+                      on_update: Callable[[Dict], None] = None) -> Optional[Dict]:
+        # Returns the final status payload, or None if max_wait runs out. Each
+        # poll asks the backend to hold the request until the task finishes
+        # or the current interval passes, so completion is seen immediately.
+        deadline = time.monotonic() + max_wait
+        interval = TASK_POLL_INITIAL
+        last_progress = None
+        
+        while time.monotonic() < deadline:
+            started = time.monotonic()
+            data = self.get_task_status(task_id, wait=interval)
+            progressed = False
+            if data:
+                if on_update:
+                    on_update(data)
+                if data.get("status") in ("completed", "failed"):
+                    return data
+                progress = data.get("progress")
+                progressed = last_progress is not None and progress is not None and progress > last_progress
+                last_progress = progress
+            
+            # Backends without long-poll answer at once; keep the pace anyway.
+            remaining = interval - (time.monotonic() - started)
+            if remaining > 0:
+                time.sleep(remaining)
+            # A task that is visibly moving is polled at the fastest rate so
+            # the progress bar keeps up; a stalled one backs off.
+            if progressed:
+                interval = TASK_POLL_INITIAL
+            else:
+                interval = min(interval * TASK_POLL_FACTOR, TASK_POLL_MAX)
+        
+        return None
     
     def get_analysis(self, analysis_id: str) -> Optional[Dict]:
         return self.get(f"/api/neighborhood/{analysis_id}")
     
     def query_ai_agent(self, query: str) -> Optional[Dict]:
-        return self.post("/api/agent/query", data={"query": query})
+        return self.post("/api/agent/query", data={"query": query}, invalidate=False)
     
-    def vector_search(self, file_content: bytes, filename: str,
+    @staticmethod
+    def multipart_body(filename: str, content: Union[bytes, BinaryIO],
+                       content_type: str = "application/octet-stream") -> Dict[str, Any]:
+        # With requests-toolbelt the body is streamed from the bytes or file
+        # object in chunks instead of being assembled in memory first.
+        if TOOLBELT_AVAILABLE:
+            enc = MultipartEncoder(fields={"file": (filename, content, content_type)})
+            return {"data": enc, "headers": {"Content-Type": enc.content_type}}
+        return {"files": {"file": (filename, content, content_type)}}
+    
+    def vector_search(self, file_content: Union[bytes, BinaryIO], filename: str,
                      limit: int = 5, threshold: float = 0.7) -> Optional[Dict]:
   
-        files = {'file': (filename, file_content)}
         params = {'limit': limit, 'threshold': threshold}
         
         url = f"{self.base_url}/api/vector/search"
         try:
-            response = requests.post(url, files=files, params=params, timeout=120)
+            response = self.session.post(
+                url, params=params, timeout=120,
+                **self.multipart_body(filename, file_content),
+            )
             response.raise_for_status()
-            return response.json()
+            return self._decode(response)
         except Exception as e:
             self._handle_error(e, "/api/vector/search")
             return None
 
-api = APIClient()
\ No newline at end of file
+@st.cache_resource
+def get_api() -> APIClient:
+    # One client (and connection pool) per Streamlit process, shared by all
+    # sessions and reruns.
+    return APIClient()
+
+api = get_api()
\ No newline at end of file
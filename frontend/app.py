@@ -1,6 +1,9 @@
 import streamlit as st
+import importlib
 import sys
 import os
+from collections import deque
+from itertools import islice
 from api_client import api
 
 if os.path.exists('frontend'):
@@ -21,19 +24,24 @@ st.set_page_config(
     initial_sidebar_state="auto"
 )
 
+@st.cache_data(ttl=5, show_spinner=False)
+def _health():
+    return api.health_check()
+
 def _render_sidebar():
     with st.sidebar:
         st.markdown("GeoInsight AI")
         st.divider()
 
         st.markdown("Recent Searches")
-        history = st.session_state.get("analysis_history", [])
+        history = st.session_state.get("analysis_history", ())
         if history:
-            for i, item in enumerate(reversed(history[-5:])):
+            for i, item in enumerate(islice(reversed(history), 5)):
                 addr = item.get("address", "")[:30]
                 ws   = item.get("walk_score")
                 if st.button(f" {addr}", key=f"sb_{i}_{addr}", use_container_width=True):
                     st.session_state.nav_to_analysis = item.get("address", "")
+                    st.session_state.active_tab = "Neighborhood"
                     st.rerun()
                 if ws:
                     st.caption(f"Walk Score: {ws:.0f}/100")
@@ -42,7 +50,7 @@ def _render_sidebar():
 
         st.divider()
 
-        health = api.health_check()
+        health = _health()
         if health and health.get("status") == "healthy":
             st.success("● System Online")
         else:
@@ -54,7 +62,7 @@ def _render_topbar():
     st.divider()
 
 for _key, _val in [
-    ('analysis_history', []),
+    ('analysis_history', deque(maxlen=10)),
     ('agent_history', []),
     ('nav_to_analysis', ''),
     ('ai_query', ''),
@@ -66,45 +74,24 @@ for _key, _val in [
 _render_sidebar()
 _render_topbar()
 
-tab0, tab1, tab2, tab3, tab4  = st.tabs([
-    " Dashboard",
-    " Properties",
-    " Neighborhood",
-    " Assistant",
-    " Similar Homes",
-])
-
-with tab0:
-    try:
-        from pages.dashboard import render_dashboard_page
-        render_dashboard_page()
-    except Exception as e:
-        st.error(f"Dashboard error: {e}")
-
-with tab1:
-    try:
-        from pages.properties import render_properties_page
-        render_properties_page()
-    except Exception as e:
-        st.error(f" Properties page error: {e}")
-
-with tab2:
-    try:
-        from pages.neighborhood import render_neighborhood_page
-        render_neighborhood_page()
-    except Exception as e:
-        st.error(f"Neighborhood page error: {e}")
-
-with tab3:
-    try:
-        from pages.ai_assistant import render_ai_assistant_page
-        render_ai_assistant_page()
-    except Exception as e:
-        st.error(f" AI Assistant page error: {e}")
+# Only the selected section is imported and rendered; st.tabs would run
+# (and import) all five pages on every rerun.
+_SECTIONS = {
+    "Dashboard":     ("pages.dashboard",     "render_dashboard_page",     "Dashboard error"),
+    "Properties":    ("pages.properties",    "render_properties_page",    " Properties page error"),
+    "Neighborhood":  ("pages.neighborhood",  "render_neighborhood_page",  "Neighborhood page error"),
+    "Assistant":     ("pages.ai_assistant",  "render_ai_assistant_page",  " AI Assistant page error"),
+    "Similar Homes": ("pages.vector_search", "render_vector_search_page", " Visual Search page error"),
+}
+
+st.session_state.setdefault("active_tab", "Dashboard")
+choice = st.radio(
+    "Section", list(_SECTIONS), horizontal=True,
+    key="active_tab", label_visibility="collapsed",
+)
 
-with tab4:
-    try:
-        from pages.vector_search import render_vector_search_page
-        render_vector_search_page()
-    except Exception as e:
-        st.error(f" Visual Search page error: {e}")
\ No newline at end of file
+_module, _func, _err = _SECTIONS[choice]
+try:
+    getattr(importlib.import_module(_module), _func)()
+except Exception as e:
+    st.error(f"{_err}: {e}")
@@ -20,13 +20,14 @@ def render_section_header(title: str, icon: str = ""):
 def render_footer():
     st.divider()
     
-    col1, col3, col4 = st.columns(4)
+    col1, col3, col4 = st.columns(3)
+    now = datetime.now()
     
     with col1:
         st.caption(" GeoInsight")
     
     with col3:
-        st.caption(f"{datetime.now().strftime('%Y-%m-%d')}")
+        st.caption(now.strftime('%Y-%m-%d'))
     
     with col4:
-        st.caption(f"{datetime.now().strftime('%H:%M:%S')}")
\ No newline at end of file
+        st.caption(now.strftime('%H:%M:%S'))
\ No newline at end of file
@@ -1,15 +1,21 @@
 
 import os
-from dataclasses import dataclass
-from typing import List
+from dataclasses import dataclass, field
+from typing import Tuple
 
-@dataclass
+def _backend_url() -> str:
+    url = os.getenv("BACKEND_URL")
+    if not url:
+        raise RuntimeError("BACKEND_URL is not set (e.g. BACKEND_URL=http://localhost:8000)")
+    return url
+
+@dataclass(frozen=True, slots=True)
 class APIConfig:
-    base_url: str = os.getenv("BACKEND_URL")
+    base_url: str = field(default_factory=_backend_url)
     timeout: int = 90
     max_retries: int = 3
     
-@dataclass
+@dataclass(frozen=True, slots=True)
 class UIConfig:
     page_title: str = "GeoInsight AI - Real Estate Intelligence"
     layout: str = "wide"
@@ -22,7 +28,7 @@ class UIConfig:
     warning_color: str = "#ffc107"
     error_color: str = "#dc3545"
     
-@dataclass
+@dataclass(frozen=True, slots=True)
 class FeatureConfig:
     enable_vector_search: bool = True
     enable_image_analysis: bool = True
@@ -30,26 +36,22 @@ class FeatureConfig:
     enable_maps: bool = True
     max_file_size_mb: int = 10
     
-@dataclass
+@dataclass(frozen=True, slots=True)
 class MapConfig:
     default_zoom: int = 15
     default_radius: int = 1000
     min_radius: int = 100
     max_radius: int = 5000
     
-    amenity_types: List[str] = None
-    
-    def __post_init__(self):
-        if self.amenity_types is None:
-            self.amenity_types = [
-                'restaurant', 'cafe', 'school', 'hospital',
-                'park', 'supermarket', 'bank', 'pharmacy',
-                'gym', 'library', 'transit_station'
-            ]
+    amenity_types: Tuple[str, ...] = (
+        'restaurant', 'cafe', 'school', 'hospital',
+        'park', 'supermarket', 'bank', 'pharmacy',
+        'gym', 'library', 'transit_station'
+    )
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class PaginationConfig:
-    default_page_size: int = 20
+    default_page_size: int = 10
     max_page_size: int = 100
     
 api_config = APIConfig()
@@ -58,6 +60,10 @@ feature_config = FeatureConfig()
 map_config = MapConfig()
 pagination_config = PaginationConfig()
 
-TASK_POLL_INTERVAL = 3  
+# Task polling backs off from TASK_POLL_INITIAL by TASK_POLL_FACTOR up to
+# TASK_POLL_MAX seconds; the backend holds each poll open for that long.
+TASK_POLL_INITIAL = 1.0
+TASK_POLL_MAX = 10.0
+TASK_POLL_FACTOR = 2.0
 TASK_MAX_WAIT = 300 
 TASK_PROGRESS_BAR_ENABLED = True
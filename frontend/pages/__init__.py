@@ -1,14 +1,20 @@
 """
 Pages Package
 """
-from .properties import render_properties_page
-from .neighborhood import render_neighborhood_page
-from .ai_assistant import render_ai_assistant_page
-from .vector_search import render_vector_search_page
-
-__all__ = [
-    'render_properties_page',
-    'render_neighborhood_page',
-    'render_ai_assistant_page',
-    'render_vector_search_page',
-]
\ No newline at end of file
+import importlib
+
+# Resolved on first access so importing one page doesn't load the others.
+_EXPORTS = {
+    'render_properties_page': 'properties',
+    'render_neighborhood_page': 'neighborhood',
+    'render_ai_assistant_page': 'ai_assistant',
+    'render_vector_search_page': 'vector_search',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(f".{_EXPORTS[name]}", __name__), name)
@@ -106,10 +106,10 @@ def handle_query_submission(query: str):
 def render_ai_response(response: dict):
     st.markdown("### Response")
     
-    answer = response.get('response', {}).get('answer', '')
-    st.markdown(answer)
+    result = response.get('response') or {}
+    st.markdown(result.get('answer', ''))
     
-    calculations = response.get('response', {}).get('calculations')
+    calculations = result.get('calculations')
     if calculations:
         render_investment_breakdown(calculations)
     
@@ -207,8 +207,8 @@ def render_history_item(item: dict, idx: int):
     with st.expander(f"{query[:60]}{'...' if len(query) > 60 else ''}"):
         st.caption(f"Asked: {timestamp}")
         
-        response = item['response']
-        answer = response.get('response', {}).get('answer', '')
+        result = item['response'].get('response') or {}
+        answer = result.get('answer', '')
         
         if len(answer) > 300:
             st.markdown(answer[:300] + '...')
@@ -217,7 +217,7 @@ def render_history_item(item: dict, idx: int):
         else:
             st.markdown(answer)
         
-        calc = response.get('response', {}).get('calculations')
+        calc = result.get('calculations')
         if calc:
             col1, col2, col3 = st.columns(3)
             with col1:
@@ -1,15 +1,100 @@
 import streamlit as st
-import plotly.express as px
+import numpy as np
 import plotly.graph_objects as go
-import pandas as pd
+import plotly.io as pio
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 from api_client import api
 from utils import format_currency
 
 
+@st.cache_data(ttl=30, show_spinner=False)
+def _stats():
+    return api.get_stats()
+
+
+@st.cache_data(ttl=5, show_spinner=False)
+def _health():
+    return api.health_check()
+
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _recent(limit: int):
+    return api.get("/api/neighborhood/recent", params={"limit": limit})
+
+
+@st.cache_data(ttl=300, show_spinner=False)
+def _properties(limit: int):
+    # Only the charts read these rows, so skip the rest of each document.
+    return api.get_properties(limit=limit, fields=["price", "property_type"])
+
+
+# Figures are cached as JSON keyed on the plotted values, so reruns skip
+# rebuilding and re-serialising them.
+@st.cache_data(ttl=60, show_spinner=False)
+def _price_hist_json(prices: tuple) -> str:
+    counts, edges = np.histogram(prices, bins=25)
+    fig = go.Figure(go.Bar(
+        x=(edges[:-1] + edges[1:]) / 2,
+        y=counts,
+        width=np.diff(edges),
+        marker_color="#2563EB",
+        hovertemplate="Price: %{x:,.0f}<br>Properties: %{y}<extra></extra>",
+    ))
+    fig.update_layout(
+        showlegend=False,
+        margin=dict(l=0, r=0, t=20, b=0),
+        height=280,
+        plot_bgcolor="white",
+        bargap=0,
+        xaxis_title="Price",
+        yaxis=dict(gridcolor="#f0f0f0", title="Properties"),
+    )
+    return fig.to_json()
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _type_pie_json(type_counts: tuple) -> str:
+    fig = go.Figure(go.Pie(
+        labels=[t for t, _ in type_counts],
+        values=[c for _, c in type_counts],
+        hole=0.5,
+        marker_colors=["#2563EB","#7C3AED","#059669","#D97706","#DC2626","#0891B2"],
+    ))
+    fig.update_layout(
+        showlegend=True,
+        margin=dict(l=0, r=0, t=20, b=0),
+        height=250,
+    )
+    return fig.to_json()
+
+
 def render_dashboard_page():
-    st.subheader("Overview")
-    stats  = api.get_stats()
-    health = api.health_check()
+    head, refresh = st.columns([6, 1])
+    with head:
+        st.subheader("Overview")
+    with refresh:
+        if st.button("Refresh", use_container_width=True):
+            for fn in (_stats, _health, _recent, _properties):
+                fn.clear()
+            api.clear_cache()
+
+    # The four calls are independent, so fetch them together. Workers get the
+    # script context so API error messages still render on the page.
+    ctx = get_script_run_ctx()
+    with ThreadPoolExecutor(
+        max_workers=4,
+        initializer=lambda: add_script_run_ctx(threading.current_thread(), ctx),
+    ) as ex:
+        f_stats  = ex.submit(_stats)
+        f_health = ex.submit(_health)
+        f_recent = ex.submit(_recent, 6)
+        f_props  = ex.submit(_properties, 200)
+
+    stats  = f_stats.result()
+    health = f_health.result()
 
     col1, col2, col3, col4 = st.columns(4)
     with col1:
@@ -28,7 +113,7 @@ def render_dashboard_page():
 
     with col_left:
         st.markdown("Recent Analyses")
-        recent   = api.get("/api/neighborhood/recent", params={"limit": 6})
+        recent   = f_recent.result()
         analyses = recent.get("analyses", []) if recent else []
 
         if analyses:
@@ -51,38 +136,16 @@ def render_dashboard_page():
 
     with col_right:
         st.markdown("Property Price Distribution")
-        properties = api.get_properties(limit=200)
+        properties = f_props.result()
         if properties:
-            df = pd.DataFrame(properties)
-            if "price" in df.columns:
-                avg_price = df['price'].mean()
+            prices = tuple(p["price"] for p in properties if p.get("price") is not None)
+            if prices:
+                avg_price = sum(prices) / len(prices)
                 st.caption(f"Avg Price: {format_currency(avg_price)}")
+                st.plotly_chart(pio.from_json(_price_hist_json(prices)), use_container_width=True)
 
-                fig = px.histogram(
-                    df, x="price", nbins=25,
-                    labels={"price": "Price", "count": "Properties"},
-                    color_discrete_sequence=["#2563EB"],
-                )
-                fig.update_layout(
-                    showlegend=False,
-                    margin=dict(l=0, r=0, t=20, b=0),
-                    height=280,
-                    plot_bgcolor="white",
-                    yaxis=dict(gridcolor="#f0f0f0"),
-                )
-                st.plotly_chart(fig, use_container_width=True)
-
-            if "property_type" in df.columns:
-                type_counts = df["property_type"].value_counts().head(6)
-                fig2 = go.Figure(go.Pie(
-                    labels=type_counts.index,
-                    values=type_counts.values,
-                    hole=0.5,
-                    marker_colors=["#2563EB","#7C3AED","#059669","#D97706","#DC2626","#0891B2"],
-                ))
-                fig2.update_layout(
-                    showlegend=True,
-                    margin=dict(l=0, r=0, t=20, b=0),
-                    height=250,
-                )
-                st.plotly_chart(fig2, use_container_width=True)
\ No newline at end of file
+            type_counts = Counter(
+                p["property_type"] for p in properties if p.get("property_type")
+            ).most_common(6)
+            if type_counts:
+                st.plotly_chart(pio.from_json(_type_pie_json(tuple(type_counts))), use_container_width=True)
\ No newline at end of file
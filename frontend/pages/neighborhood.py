@@ -1,9 +1,12 @@
 import streamlit as st
 import requests
+import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
+import plotly.io as pio
 from typing import Optional, Dict
 import io
+from collections import deque
 from PIL import Image as PILImage
 
 from api_client import api
@@ -15,6 +18,37 @@ from utils import (
 from components.header import render_section_header
 from config import map_config, TASK_MAX_WAIT
 
+_AMENITY_OPTIONS = (
+    ("Restaurants",  "restaurant"),
+    ("Cafes",        "cafe"),
+    ("Schools",      "school"),
+    ("Hospitals",    "hospital"),
+    ("Parks",        "park"),
+    ("Supermarkets", "supermarket"),
+    ("Banks",        "bank"),
+    ("Pharmacies",   "pharmacy"),
+    ("Gyms",         "gym"),
+    ("Libraries",    "library"),
+    ("Transit",      "transit_station"),
+)
+
+_DEFAULT_AMENITIES = frozenset({"restaurant", "cafe", "school", "hospital"})
+
+_BREAKDOWN_LABELS = {
+    "parks_grass": "Parks / Grass",
+    "forests_woods": "Forests / Woods",
+    "recreation": "Recreation",
+    "natural_areas": "Natural Areas",
+}
+
+_BREAKDOWN_COLORS = {
+    "parks_grass": "#90EE90",
+    "forests_woods": "#228B22",
+    "recreation": "#3CB371",
+    "natural_areas": "#6B8E23",
+}
+
+
 def render_neighborhood_page():
     render_section_header("Neighborhood Analysis")
     st.markdown(
@@ -91,36 +125,45 @@ def _render_analysis_form(default_address: str = "") -> bool:
     return False
 
 def _render_amenity_selector() -> list:
-    amenity_options = {
-        "Restaurants":  "restaurant",
-        "Cafes":        "cafe",
-        "Schools":      "school",
-        "Hospitals":    "hospital",
-        "Parks":        "park",
-        "Supermarkets": "supermarket",
-        "Banks":        "bank",
-        "Pharmacies":   "pharmacy",
-        "Gyms":         "gym",
-        "Libraries":    "library",
-        "Transit":      "transit_station",
-    }
-
     cols = st.columns(4)
-    default_types = ["restaurant", "cafe", "school", "hospital"]
     selected = []
 
-    for idx, (label, value) in enumerate(amenity_options.items()):
+    for idx, (label, value) in enumerate(_AMENITY_OPTIONS):
         with cols[idx % 4]:
-            if st.checkbox(label, value=(value in default_types), key=f"amenity_{value}"):
+            if st.checkbox(label, value=(value in _DEFAULT_AMENITIES), key=f"amenity_{value}"):
                 selected.append(value)
 
     return selected
 
+@st.cache_data(ttl=60, show_spinner=False)
+def _cached_recent_analyses(limit: int):
+    return api.get("/api/neighborhood/recent", params={"limit": limit})
+
+
+@st.cache_data(ttl=600, show_spinner=False)
+def _cached_viz_image(viz_path: str) -> bytes:
+    # The overlay PNG for an analysis never changes. Failures raise, so they
+    # are not cached.
+    return api.get_bytes(f"{api.base_url}/{viz_path}")
+
+
+@st.cache_data(ttl=600, show_spinner=False)
+def _cached_map_html(analysis_id: str) -> str:
+    return api.get_bytes(f"{api.base_url}/api/neighborhood/{analysis_id}/map").decode("utf-8")
+
+
+@st.cache_data(ttl=300, show_spinner="Loading details…")
+def _cached_analysis(analysis_id: str):
+    # api.get_analysis returns None on failure; raising keeps that out of the cache.
+    analysis = api.get_analysis(analysis_id)
+    if not analysis:
+        raise LookupError(analysis_id)
+    return analysis
+
+
 def _handle_analysis_submission(address: str, radius: int, amenities: list, email: str = ""):
     st.divider()
 
-    import requests as _req
-
     with st.spinner("Starting analysis..."):
         try:
             payload = {
@@ -129,7 +172,7 @@ def _handle_analysis_submission(address: str, radius: int, amenities: list, emai
                 "email": email or "",
                 "amenity_types": amenities,          
             }
-            resp = _req.post(
+            resp = api.session.post(
                 f"{api.base_url}/api/workflow/webhook/analysis",
                 json=payload,
                 timeout=15,
@@ -160,7 +203,8 @@ def _handle_analysis_submission(address: str, radius: int, amenities: list, emai
         result = poll_task_status(task_id, max_wait=TASK_MAX_WAIT)
 
     if result:
-        history = get_session_state("analysis_history", [])
+        _cached_recent_analyses.clear()
+        history = st.session_state.setdefault("analysis_history", deque(maxlen=10))
         history.append({
             "address":               address,
             "analysis_id":           analysis_id,
@@ -169,7 +213,6 @@ def _handle_analysis_submission(address: str, radius: int, amenities: list, emai
             "green_space_percentage": result.get("green_space_percentage"),
         })
 
-        st.session_state.analysis_history = history[-10:]
         st.session_state.current_analysis = {
             "result":      result,
             "analysis_id": analysis_id,
@@ -193,9 +236,8 @@ def _display_analysis_results(result: dict, analysis_id: str, generate_map: bool
     _render_key_metrics(result)
     _render_walkability_interpretation(result.get("walk_score", 0))
 
-    amenities = result.get("amenities", {})
-    if amenities:
-        _render_amenities_breakdown(amenities)
+    if result.get("amenity_counts") or result.get("amenities"):
+        _render_amenities_breakdown(result)
 
     _render_green_space_section(result, analysis_id)
 
@@ -253,22 +295,27 @@ def _render_walkability_interpretation(walk_score: float):
     else:
         st.error("Very Car-Dependent. Almost all errands require a car.")
 
-def _render_amenities_breakdown(amenities: dict):
+def _render_amenities_breakdown(result: dict):
     st.divider()
     st.subheader("Nearby Amenities")
 
-    amenity_counts = {
-        k.replace("_", " ").title(): len(v)
-        for k, v in amenities.items() if v
-    }
-
-    if amenity_counts:
+    counts = result.get("amenity_counts")
+    samples = result.get("amenity_samples") or {}
+    if counts is None:
+        # Results stored before the server sent counts carry the full lists.
+        amenities = result.get("amenities") or {}
+        counts = {k: len(v) for k, v in amenities.items() if v}
+        samples = amenities
+
+    if counts:
+        series = pd.Series(counts).sort_values(ascending=False)
+        series.index = series.index.map(get_amenity_display_name)
         fig = px.bar(
-            x=list(amenity_counts.keys()),
-            y=list(amenity_counts.values()),
+            x=series.index,
+            y=series.values,
             labels={"x": "Amenity Type", "y": "Count"},
             title="Amenity Distribution",
-            color=list(amenity_counts.values()),
+            color=series.values,
             color_continuous_scale="viridis",
         )
 
@@ -279,14 +326,13 @@ def _render_amenities_breakdown(amenities: dict):
 
         cols = st.columns(3)
 
-        for idx, (atype, items) in enumerate(amenities.items()):
-            if items:
-                with cols[idx % 3]:
-                    display_name = get_amenity_display_name(atype)
-                    with st.expander(f"{display_name} ({len(items)})"):
-                        for i, item in enumerate(items, 1):
-                            st.write(f"{i}. {item.get('name', 'Unknown')}")
-                            st.caption(f"{item.get('distance_km', 0):.2f} km away")
+        for idx, (atype, count) in enumerate(counts.items()):
+            with cols[idx % 3]:
+                display_name = get_amenity_display_name(atype)
+                with st.expander(f"{display_name} ({count})"):
+                    for i, item in enumerate(samples.get(atype) or [], 1):
+                        st.write(f"{i}. {item.get('name', 'Unknown')}")
+                        st.caption(f"{item.get('distance_km', 0):.2f} km away")
     else:
         st.info("No amenities found in the search radius")
 
@@ -327,17 +373,10 @@ def _render_green_space_section(result: dict, analysis_id: str):
     if breakdown and any(v > 0 for v in breakdown.values()):
         st.markdown("Green Space Breakdown by Type")
 
-        labels_map = {
-            "parks_grass": ("Parks / Grass", ""),
-            "forests_woods": ("Forests / Woods", ""),
-            "recreation": ("Recreation", ""),
-            "natural_areas": ("Natural Areas", ""),
-        }
-
         bcols = st.columns(4)
 
         for idx, (key, pct) in enumerate(breakdown.items()):
-            label, icon = labels_map.get(key, (key.replace("_", " ").title(), ""))
+            label = _BREAKDOWN_LABELS.get(key) or key.replace("_", " ").title()
             with bcols[idx % 4]:
                 st.metric(f"{label}", f"{pct:.1f}%")
 
@@ -350,12 +389,10 @@ def _render_green_space_section(result: dict, analysis_id: str):
 
         with col_img:
             try:
-                img_resp = requests.get(f"{api.base_url}/{viz_path}", timeout=10)
-                if img_resp.status_code == 200:
-                    img = PILImage.open(io.BytesIO(img_resp.content))
-                    st.image(img, caption="Green areas highlighted on the OSM map", use_container_width=True)
-                else:
-                    st.warning(f"Visualization image not available (HTTP {img_resp.status_code})")
+                img = PILImage.open(io.BytesIO(_cached_viz_image(viz_path)))
+                st.image(img, caption="Green areas highlighted on the OSM map", use_container_width=True)
+            except requests.exceptions.HTTPError as exc:
+                st.warning(f"Visualization image not available (HTTP {exc.response.status_code})")
             except Exception as exc:
                 st.warning(f"Could not load visualization: {exc}")
 
@@ -364,7 +401,37 @@ def _render_green_space_section(result: dict, analysis_id: str):
             st.markdown("---")
             st.caption("Green areas are highlighted on the map.")
 
-def _create_green_gauge(percentage: float) -> go.Figure:
+_GAUGE_BASE = {
+    "mode": "gauge+number",
+    "domain": {"x": [0, 1], "y": [0, 1]},
+    "title": {"text": "Green Coverage %", "font": {"size": 20}},
+    "number": {"suffix": "%", "font": {"size": 36}},
+}
+
+_GAUGE_BASE_GAUGE = {
+    "axis": {"range": [0, 100], "tickwidth": 1, "tickcolor": "darkblue"},
+    "bgcolor": "white",
+    "borderwidth": 2,
+    "bordercolor": "gray",
+    "steps": [
+        {"range": [0, 20], "color": "#ffe6e6"},
+        {"range": [20, 40], "color": "#fff4e6"},
+        {"range": [40, 60], "color": "#ffffcc"},
+        {"range": [60, 80], "color": "#e6ffe6"},
+        {"range": [80, 100], "color": "#ccffcc"},
+    ],
+    "threshold": {
+        "line": {"color": "red", "width": 4},
+        "thickness": 0.75,
+        "value": 50,
+    },
+}
+
+
+# Both charts are cached as JSON on their numeric inputs, like the dashboard
+# figures, so reruns with the same analysis skip rebuilding them.
+@st.cache_data(show_spinner=False)
+def _green_gauge_json(percentage: float) -> str:
     color = (
         "#28a745" if percentage >= 50
         else "#ffc107" if percentage >= 30
@@ -372,58 +439,27 @@ def _create_green_gauge(percentage: float) -> go.Figure:
     )
 
     fig = go.Figure(go.Indicator(
-        mode="gauge+number",
+        **_GAUGE_BASE,
         value=percentage,
-        domain={"x": [0, 1], "y": [0, 1]},
-        title={"text": "Green Coverage %", "font": {"size": 20}},
-        number={"suffix": "%", "font": {"size": 36}},
-        gauge={
-            "axis": {"range": [0, 100], "tickwidth": 1, "tickcolor": "darkblue"},
-            "bar": {"color": color},
-            "bgcolor": "white",
-            "borderwidth": 2,
-            "bordercolor": "gray",
-            "steps": [
-                {"range": [0, 20], "color": "#ffe6e6"},
-                {"range": [20, 40], "color": "#fff4e6"},
-                {"range": [40, 60], "color": "#ffffcc"},
-                {"range": [60, 80], "color": "#e6ffe6"},
-                {"range": [80, 100], "color": "#ccffcc"},
-            ],
-            "threshold": {
-                "line": {"color": "red", "width": 4},
-                "thickness": 0.75,
-                "value": 50,
-            },
-        },
+        gauge={**_GAUGE_BASE_GAUGE, "bar": {"color": color}},
     ))
 
     fig.update_layout(height=280, margin=dict(l=20, r=20, t=60, b=20))
-    return fig
+    return fig.to_json()
 
-def _create_breakdown_chart(breakdown: Dict[str, float]) -> go.Figure:
-    labels_map = {
-        "parks_grass": "Parks / Grass",
-        "forests_woods": "Forests / Woods",
-        "recreation": "Recreation",
-        "natural_areas": "Natural Areas",
-    }
-
-    colors_map = {
-        "parks_grass": "#90EE90",
-        "forests_woods": "#228B22",
-        "recreation": "#3CB371",
-        "natural_areas": "#6B8E23",
-    }
-
-    labels = [labels_map.get(k, k) for k in breakdown]
-    values = list(breakdown.values())
-    colors = [colors_map.get(k, "#00FF00") for k in breakdown]
+
+def _create_green_gauge(percentage: float) -> go.Figure:
+    return pio.from_json(_green_gauge_json(float(percentage)))
+
+
+@st.cache_data(show_spinner=False)
+def _breakdown_chart_json(items: tuple) -> str:
+    values = [v for _, v in items]
 
     fig = go.Figure(data=[go.Bar(
-        x=labels,
+        x=[_BREAKDOWN_LABELS.get(k, k) for k, _ in items],
         y=values,
-        marker_color=colors,
+        marker_color=[_BREAKDOWN_COLORS.get(k, "#00FF00") for k, _ in items],
         text=[f"{v:.1f}%" for v in values],
         textposition="auto",
     )])
@@ -436,7 +472,11 @@ def _create_breakdown_chart(breakdown: Dict[str, float]) -> go.Figure:
         showlegend=False,
     )
 
-    return fig
+    return fig.to_json()
+
+
+def _create_breakdown_chart(breakdown: Dict[str, float]) -> go.Figure:
+    return pio.from_json(_breakdown_chart_json(tuple(breakdown.items())))
 
 def _green_interpretation(pct: float) -> str:
     if pct >= 60:
@@ -453,35 +493,28 @@ def _render_interactive_map(analysis_id: str):
     st.divider()
     st.subheader("Interactive Amenities Map")
 
-    map_url = f"{api.base_url}/api/neighborhood/{analysis_id}/map"
-    response = api.get(f"/api/neighborhood/{analysis_id}")
-
-    if not response:
-        st.error("Could not load analysis data")
-        return
-
-    if response.get("status") != "completed":
-        st.warning(f"Analysis not completed yet. Status: {response.get('status')}")
-        return
-
-    if not response.get("map_path"):
-        st.warning("Map was not generated for this analysis")
-        return
-
+    # The map endpoint checks status and map_path itself, so there is no
+    # separate fetch of the analysis first; its 400/404 detail is shown as is.
     with st.spinner("Loading map"):
         try:
-            html_response = requests.get(map_url, timeout=10)
-            if html_response.status_code == 200:
-                st.components.v1.html(html_response.text, height=700, scrolling=True)
+            st.components.v1.html(_cached_map_html(analysis_id), height=700, scrolling=True)
+        except requests.exceptions.HTTPError as exc:
+            status = exc.response.status_code
+            if status in (400, 404):
+                try:
+                    detail = exc.response.json().get("detail")
+                except ValueError:
+                    detail = None
+                st.warning(detail or "Map is not available for this analysis")
             else:
-                st.error(f"Failed to load map: HTTP {html_response.status_code}")
+                st.error(f"Failed to load map: HTTP {status}")
         except requests.exceptions.RequestException as exc:
             st.error(f"Network error: {exc}")
 
 def _render_recent_analyses():
     st.subheader("Recent Analyses")
 
-    recent = api.get("/api/neighborhood/recent", params={"limit": 10})
+    recent = _cached_recent_analyses(10)
 
     if not recent:
         st.info("No recent analyses available")
@@ -527,6 +560,10 @@ def _render_analysis_card(analysis: dict):
             st.write(f"Created: {analysis.get('created_at', 'N/A')}")
             if aid := analysis.get("analysis_id"):
                 if st.button("View Details", key=f"view_{aid}"):
-                    full = api.get_analysis(aid)
+                    # Only finished analyses are stable enough to cache.
+                    try:
+                        full = _cached_analysis(aid) if status == "completed" else api.get_analysis(aid)
+                    except LookupError:
+                        full = None
                     if full:
                         _display_analysis_results(full, aid)
\ No newline at end of file
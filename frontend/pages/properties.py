@@ -3,40 +3,37 @@ import pandas as pd
 import plotly.express as px
 from api_client import api
 from utils import (
-    format_currency, format_number, calculate_price_per_sqft,
-    show_success_message, show_error_message, init_session_state
+    format_currency, format_number,
+    show_success_message, show_error_message, init_session_state, render_remote_image
 )
 from components.header import render_section_header
+from config import pagination_config
+from typing import Dict
 
-def safe_filter_properties(properties, city_filter, type_filter, bedrooms_filter):
-    filtered = properties
-
-    if city_filter != "All" and city_filter:
-        filtered = [
-            p for p in filtered
-            if str(p.get('city', '')).strip().lower() == str(city_filter).strip().lower()
-        ]
-
-    if type_filter != "All" and type_filter:
-        filtered = [
-            p for p in filtered
-            if str(p.get('property_type', '')).strip().lower() == str(type_filter).strip().lower()
-        ]
-
-    if bedrooms_filter != "All" and bedrooms_filter:
-        try:
-            bed_value = int(bedrooms_filter)
-            filtered = [
-                p for p in filtered
-                if int(p.get('bedrooms', 0)) == bed_value
-            ]
-        except (ValueError, TypeError):
-            filtered = [
-                p for p in filtered
-                if str(p.get('bedrooms', '')).strip() == str(bedrooms_filter).strip()
-            ]
-
-    return filtered
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _cached_facets():
+    return api.get_property_facets()
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _cached_page(filters: tuple, after: str, limit: int):
+    return api.get_properties(limit=limit, after=after, **dict(filters))
+
+
+@st.cache_data(ttl=120, show_spinner=False)
+def _cached_compare_options(limit: int):
+    return api.get_properties(limit=limit, fields=["address", "price"])
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _cached_properties_by_ids(ids: tuple):
+    return api.get_properties_by_ids(list(ids))
+
+
+def _clear_property_caches():
+    for fn in (_cached_facets, _cached_page, _cached_compare_options, _cached_properties_by_ids):
+        fn.clear()
 
 
 def render_properties_page():
@@ -64,130 +61,153 @@ def render_browse_properties():
     with col2:
         if st.button("Refresh", use_container_width=True, key="refresh_props"):
             st.cache_data.clear()
+            api.clear_cache()
             st.rerun()
 
-    with st.spinner("Loading properties..."):
-        properties = api.get_properties(limit=100)
+    facets = _cached_facets()
 
-    if not properties or len(properties) == 0:
+    if not facets or not facets.get("total"):
         st.info("No properties in database")
         render_no_properties_help()
         return
 
-    df = pd.DataFrame(properties)
-
-    render_property_metrics(df)
+    render_property_metrics(facets)
 
     st.divider()
 
-    filtered_df = render_property_filters(df)
+    filters = render_property_filters(facets)
 
-    st.success(f"Showing {len(filtered_df)} properties")
+    # Keyset pagination: each entry is the id the page starts after.
+    if st.session_state.get("prop_filters_applied") != filters:
+        st.session_state.prop_filters_applied = filters
+        st.session_state.prop_cursors = [None]
+    cursors = st.session_state.setdefault("prop_cursors", [None])
 
-    render_property_list(filtered_df)
+    page_size = pagination_config.default_page_size
+    with st.spinner("Loading properties..."):
+        page = _cached_page(filters, cursors[-1], page_size) or []
+
+    if page:
+        render_property_list(pd.DataFrame(page))
+
+    # The facet total only matches the listing when no filter is applied.
+    page_label = f"Page {len(cursors)}"
+    if not filters:
+        page_label += f" of {max(1, -(-facets['total'] // page_size))}"
+
+    prev_col, label_col, next_col = st.columns([1, 4, 1])
+    with label_col:
+        st.caption(f"{page_label} · {len(page)} properties")
+    with prev_col:
+        if len(cursors) > 1 and st.button("← Previous", use_container_width=True, key="prop_prev"):
+            cursors.pop()
+            st.rerun()
+    with next_col:
+        if len(page) == page_size and st.button("Next →", use_container_width=True, key="prop_next"):
+            cursors.append(page[-1].get("id"))
+            st.rerun()
 
 
-def render_property_metrics(df: pd.DataFrame):
+def render_property_metrics(facets: Dict):
     col1, col2, col3, col4 = st.columns(4)
 
     with col1:
-        st.metric(" Total", len(df))
+        st.metric(" Total", facets.get("total", 0))
 
     with col2:
-        if 'price' in df.columns:
-            avg_price = df['price'].mean()
-            st.metric("Avg Price", format_currency(avg_price))
+        if facets.get("avg_price") is not None:
+            st.metric("Avg Price", format_currency(facets["avg_price"]))
 
     with col3:
-        if 'square_feet' in df.columns:
-            avg_sqft = df['square_feet'].mean()
-            st.metric(" Avg Size", f"{avg_sqft:,.0f} sqft")
+        if facets.get("avg_square_feet") is not None:
+            st.metric(" Avg Size", f"{facets['avg_square_feet']:,.0f} sqft")
 
     with col4:
-        if 'city' in df.columns:
-            unique_cities = df['city'].nunique()
-            st.metric("Cities", unique_cities)
-
+        st.metric("Cities", len(facets.get("cities", [])))
 
-def render_property_filters(df: pd.DataFrame) -> pd.DataFrame:
-    col1, col2, col3 = st.columns(3)
 
-    properties = df.to_dict('records')
+def render_property_filters(facets: Dict) -> tuple:
+    # Filters are applied server-side when the form is submitted, not on
+    # every widget change.
+    with st.form("property_filters"):
+        col1, col2, col3 = st.columns(3)
 
-    with col1:
-        if 'city' in df.columns:
-            cities = list(set([str(p.get('city', 'Unknown')).strip() for p in properties if p.get('city')]))
-            cities.sort()
-            city_filter = st.selectbox("City", ["All"] + cities, key="city_filter")
-        else:
-            city_filter = "All"
+        with col1:
+            city_filter = st.selectbox("City", ["All"] + facets.get("cities", []), key="city_filter")
 
-    with col2:
-        if 'property_type' in df.columns:
-            types = list(set([str(p.get('property_type', 'Unknown')).strip() for p in properties if p.get('property_type')]))
-            types.sort()
-            type_filter = st.selectbox("Type", ["All"] + types, key="type_filter")
-        else:
-            type_filter = "All"
+        with col2:
+            type_filter = st.selectbox("Type", ["All"] + facets.get("property_types", []), key="type_filter")
 
-    with col3:
-        if 'bedrooms' in df.columns:
-            bedrooms = list(set([str(p.get('bedrooms', '0')).strip() for p in properties if p.get('bedrooms')]))
-            bedrooms.sort(key=lambda x: int(x) if x.isdigit() else 0)
+        with col3:
+            bedrooms = [str(b) for b in facets.get("bedrooms", [])]
             bedrooms_filter = st.selectbox("Bedrooms", ["All"] + bedrooms, key="bed_filter")
-        else:
-            bedrooms_filter = "All"
-
-    filtered_properties = safe_filter_properties(properties, city_filter, type_filter, bedrooms_filter)
 
-    filtered_df = pd.DataFrame(filtered_properties) if filtered_properties else pd.DataFrame()
-
-    if 'price' in df.columns and len(df) > 0 and len(filtered_df) > 0:
-        min_p = int(df['price'].min())
-        max_p = int(df['price'].max())
-        if min_p < max_p:
+        price_range = None
+        min_p, max_p = facets.get("min_price"), facets.get("max_price")
+        if min_p is not None and max_p is not None and int(min_p) < int(max_p):
             price_range = st.slider(
                 "Price Range",
-                min_p, max_p, (min_p, max_p),
+                int(min_p), int(max_p), (int(min_p), int(max_p)),
                 key="price_range"
             )
-            filtered_df = filtered_df[
-                (filtered_df['price'] >= price_range[0]) &
-                (filtered_df['price'] <= price_range[1])
-            ]
 
-    return filtered_df
+        st.form_submit_button("Apply filters", use_container_width=True)
 
+    filters = {}
+    if city_filter != "All":
+        filters["city"] = city_filter
+    if type_filter != "All":
+        filters["property_type"] = type_filter
+    if bedrooms_filter != "All":
+        filters["bedrooms"] = int(bedrooms_filter)
+    if price_range and price_range != (int(min_p), int(max_p)):
+        filters["price_min"], filters["price_max"] = price_range
 
-def render_property_list(df: pd.DataFrame):
-    for idx, row in df.iterrows():
-        render_property_card(row, idx)
+    return tuple(sorted(filters.items()))
 
 
-def render_property_card(row: pd.Series, idx: int):
-    price = row.get('price', 0)
-    address = row.get('address', 'N/A')
+# Column -> fallback used when the API omitted the field entirely.
+_CARD_COLUMNS = {
+    'price': 0,
+    'address': 'N/A',
+    'city': 'N/A',
+    'state': 'N/A',
+    'zip_code': 'N/A',
+    'property_type': 'N/A',
+    'bedrooms': 'N/A',
+    'bathrooms': 'N/A',
+    'square_feet': 0,
+}
 
+
+def render_property_list(df: pd.DataFrame):
+    missing = {c: d for c, d in _CARD_COLUMNS.items() if c not in df.columns}
+    sub = df.assign(**missing)[list(_CARD_COLUMNS)]
+    sqft = pd.to_numeric(sub['square_feet'], errors='coerce')
+    price = pd.to_numeric(sub['price'], errors='coerce')
+    sub = sub.assign(price_per_sqft=(price / sqft.where(sqft > 0)).fillna(0))
+    for idx, *fields in sub.itertuples(index=True, name=None):
+        render_property_card(idx, *fields)
+
+
+def render_property_card(idx: int, price, address, city, state, zip_code,
+                         property_type, bedrooms, bathrooms, square_feet, price_per_sqft):
     with st.expander(f"{address} | {format_currency(price)}", expanded=False):
         col1, col2, col3 = st.columns(3)
 
         with col1:
             st.markdown("Location")
-            st.write(f"{row.get('city', 'N/A')}, {row.get('state', 'N/A')}")
-            st.write(f"ZIP: {row.get('zip_code', 'N/A')}")
+            st.write(f"{city}, {state}")
+            st.write(f"ZIP: {zip_code}")
 
         with col2:
             st.markdown("Details")
-            st.write(f"Type: {row.get('property_type', 'N/A')}")
-            beds = row.get('bedrooms', 'N/A')
-            baths = row.get('bathrooms', 'N/A')
-            st.write(f"Beds: {beds} | Baths: {baths}")
+            st.write(f"Type: {property_type}")
+            st.write(f"Beds: {bedrooms} | Baths: {bathrooms}")
 
         with col3:
             st.markdown("Metrics")
-            sqft = row.get('square_feet', 0)
-            st.write(f"Size: {sqft:,} sqft")
-            price_per_sqft = calculate_price_per_sqft(price, sqft)
+            st.write(f"Size: {square_feet:,} sqft")
             st.write(f"$/sqft: {format_currency(price_per_sqft)}")
 
         col1, col2, col3, col4 = st.columns(4)
@@ -235,7 +255,7 @@ def render_add_property():
 
         if image_url:
             try:
-                st.image(image_url, caption="Preview", width=300)
+                render_remote_image(image_url, width=300, caption="Preview")
                 st.caption("This property will appear in photo-based searches")
             except:
                 st.caption("Could not preview image — check the URL")
@@ -256,13 +276,13 @@ def render_add_property():
 def render_compare_properties():
     st.markdown("Select up to 3 properties to compare side by side.")
 
-    properties = api.get_properties(limit=200)
+    properties = _cached_compare_options(200)
     if not properties:
         st.info("No properties available.")
         return
 
     options = {
-        f"{p.get('address', 'N/A')} — {p.get('price', 0):,.0f}": p
+        f"{p.get('address', 'N/A')} — {p.get('price') or 0:,.0f}": p.get("id")
         for p in properties
     }
 
@@ -277,14 +297,18 @@ def render_compare_properties():
         st.info("Select at least 2 properties to compare.")
         return
 
-    selected = [options[l] for l in selected_labels]
+    # Only the chosen properties are fetched in full.
+    selected = _cached_properties_by_ids(tuple(options[l] for l in selected_labels)) or []
+    if len(selected) < 2:
+        st.warning("Could not load the selected properties.")
+        return
 
     cols = st.columns(len(selected))
     for col, prop in zip(cols, selected):
         with col:
             st.markdown(f"### {prop.get('address','')[:30]}")
             if prop.get("image_url"):
-                st.image(prop["image_url"], use_container_width=True)
+                render_remote_image(prop["image_url"])
 
     st.divider()
 
@@ -308,14 +332,11 @@ def render_compare_properties():
 
     st.divider()
     st.markdown("#### Price per sq.ft")
-    chart_data = []
-    for prop in selected:
-        price = prop.get("price", 0)
-        sqft = prop.get("square_feet", 1) or 1
-        chart_data.append({
-            "Property": prop.get("address","")[:25],
-            "Price/sqft": round(price / sqft)
-        })
+    sel = pd.DataFrame(selected, columns=["address", "price", "square_feet"])
+    chart_data = pd.DataFrame({
+        "Property": sel["address"].fillna("").str[:25],
+        "Price/sqft": (sel["price"].fillna(0) / sel["square_feet"].replace(0, 1).fillna(1)).round(),
+    })
 
     fig = px.bar(
         chart_data, x="Property", y="Price/sqft",
@@ -350,6 +371,7 @@ def handle_property_submission(address, city, state, zip_code, price,
         result = api.create_property(data)
 
         if result:
+            _clear_property_caches()
             if image_url:
                 show_success_message(
                     "Property added! Visual similarity search enabled automatically "
@@ -1,10 +1,12 @@
 from __future__ import annotations
 import io
-import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Dict, List, Optional
 
 import requests
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 from PIL import Image
 
 from api_client import api
@@ -47,8 +49,10 @@ def _render_search_ui():
 
     col_img, col_params = st.columns([2, 1])
     with col_img:
+        # Raw bytes are served as-is; a PIL image would be decoded and
+        # re-encoded on every rerun.
         st.image(
-            Image.open(io.BytesIO(image_bytes)),
+            image_bytes,
             caption=f"{uploaded.name}  ·  {uploaded.size / 1024:.1f} KB",
             use_container_width=True,
         )
@@ -73,31 +77,88 @@ def _render_search_ui():
 
 def _clear_all_panels():
     for k in list(st.session_state.keys()):
-        if k.startswith("vs_nbr") or k.startswith("vs_img_"):
+        if k.startswith("vs_nbr"):
             del st.session_state[k]
 
 
+_IMAGE_FETCH_WORKERS = 6
+_IMAGE_CACHE_MAX = 256
 
-def _load_image_cached(url: str) -> Optional[bytes]:
-    cache_key = f"vs_img_{hash(url)}"
-    if cache_key not in st.session_state:
-        try:
-            r = requests.get(url, timeout=5)
-            st.session_state[cache_key] = r.content if r.status_code == 200 else None
-        except Exception:
-            st.session_state[cache_key] = None
-    return st.session_state[cache_key]
+
+@st.cache_data(max_entries=_IMAGE_CACHE_MAX, show_spinner=False)
+def _thumbnail(img_bytes: bytes, width: int = 320) -> bytes:
+    img = Image.open(io.BytesIO(img_bytes))
+    img.thumbnail((width, width * 4))
+    out = io.BytesIO()
+    img.convert("RGB").save(out, format="JPEG", quality=85)
+    return out.getvalue()
+
+
+def _fetch_image(url: str) -> bytes:
+    r = api.session.get(url, timeout=5)
+    r.raise_for_status()
+    return r.content
+
+
+def _prefetch_one(url: str):
+    try:
+        _load_image_cached(url)
+    except requests.exceptions.RequestException:
+        pass
+
+
+def _prefetch_images(urls: List[str]):
+    # Warm the shared cache for every thumbnail concurrently; workers get the
+    # script context like the dashboard fetches do.
+    urls = list(dict.fromkeys(urls))
+    if not urls:
+        return
+    ctx = get_script_run_ctx()
+    with ThreadPoolExecutor(
+        max_workers=min(_IMAGE_FETCH_WORKERS, len(urls)),
+        initializer=lambda: add_script_run_ctx(threading.current_thread(), ctx),
+    ) as pool:
+        list(pool.map(_prefetch_one, urls))
+
+
+# Process-wide rather than per session, so users viewing the same listings
+# share one copy and session memory stays flat. Failures raise, so a transient
+# error is not cached for everyone.
+@st.cache_data(ttl=3600, max_entries=_IMAGE_CACHE_MAX, show_spinner=False)
+def _load_image_cached(url: str) -> bytes:
+    return _fetch_image(url)
+
+
+_UPLOAD_MAX_SIDE = 512
+_UPLOAD_RESIZE_MIN_BYTES = 512 * 1024
+
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def _search_payload(image_bytes: bytes) -> bytes:
+    # CLIP embeds at 224 px, so a 512 px JPEG carries everything the search
+    # uses at a fraction of the upload size.
+    img = Image.open(io.BytesIO(image_bytes))
+    img.thumbnail((_UPLOAD_MAX_SIDE, _UPLOAD_MAX_SIDE), Image.Resampling.LANCZOS)
+    out = io.BytesIO()
+    img.convert("RGB").save(out, format="JPEG", quality=85, optimize=True)
+    return out.getvalue()
 
 
 def _run_search(uploaded, image_bytes: bytes, limit: int, threshold: float):
+    if len(image_bytes) > _UPLOAD_RESIZE_MIN_BYTES:
+        name = uploaded.name.rsplit(".", 1)[0] + ".jpg"
+        body = api.multipart_body(name, _search_payload(image_bytes), "image/jpeg")
+    else:
+        uploaded.seek(0)
+        body = api.multipart_body(uploaded.name, uploaded, uploaded.type or "application/octet-stream")
+
     with st.spinner("Searching for similar properties…"):
         try:
-            uploaded.seek(0)
-            resp = requests.post(
+            resp = api.session.post(
                 f"{BACKEND_URL}/api/vector/search",
-                files={"file": (uploaded.name, image_bytes, uploaded.type)},
                 params={"limit": limit, "threshold": threshold},
                 timeout=30,
+                **body,
             )
         except requests.exceptions.RequestException as exc:
             show_error_message(f"Network error: {exc}")
@@ -124,75 +185,86 @@ def _run_search(uploaded, image_bytes: bytes, limit: int, threshold: float):
         return
 
     st.session_state["vs_results"] = results
+    _prefetch_images([item["image_url"] for item in results if item.get("image_url")])
     _clear_all_panels()
 
 def _render_results(results: List[Dict[str, Any]]):
     for rank, item in enumerate(results, start=1):
-        sim = item.get("similarity", 0.0)
-        addr = item.get("address", "Unknown address")
-        imgurl = item.get("image_url", "")
-        meta = item.get("metadata", {})
-
-        with st.container(border=True):
-            col_rank, col_main, col_score = st.columns([0.5, 5, 2])
-            with col_rank:
-                st.markdown(f"{rank}")
-            with col_main:
-                st.markdown(f"{addr}")
-                if meta:
-                    parts = []
-                    if meta.get("price"):
-                        parts.append(f"₹{meta['price']:,.0f}")
-                    if meta.get("bedrooms"):
-                        parts.append(f"{meta['bedrooms']} BHK")
-                    if meta.get("city"):
-                        parts.append(meta["city"])
-                    if parts:
-                        st.caption("  ·  ".join(parts))
-            with col_score:
-                st.metric("Similarity", f"{sim:.1%}")
-
-            st.progress(sim)
-
-            if imgurl:
-                with st.expander("View property image"):
+        _render_result_card(rank, item)
+
+
+# Each card, including its inline neighbourhood panel, is a fragment, so
+# widget events inside one card rerun only that card.
+@st.fragment
+def _render_result_card(rank: int, item: Dict[str, Any]):
+    sim = item.get("similarity", 0.0)
+    addr = item.get("address", "Unknown address")
+    imgurl = item.get("image_url", "")
+    meta = item.get("metadata") or {}
+    price, beds = meta.get("price"), meta.get("bedrooms")
+    city = (meta.get("city") or "").strip()
+    locality = (meta.get("locality") or "").strip()
+
+    with st.container(border=True):
+        col_rank, col_main, col_score = st.columns([0.5, 5, 2])
+        with col_rank:
+            st.markdown(f"{rank}")
+        with col_main:
+            st.markdown(f"{addr}")
+            parts = [p for p in (
+                f"₹{price:,.0f}" if price else None,
+                f"{beds} BHK" if beds else None,
+                city,
+            ) if p]
+            if parts:
+                st.caption("  ·  ".join(parts))
+        with col_score:
+            st.metric("Similarity", f"{sim:.1%}")
+
+        st.progress(sim)
+
+        if imgurl:
+            with st.expander("View property image"):
+                try:
                     img_bytes = _load_image_cached(imgurl)
-                    if img_bytes:
-                        st.image(Image.open(io.BytesIO(img_bytes)), width=320)
-                    else:
-                        st.caption("Image unavailable")
-
-            nbr_open = st.session_state.get("vs_nbr", {}).get("rank") == rank
-
-            if not nbr_open:
-                if st.button("Analyse Area", key=f"vs_open_{rank}", use_container_width=True):
-                    locality = meta.get("locality", "").strip()
-                    city = meta.get("city", "").strip()
-                    if locality and city and locality.lower() != city.lower():
-                        geo_addr = f"{locality}, {city}, India"
-                    elif locality:
-                        geo_addr = f"{locality}, India"
-                    else:
-                        geo_addr = addr
-                    st.session_state["vs_nbr"] = {
-                        "addr": geo_addr,
-                        "display_addr": addr,
-                        "rank": rank,
-                    }
-                    st.rerun()
-            else:
-                if st.button("Close Area Analysis", key=f"vs_close_{rank}", use_container_width=True):
-                    st.session_state.pop("vs_nbr", None)
-                    st.session_state.pop(f"vs_nbr_result_{rank}", None)
-                    st.session_state.pop(f"vs_nbr_ran_{rank}", None)
-                    st.rerun()
-
-        if nbr_open:
-            _render_inline_neighbourhood(
-                st.session_state["vs_nbr"]["addr"],
-                rank,
-                display_addr=st.session_state["vs_nbr"].get("display_addr", ""),
-            )
+                except requests.exceptions.RequestException:
+                    img_bytes = None
+                if img_bytes:
+                    st.image(_thumbnail(img_bytes), width=320)
+                else:
+                    st.caption("Image unavailable")
+
+        nbr_open = st.session_state.get("vs_nbr", {}).get("rank") == rank
+
+        if not nbr_open:
+            if st.button("Analyse Area", key=f"vs_open_{rank}", use_container_width=True):
+                if locality and city and locality.lower() != city.lower():
+                    geo_addr = f"{locality}, {city}, India"
+                elif locality:
+                    geo_addr = f"{locality}, India"
+                else:
+                    geo_addr = addr
+                # Another card's open panel has to close too, which needs a
+                # full rerun; otherwise only this card is redrawn.
+                scope = "app" if st.session_state.get("vs_nbr") else "fragment"
+                st.session_state["vs_nbr"] = {
+                    "addr": geo_addr,
+                    "display_addr": addr,
+                    "rank": rank,
+                }
+                st.rerun(scope=scope)
+        else:
+            if st.button("Close Area Analysis", key=f"vs_close_{rank}", use_container_width=True):
+                st.session_state.pop("vs_nbr", None)
+                st.session_state.pop(f"vs_nbr_ran_{rank}", None)
+                st.rerun(scope="fragment")
+
+    if nbr_open:
+        _render_inline_neighbourhood(
+            st.session_state["vs_nbr"]["addr"],
+            rank,
+            display_addr=st.session_state["vs_nbr"].get("display_addr", ""),
+        )
 
 
 def _render_inline_neighbourhood(address: str, rank: int, display_addr: str = ""):
@@ -228,22 +300,27 @@ def _render_inline_neighbourhood(address: str, rank: int, display_addr: str = ""
             )
             amenity_types = [amenity_options[a] for a in selected]
 
-        cache_key = f"vs_nbr_result_{rank}"
+        amenity_types = amenity_types or ["restaurant", "cafe", "school", "hospital"]
         ran_key = f"vs_nbr_ran_{rank}"
 
         if st.button("Run Analysis", type="primary", key=f"vs_nbr_run_{rank}"):
             st.session_state[ran_key] = True
-            st.session_state.pop(cache_key, None)
 
         if not st.session_state.get(ran_key):
             return
 
-        if cache_key not in st.session_state:
+        # Results are keyed by the request, not the rank, so ranks in the
+        # same locality share one analysis; the backend also reuses recent
+        # completed runs across users.
+        results = st.session_state.setdefault("vs_nbr_results", {})
+        cache_key = (" ".join(address.lower().split()), radius, tuple(sorted(amenity_types)))
+
+        if cache_key not in results:
             with st.spinner("Analysing neighbourhood…"):
                 response = api.start_neighborhood_analysis({
                     "address": address,
                     "radius_m": radius,
-                    "amenity_types": amenity_types or ["restaurant", "cafe", "school", "hospital"],
+                    "amenity_types": amenity_types,
                     "include_buildings": False,
                     "generate_map": False,
                 })
@@ -259,9 +336,9 @@ def _render_inline_neighbourhood(address: str, rank: int, display_addr: str = ""
                 st.warning("Analysis is taking longer than expected. Check Neighbourhood tab in a few minutes.")
                 st.session_state.pop(ran_key, None)
                 return
-            st.session_state[cache_key] = result
+            results[cache_key] = result
 
-        result = st.session_state.get(cache_key)
+        result = results.get(cache_key)
         if result:
             _display_neighbourhood_result(result)
 
@@ -317,30 +394,16 @@ def _display_neighbourhood_result(result: dict):
 
 def _poll_task(task_id: str, max_wait: int = 420) -> Optional[dict]:
     bar = st.progress(0)
-    t0 = time.time()
+    data = api.wait_for_task(
+        task_id, max_wait=max_wait,
+        on_update=lambda d: bar.progress(min(int(d.get("progress", 0)), 100)),
+    )
+    bar.empty()
 
-    while time.time() - t0 < max_wait:
-        try:
-            r = requests.get(f"{BACKEND_URL}/api/tasks/{task_id}", timeout=5)
-            if r.status_code == 200:
-                data = r.json()
-                status = data.get("status", "")
-                progress = min(int(data.get("progress", 0)), 100)
-
-                bar.progress(progress)
-
-                if status == "completed":
-                    bar.empty()
-                    inner = data.get("result")
-                    return inner if (inner and isinstance(inner, dict)) else data
-
-                if status == "failed":
-                    bar.empty()
-                    st.error("Analysis failed. Please try again.")
-                    return None
-        except Exception:
-            pass
-        time.sleep(3)
+    if data and data.get("status") == "completed":
+        inner = data.get("result")
+        return inner if (inner and isinstance(inner, dict)) else data
 
-    bar.empty()
+    if data and data.get("status") == "failed":
+        st.error("Analysis failed. Please try again.")
     return None
\ No newline at end of file
@@ -1,8 +1,12 @@
 import streamlit as st
+import ast
+import functools
+import html
+import json
 import time
 from datetime import datetime
 from typing import Optional, Dict, Any
-from config import TASK_POLL_INTERVAL, TASK_MAX_WAIT, TASK_PROGRESS_BAR_ENABLED
+from config import TASK_MAX_WAIT, TASK_PROGRESS_BAR_ENABLED
 
 def format_currency(amount: float, decimals: int = 0) -> str:
     if amount is None:
@@ -27,6 +31,21 @@ def truncate_text(text: str, max_length: int = 100) -> str:
         return text
     return text[:max_length] + "..."
 
+def render_remote_image(url: str, width: Optional[int] = None, caption: Optional[str] = None):
+    # Remote images go straight to the browser, which caches them and loads
+    # offscreen ones lazily; st.image would download and re-encode them.
+    if not url.startswith(("http://", "https://")):
+        st.image(url, width=width, caption=caption, use_container_width=width is None)
+        return
+    size = f"width:{width}px" if width else "width:100%"
+    st.markdown(
+        f'<img src="{html.escape(url, quote=True)}" loading="lazy" decoding="async" '
+        f'style="{size};height:auto;border-radius:4px">',
+        unsafe_allow_html=True,
+    )
+    if caption:
+        st.caption(caption)
+
 def calculate_price_per_sqft(price: float, square_feet: int) -> float:
     if square_feet > 0:
         return price / square_feet
@@ -75,13 +94,17 @@ def _clean_message(raw: Any) -> str:
         )
     msg = str(raw).strip()
     if msg.startswith("{") and msg.endswith("}"):
+        # Most payloads are JSON; literal_eval is only needed for Python
+        # dict reprs (single quotes) and is far slower.
         try:
-            import ast
-            parsed = ast.literal_eval(msg)
-            if isinstance(parsed, dict):
-                return parsed.get("status") or parsed.get("message") or "Processing..."
-        except Exception:
-            pass
+            parsed = json.loads(msg)
+        except ValueError:
+            try:
+                parsed = ast.literal_eval(msg)
+            except Exception:
+                parsed = None
+        if isinstance(parsed, dict):
+            return parsed.get("status") or parsed.get("message") or "Processing..."
         return "Processing..."
     return msg or "Processing..."
 
@@ -89,49 +112,30 @@ def poll_task_status(task_id: str,
                      max_wait: int = TASK_MAX_WAIT,
                      show_progress: bool = TASK_PROGRESS_BAR_ENABLED) -> Optional[Dict]:
 
-    import requests
     from api_client import api
 
     progress_bar = st.progress(0) if show_progress else None
-    start_time = time.time()
 
-    while time.time() - start_time < max_wait:
-        try:
-            response = requests.get(
-                f"{api.base_url}/api/tasks/{task_id}",
-                timeout=5,
-            )
-
-            if response.status_code == 200:
-                data = response.json()
-                status = data.get("status", "unknown")
-                progress = data.get("progress", 0)
-
-                if progress_bar:
-                    progress_bar.progress(min(progress / 100, 1.0))
-
-                if status == "completed":
-                    if progress_bar:
-                        progress_bar.progress(1.0)
-                        time.sleep(0.3)
-                        progress_bar.empty()
-                    return data.get("result") or {}
-
-                if status == "failed":
-                    if progress_bar:
-                        progress_bar.empty()
-                    error = data.get("error", "Unknown error")
-                    st.error(f"Analysis failed: {error}")
-                    return None
-
-        except Exception:
-            pass
-
-        time.sleep(2)
+    def _update(data: Dict):
+        if progress_bar:
+            progress_bar.progress(min(data.get("progress", 0) / 100, 1.0))
+
+    data = api.wait_for_task(task_id, max_wait=max_wait, on_update=_update)
+
+    if data and data.get("status") == "completed":
+        if progress_bar:
+            progress_bar.progress(1.0)
+            time.sleep(0.3)
+            progress_bar.empty()
+        return data.get("result") or {}
 
     if progress_bar:
         progress_bar.empty()
 
+    if data and data.get("status") == "failed":
+        error = data.get("error", "Unknown error")
+        st.error(f"Analysis failed: {error}")
+
     return None
 
 def display_metric_card(label: str, value: str, delta: str = None, help_text: str = None):
@@ -181,6 +185,7 @@ def format_analysis_summary(analysis: Dict) -> str:
         lines.append(f"**Created:** {format_date(created)}")
     return "\n".join(lines)
 
+@functools.lru_cache(maxsize=64)
 def get_amenity_display_name(amenity_type: str) -> str:
     name = amenity_type.replace("_", " ").title()
     return f"{name}"
\ No newline at end of file
@@ -1,12 +1,38 @@
 import pandas as pd
-from pymongo import MongoClient
+from pymongo import IndexModel, MongoClient
+from pymongo.errors import BulkWriteError
 from datetime import datetime
 import os
 import argparse
-from typing import Optional
+import itertools
+from typing import Dict, List, Optional
 import certifi
 import time
 
+PRICE_UNIT_MULTIPLIERS = {
+    'CR': 10000000, 'CRORE': 10000000,
+    'L': 100000, 'LAC': 100000, 'LAKH': 100000,
+    'K': 1000, 'THOUSAND': 1000,
+}
+DEFAULT_PRICE = 5000000
+INSERT_BATCH_SIZE = 1000
+CSV_CHUNK_SIZE = 5000
+
+# Group keys used by show_stats.
+STATS_INDEXES = [
+    IndexModel([("locality", 1)]),
+    IndexModel([("bedrooms", 1)]),
+    IndexModel([("city", 1), ("price", 1)]),
+]
+
+# Prices stay float64: float32 would round lakh/crore amounts.
+CSV_DTYPES = {
+    'locality': 'category', 'type': 'category', 'region': 'category',
+    'status': 'category', 'age': 'category', 'price_unit': 'category',
+    'bhk': 'Int32', 'area': 'float32',
+    'price': 'float64', 'price_inr': 'float64', 'price_per_sqft': 'float32',
+}
+
 class MumbaiHousingLoader:
 
     def __init__(
@@ -14,45 +40,108 @@ class MumbaiHousingLoader:
         MONGODB_URL: str = "mongodb://localhost:27017",
         db_name: str = "geoinsight_ai"
     ):
+        # Bulk loads only need the primary's acknowledgement, not a journal
+        # flush per batch.
+        write_opts = {"w": 1, "journal": False}
         if "mongodb+srv" in MONGODB_URL:
             self.client = MongoClient(
                 MONGODB_URL, 
                 tlsCAFile=certifi.where(), 
-                serverSelectionTimeoutMS=5000
+                serverSelectionTimeoutMS=5000,
+                **write_opts
             )
         else:
-            self.client = MongoClient(MONGODB_URL, serverSelectionTimeoutMS=5000)
+            self.client = MongoClient(MONGODB_URL, serverSelectionTimeoutMS=5000, **write_opts)
             
         self.db = self.client[db_name]
         self.collection = self.db["properties"]
 
 
-    def clean_price_with_unit(self, price_value, price_unit) -> Optional[float]:
-        if pd.isna(price_value):
-            return None
-        try:
-            price = float(price_value)
-            if pd.isna(price_unit):
-                return price
-            unit = str(price_unit).strip().upper()
-            if unit == 'CR' or unit == 'CRORE':
-                return price * 10000000
-            elif unit == 'L' or unit == 'LAC' or unit == 'LAKH':
-                return price * 100000
-            elif unit == 'K' or unit == 'THOUSAND':
-                return price * 1000
-            else:
-                return price
-        except:
-            return None
-
-    def extract_bedrooms(self, bhk_value) -> int:
-        if pd.isna(bhk_value):
-            return 2
-        try:
-            return int(bhk_value)
-        except:
-            return 2
+    def clean_price_series(self, price: pd.Series, unit: pd.Series) -> pd.Series:
+        multiplier = (
+            unit.astype(str).str.strip().str.upper()
+            .map(PRICE_UNIT_MULTIPLIERS).astype(float).fillna(1.0)
+        )
+        return pd.to_numeric(price, errors='coerce') * multiplier
+
+    def build_documents(self, df: pd.DataFrame) -> List[Dict]:
+        # Every field is derived column-wise; missing values take the
+        # loader defaults rather than being stringified as "nan".
+        def col(name, default):
+            return df[name] if name in df.columns else pd.Series(default, index=df.index)
+
+        def text_col(name):
+            # Stripped once up front; blanks and NaN both become <NA>.
+            if name not in df.columns:
+                return pd.Series(pd.NA, index=df.index, dtype="string")
+            values = df[name].astype("string").str.strip()
+            return values.mask(values.eq(""))
+
+        locality = text_col('locality')
+        region = text_col('region') if 'region' in df.columns else locality
+
+        price_inr = pd.to_numeric(col('price_inr', 0), errors='coerce')
+        price = price_inr.where(
+            price_inr > 0, self.clean_price_series(col('price', 0), col('price_unit', 'L'))
+        )
+        price = price.where((price > 0) & (price < 1e15), float(DEFAULT_PRICE))
+
+        bhk = pd.to_numeric(col('bhk', 2), errors='coerce')
+        bedrooms = bhk.where(bhk.abs() < 1e6, 2).astype(int)
+
+        area = pd.to_numeric(col('area', 0), errors='coerce')
+        square_feet = area.where((area > 0) & (area < 1e12), price / 15000).astype(int)
+
+        price_per_sqft_orig = pd.to_numeric(col('price_per_sqft', 0), errors='coerce').fillna(0)
+        price_per_sqft = (price / square_feet.where(square_feet > 0)).fillna(price_per_sqft_orig)
+
+        has_locality = locality.notna()
+        has_region = region.notna() & region.ne(locality).fillna(True)
+        locality_str = locality.fillna('')
+        region_str = region.fillna('')
+        joined = locality_str.where(~has_region, locality_str + ', ' + region_str)
+        joined = joined.where(has_locality, region_str)
+        address = (joined + ', Mumbai').where(has_locality | has_region, 'Mumbai')
+
+        locality = locality.fillna('Mumbai')
+
+        docs = pd.DataFrame({
+            "address": address,
+            "city": 'Mumbai',
+            "state": 'Maharashtra',
+            "zip_code": "400001",
+            "price": price.astype(float),
+            "bedrooms": bedrooms,
+            "bathrooms": (bedrooms * 0.75).clip(lower=1.0),
+            "square_feet": square_feet,
+            "property_type": text_col('type').fillna('Apartment'),
+            "locality": locality,
+            "region": region.fillna(locality),
+            "status": text_col('status').fillna('Ready to move'),
+            "age": text_col('age').fillna('New'),
+            "price_per_sqft": price_per_sqft.astype(float),
+        }).to_dict('records')
+
+        now = datetime.now()
+        for doc in docs:
+            doc["created_at"] = doc["updated_at"] = now
+        return docs
+
+    def drop_secondary_indexes(self) -> List[IndexModel]:
+        # Returns the dropped indexes so they can be rebuilt in one pass
+        # once the bulk load has finished.
+        models = []
+        for spec in self.collection.list_indexes():
+            if spec["name"] == "_id_":
+                continue
+            options = {k: v for k, v in spec.items() if k not in ("v", "key", "ns")}
+            models.append(IndexModel(list(spec["key"].items()), **options))
+        self.collection.drop_indexes()
+        return models
+
+    def build_indexes(self, models: List[IndexModel]):
+        by_name = {m.document["name"]: m for m in models + STATS_INDEXES}
+        self.collection.create_indexes(list(by_name.values()))
 
     def load_mumbai_housing(
         self,
@@ -69,105 +158,77 @@ class MumbaiHousingLoader:
         if verbose:
             print(f"Reading {csv_path}")
 
+        # Parsed, transformed and inserted CSV_CHUNK_SIZE rows at a time, so
+        # peak memory does not grow with the file.
         try:
-            df = pd.read_csv(csv_path)
+            chunks = pd.read_csv(
+                csv_path,
+                engine="c",
+                usecols=lambda c: c in CSV_DTYPES,
+                dtype=CSV_DTYPES,
+                na_values=["", "NA", "N/A"],
+                chunksize=CSV_CHUNK_SIZE,
+                nrows=max_rows,
+            )
+            # Read the first chunk before touching the collection so a
+            # malformed file leaves the existing data in place.
+            first = next(chunks, None)
         except Exception as e:
             print(f"Error reading CSV: {e}")
             return False
 
-        if verbose:
-            print(f"Found {len(df)} rows")
-            print(f"Columns: {', '.join(df.columns.tolist())}")
+        if first is None:
+            print("CSV has no rows")
+            return False
 
-        if max_rows:
-            df = df.head(max_rows)
-            if verbose:
+        if verbose:
+            print(f"Columns: {', '.join(first.columns.tolist())}")
+            if max_rows:
                 print(f"Limited to {max_rows} rows")
 
+        saved_indexes = []
         if clear_existing:
             deleted = self.collection.delete_many({})
             if verbose:
                 print(f"Deleted {deleted.deleted_count} existing properties")
+            # Inserting into an empty, unindexed collection and indexing
+            # afterwards is cheaper than maintaining every index per insert.
+            saved_indexes = self.drop_secondary_indexes()
 
+        if verbose:
+            print("Processing Mumbai housing data")
+
+        rows = 0
         properties_added = 0
         errors = 0
+        ok = True
 
-        if verbose:
-            print("Processing Mumbai housing data")
+        try:
+            for df in itertools.chain([first], chunks):
+                rows += len(df)
+                docs = self.build_documents(df)
+
+                for i in range(0, len(docs), INSERT_BATCH_SIZE):
+                    batch = docs[i:i + INSERT_BATCH_SIZE]
+                    try:
+                        result = self.collection.insert_many(
+                            batch, ordered=False, bypass_document_validation=True
+                        )
+                        properties_added += len(result.inserted_ids)
+                    except BulkWriteError as e:
+                        # Unordered: the rest of the batch is still written.
+                        properties_added += e.details.get("nInserted", 0)
+                        errors += len(e.details.get("writeErrors", []))
+
+                if verbose:
+                    print(f"Loaded {properties_added} properties ({rows} rows read)")
+        except Exception as e:
+            print(f"Error reading CSV: {e}")
+            ok = False
 
-        for idx, row in df.iterrows():
-            try:
-                locality = row.get('locality', 'Mumbai')
-                property_type = row.get('type', 'Apartment')
-                bhk = row.get('bhk', 2)
-                area_sqft = row.get('area', 0)
-                price_value = row.get('price', 0)
-                price_unit = row.get('price_unit', 'L')
-                price_inr = row.get('price_inr', 0)
-                region = row.get('region', locality)
-                status = row.get('status', 'Ready to move')
-                age = row.get('age', 'New')
-                price_per_sqft_orig = row.get('price_per_sqft', 0)
-
-                city = 'Mumbai'
-                state = 'Maharashtra'
-
-                if pd.notna(price_inr) and price_inr > 0:
-                    price = float(price_inr)
-                else:
-                    price = self.clean_price_with_unit(price_value, price_unit)
-
-                if price is None or price <= 0:
-                    price = 5000000
-
-                bedrooms = self.extract_bedrooms(bhk)
-                bathrooms = max(1.0, bedrooms * 0.75)
-
-                try:
-                    square_feet = int(float(area_sqft)) if pd.notna(area_sqft) and area_sqft > 0 else int(price / 15000)
-                except:
-                    square_feet = int(price / 15000)
-
-                if square_feet > 0:
-                    price_per_sqft = price / square_feet
-                else:
-                    price_per_sqft = price_per_sqft_orig if pd.notna(price_per_sqft_orig) else 0
-
-                address_parts = []
-                if pd.notna(locality) and str(locality).strip():
-                    address_parts.append(str(locality))
-                if pd.notna(region) and str(region).strip() and region != locality:
-                    address_parts.append(str(region))
-                address = ', '.join(address_parts) + ', Mumbai' if address_parts else 'Mumbai'
-
-                property_doc = {
-                    "address": address,
-                    "city": city,
-                    "state": state,
-                    "zip_code": "400001",
-                    "price": float(price),
-                    "bedrooms": int(bedrooms),
-                    "bathrooms": float(bathrooms),
-                    "square_feet": int(square_feet),
-                    "property_type": str(property_type),
-                    "locality": str(locality),
-                    "region": str(region) if pd.notna(region) else str(locality),
-                    "status": str(status) if pd.notna(status) else "Ready to move",
-                    "age": str(age) if pd.notna(age) else "New",
-                    "price_per_sqft": float(price_per_sqft),
-                    "created_at": datetime.now(),
-                    "updated_at": datetime.now()
-                }
-
-                self.collection.insert_one(property_doc)
-                properties_added += 1
-
-                if verbose and properties_added % 100 == 0:
-                    print(f"Loaded {properties_added} properties")
-
-            except:
-                errors += 1
-                continue
+        if verbose:
+            print("Building indexes")
+        self.build_indexes(saved_indexes)
 
         if verbose:
             print(f"Successfully loaded {properties_added} properties")
@@ -175,7 +236,7 @@ class MumbaiHousingLoader:
             print(f"Total in database: {self.collection.count_documents({})}")
             self.show_stats()
 
-        return True
+        return ok
 
     def show_stats(self):
         total = self.collection.count_documents({})